@@ -0,0 +1,183 @@
+"""
+    Load test of the bot's webhook mode.
+    Serves a fake Bot API that answers every call after --api-latency milliseconds, replays the recorded
+    updates of --updates against the webhook with new user ids, and reports how fast the webhook accepted
+    them and how long it took until every update got its reply through the fake Bot API.
+
+    The replay starts once the webhook answers, so start this script first and then the bot against
+    the fake Bot API, for example:
+    python benchmarks/bot_webhook_load.py --count 5000 --concurrency 40
+    TELEGRAM_BOT_API_URL=http://127.0.0.1:8081/bot TELEGRAM_WEBHOOK_URL=http://127.0.0.1:8443 \\
+        python telegram_bot_run.py --mode webhook
+"""
+import argparse
+import asyncio
+import copy
+import json
+import os
+import statistics
+import time
+from urllib.parse import parse_qsl
+
+import httpx
+import uvicorn
+
+UPDATES_FILE = os.path.join(os.path.dirname(__file__), "data", "bot_updates.jsonl")
+BOT_USER = {"id": 1, "is_bot": True, "first_name": "Dice Maniacs", "username": "dice_maniacs_bot",
+            "can_join_groups": False, "can_read_all_group_messages": False, "supports_inline_queries": False}
+
+
+class FakeBotAPI:
+    """
+        ASGI app answering Bot API calls, it records the time every chat got its first message
+    """
+
+    def __init__(self, latency):
+        self.latency = latency
+        self.replied = {}
+        self.message_id = 0
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return
+        body = b""
+        while True:
+            message = await receive()
+            body += message.get("body", b"")
+            if not message.get("more_body"):
+                break
+        method = scope["path"].rsplit("/", 1)[-1]
+        params = self.parse(scope, body)
+        await asyncio.sleep(self.latency)
+        result = True
+        if method == "getMe":
+            result = BOT_USER
+        elif method in ("sendMessage", "editMessageText"):
+            chat_id = int(params.get("chat_id", 0))
+            self.replied.setdefault(chat_id, time.perf_counter())
+            self.message_id += 1
+            result = {"message_id": self.message_id, "date": int(time.time()), "text": params.get("text", ""),
+                      "chat": {"id": chat_id, "type": "private"}, "from": BOT_USER}
+        payload = json.dumps({"ok": True, "result": result}).encode()
+        await send({"type": "http.response.start", "status": 200,
+                    "headers": [(b"content-type", b"application/json")]})
+        await send({"type": "http.response.body", "body": payload})
+
+    @staticmethod
+    def parse(scope, body):
+        content_type = dict(scope["headers"]).get(b"content-type", b"")
+        if content_type.startswith(b"application/json"):
+            return json.loads(body or b"{}")
+        if content_type.startswith(b"application/x-www-form-urlencoded"):
+            return dict(parse_qsl(body.decode()))
+        if content_type.startswith(b"multipart/form-data"):
+            boundary = content_type.split(b"boundary=")[-1]
+            params = {}
+            for part in body.split(b"--" + boundary):
+                head, _, value = part.partition(b"\r\n\r\n")
+                if b'name="' in head:
+                    name = head.split(b'name="')[1].split(b'"')[0].decode()
+                    params[name] = value.rstrip(b"\r\n").decode()
+            return params
+        return {}
+
+
+def replayed_updates(path, count, first_user_id):
+    """
+        count updates cycling over the recorded ones, every update gets its own update and user id
+    """
+    with open(path) as file:
+        recorded = [json.loads(line) for line in file if line.strip()]
+    for index in range(count):
+        update = copy.deepcopy(recorded[index % len(recorded)])
+        update["update_id"] = index + 1
+        user_id = first_user_id + index
+        message = update["message"]
+        message["from"]["id"] = user_id
+        message["chat"]["id"] = user_id
+        yield user_id, update
+
+
+async def wait_for_webhook(url, timeout):
+    deadline = time.perf_counter() + timeout
+    async with httpx.AsyncClient(timeout=5) as client:
+        while time.perf_counter() < deadline:
+            try:
+                await client.get(url)
+                return True
+            except httpx.HTTPError:
+                await asyncio.sleep(0.5)
+    return False
+
+
+async def replay(options, api):
+    headers = {"X-Telegram-Bot-Api-Secret-Token": options.secret} if options.secret else {}
+    updates = iter(replayed_updates(options.updates, options.count, options.first_user_id))
+    sent, latencies, statuses = {}, [], {}
+
+    async def worker(client):
+        for user_id, update in updates:
+            started = time.perf_counter()
+            try:
+                response = await client.post(options.webhook_url, json=update, headers=headers)
+                status = response.status_code
+            except httpx.HTTPError:
+                status = "error"
+            latencies.append(time.perf_counter() - started)
+            statuses[status] = statuses.get(status, 0) + 1
+            if status == 200:
+                sent[user_id] = started
+
+    started = time.perf_counter()
+    async with httpx.AsyncClient(timeout=30) as client:
+        await asyncio.gather(*[worker(client) for _ in range(options.concurrency)])
+    posted = time.perf_counter() - started
+    deadline = time.perf_counter() + options.drain_timeout
+    while time.perf_counter() < deadline and not sent.keys() <= api.replied.keys():
+        await asyncio.sleep(0.1)
+    replies = [api.replied[user_id] - sent[user_id] for user_id in sent if user_id in api.replied]
+    print(f"posted {options.count} updates in {posted:.2f}s, {options.count / posted:.1f} updates/s, "
+          f"statuses {statuses}")
+    print(f"webhook response ms p50 {statistics.median(latencies) * 1000:.1f} "
+          f"p95 {sorted(latencies)[int(len(latencies) * 0.95)] * 1000:.1f}")
+    if replies:
+        replies.sort()
+        print(f"replies {len(replies)}/{len(sent)}, update to reply ms p50 {statistics.median(replies) * 1000:.1f} "
+              f"p95 {replies[int(len(replies) * 0.95)] * 1000:.1f} max {replies[-1] * 1000:.1f}")
+    else:
+        print(f"replies 0/{len(sent)}")
+
+
+async def run(options):
+    api = FakeBotAPI(options.api_latency / 1000)
+    server = uvicorn.Server(uvicorn.Config(api, host="127.0.0.1", port=options.api_port, log_level="warning"))
+    serving = asyncio.create_task(server.serve())
+    try:
+        print(f"Fake Bot API at http://127.0.0.1:{options.api_port}/bot, waiting for {options.webhook_url}")
+        if not await wait_for_webhook(options.webhook_url, options.startup_timeout):
+            print("The webhook did not start.")
+            return
+        await replay(options, api)
+    finally:
+        server.should_exit = True
+        await serving
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--webhook-url", default="http://127.0.0.1:8443/telegram/webhook")
+    parser.add_argument("--secret", default=os.environ.get("TELEGRAM_WEBHOOK_SECRET", ""))
+    parser.add_argument("--updates", default=UPDATES_FILE, help="JSON lines file of recorded updates")
+    parser.add_argument("--count", type=int, default=1000)
+    parser.add_argument("--concurrency", type=int, default=40, help="Parallel webhook requests, like "
+                                                                    "TELEGRAM_WEBHOOK_MAX_CONNECTIONS")
+    parser.add_argument("--first-user-id", type=int, default=900_000_000)
+    parser.add_argument("--api-port", type=int, default=8081)
+    parser.add_argument("--api-latency", type=float, default=50, help="Milliseconds of every Bot API call")
+    parser.add_argument("--drain-timeout", type=float, default=120)
+    parser.add_argument("--startup-timeout", type=float, default=300, help="Seconds to wait for the webhook")
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,72 @@
+"""
+    Load generator for the read endpoints of the web server.
+    Keeps --concurrency requests in flight for --duration seconds, cycling over the endpoints,
+    and prints the throughput and latency percentiles of each endpoint.
+
+    python benchmarks/read_endpoints.py --base-url http://127.0.0.1:8000 --token <player token>
+"""
+import argparse
+import asyncio
+import itertools
+import statistics
+import time
+
+import httpx
+
+PUBLIC_ENDPOINTS = ["/api/count-down/", "/api/winners/", "/api/leaderboard/"]
+PLAYER_ENDPOINTS = ["/api/player/", "/api/missions/"]
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+async def worker(client, endpoints, deadline, latencies, errors):
+    while time.perf_counter() < deadline:
+        path = next(endpoints)
+        started = time.perf_counter()
+        try:
+            response = await client.get(path)
+            if response.status_code >= 400:
+                errors[path] = errors.get(path, 0) + 1
+        except httpx.HTTPError:
+            errors[path] = errors.get(path, 0) + 1
+            continue
+        latencies.setdefault(path, []).append(time.perf_counter() - started)
+
+
+async def run(base_url, token, concurrency, duration):
+    paths = PUBLIC_ENDPOINTS + (PLAYER_ENDPOINTS if token else [])
+    headers = {"Authorization": f"token {token}"} if token else {}
+    endpoints = itertools.cycle(paths)
+    latencies, errors = {}, {}
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base_url, headers=headers, limits=limits, timeout=30) as client:
+        deadline = time.perf_counter() + duration
+        await asyncio.gather(*[worker(client, endpoints, deadline, latencies, errors) for _ in range(concurrency)])
+    total = sum(len(values) for values in latencies.values())
+    print(f"{total / duration:.1f} requests/s over {duration}s with {concurrency} concurrent requests")
+    print(f"{'endpoint':<24}{'requests':>10}{'errors':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    rows = [(path, latencies.get(path, []), errors.get(path, 0)) for path in paths]
+    rows.append(("all", [value for values in latencies.values() for value in values], sum(errors.values())))
+    for path, values, path_errors in rows:
+        if not values:
+            print(f"{path:<24}{0:>10}{path_errors:>8}")
+            continue
+        print(f"{path:<24}{len(values):>10}{path_errors:>8}{statistics.median(values) * 1000:>10.1f}"
+              f"{percentile(values, 0.95) * 1000:>10.1f}{percentile(values, 0.99) * 1000:>10.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--base-url", default="http://127.0.0.1:8000")
+    parser.add_argument("--token", help="Player token, the player endpoints are skipped without it")
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--duration", type=float, default=30)
+    options = parser.parse_args()
+    asyncio.run(run(options.base_url, options.token, options.concurrency, options.duration))
+
+
+if __name__ == '__main__':
+    main()
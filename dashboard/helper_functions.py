@@ -1,10 +1,11 @@
 import pandas as pd
 import numpy as np
-from models import Player, Prediction, Report, UserReferral, Asset
+from models import Player, PlayerStats, Prediction, Report, UserReferral, Asset, LeaderboardWindowPoint, LeaderboardSnapshot, Wallet
 from sqlalchemy import distinct, case, desc, func, and_
 import streamlit as st
 import sympy as sp
 import random
+import base64
 import plotly.graph_objects as go
 from plotly.subplots import make_subplots
 from datetime import datetime, timedelta
@@ -16,6 +17,36 @@ def fetch_data(query, session):
     return pd.read_sql(query.statement, session.bind)
 
 
+def normalize_wallet_address(address):
+    """
+    Raw form (workchain:hex) of a TON address, the key of the wallet table.
+    Friendly base64 addresses are decoded, anything else is returned stripped.
+    """
+    address = address.strip()
+    if ':' in address:
+        workchain, _, account = address.partition(':')
+        return f"{workchain}:{account.lower()}"
+    try:
+        data = base64.urlsafe_b64decode(address.replace('+', '-').replace('/', '_') + '=' * (-len(address) % 4))
+    except ValueError:
+        return address
+    if len(data) != 36:
+        return address
+    return f"{int.from_bytes(data[1:2], 'big', signed=True)}:{data[2:34].hex()}"
+
+
+def fetch_wallet_players(session, wallet_addresses):
+    """
+    Players linked to any of the given wallet addresses, read through the wallet table.
+    """
+    addresses = {normalize_wallet_address(address) for address in wallet_addresses}
+    player_ids = [player_id for wallet in session.query(Wallet).filter(Wallet.address.in_(addresses)).all()
+                  for player_id in wallet.player_ids]
+    if not player_ids:
+        return []
+    return session.query(Player).filter(Player.telegram_id.in_(player_ids)).all()
+
+
 def update_report_table(df_analyzed_data, session_dashboard):
     for index, row in df_analyzed_data.iterrows():
         if row['insert_d'] == 'Total':
@@ -151,27 +182,14 @@ def fetch_analyzed_data_grouped_by_date(session, session_dashboard, DEBUG):
     
     
     
-    wallet_first_occurrence_subquery = session.query(
-        Player.telegram_id,
-        Player.wallet_address,
-        func.date(Player.wallet_insert_dt).label('insert_d'),
-        case(
-            (func.row_number().over(
-                partition_by=Player.wallet_address,
-                order_by=desc(Player.wallet_insert_dt),
-            ) == 1, 1),
-            else_=0
-        ).label('is_first_occurrence')
-    ).filter(Player.wallet_address.isnot(None)).subquery()
-    
-    # Main query to group by date and count new wallets
+    # New wallets per day, from the first time each wallet was seen
     new_wallets_per_day_query = session.query(
-        wallet_first_occurrence_subquery.c.insert_d,
-        func.sum(wallet_first_occurrence_subquery.c.is_first_occurrence).label('new_wallets_count')
+        func.date(Wallet.first_seen_dt).label('insert_d'),
+        func.count(Wallet.address).label('new_wallets_count')
     ).group_by(
-        wallet_first_occurrence_subquery.c.insert_d
+        func.date(Wallet.first_seen_dt)
     ).order_by(
-        wallet_first_occurrence_subquery.c.insert_d
+        func.date(Wallet.first_seen_dt)
     )
 
     new_wallets_per_day = new_wallets_per_day_query.all()
@@ -407,7 +425,7 @@ def extract_wallet_information(session):
 
     if wallet_address:
         # Fetch players with the specified wallet address
-        players_with_wallet = session.query(Player).filter(Player.wallet_address == wallet_address).all()
+        players_with_wallet = fetch_wallet_players(session, [wallet_address])
 
         if not players_with_wallet:
             st.write("😢 No players found with this wallet address.")
@@ -888,32 +906,22 @@ def plot_histograms(df_analyzed_data, df_hours, session):
         format="YYYY-MM-DD",
         key='hist_slider'
     )
-    # Fetch dice pairs within the selected date range
+    # Count predictions per canonical dice pair within the selected date range
     dice_pairs_query = session.query(
-        Prediction.dice_number1,
-        Prediction.dice_number2
+        Prediction.pair_code,
+        func.count(Prediction.id).label('count')
     ).filter(
         Prediction.insert_dt >= start_date,
         Prediction.insert_dt <= end_date
-    )
+    ).group_by(Prediction.pair_code)
 
-    dice_pairs_df = fetch_data(dice_pairs_query, session)
+    dice_counts = fetch_data(dice_pairs_query, session)
 
-    if not dice_pairs_df.empty:
-        dice_pairs_df['dice_pair'] = dice_pairs_df.apply(
-            lambda row: f"{min(row['dice_number1'], row['dice_number2'])}-{max(row['dice_number1'], row['dice_number2'])}",
-            axis=1
-        )
-        ordered_dice_pairs = []
-        for i in range(1, 7):
-            for j in range(i, 7):
-                ordered_dice_pairs.append(f"{str(i)}-{str(j)}")
-        all_dice_pairs_df = pd.DataFrame({"dice_pair": ordered_dice_pairs})
-        dice_counts = dice_pairs_df['dice_pair'].value_counts().reset_index()
-        dice_counts.columns = ['dice_pair', 'count']
-        merged_df = all_dice_pairs_df.merge(dice_counts, on='dice_pair', how='left').fillna(0)
-        merged_df['dice_pair'] = pd.Categorical(merged_df['dice_pair'], categories=ordered_dice_pairs, ordered=True)
-        merged_df = merged_df.sort_values('dice_pair')
+    if not dice_counts.empty:
+        # pair_code is the index of the pair in this order, (1, 1) is 0 and (6, 6) is 20
+        ordered_dice_pairs = [f"{i}-{j}" for i in range(1, 7) for j in range(i, 7)]
+        merged_df = pd.DataFrame({"pair_code": range(len(ordered_dice_pairs)), "dice_pair": ordered_dice_pairs})
+        merged_df = merged_df.merge(dice_counts, on='pair_code', how='left').fillna(0)
 
         # Plot histogram 
         fig = make_subplots(
@@ -1056,67 +1064,33 @@ def plot_frequent_graphs(df_analyzed_data):
     
 def fetch_top_players(session, search_term=None, search_type=None):
     """
-    Calculate points for each player based on:
-    - Base points: 5
-    - Mini app usage (auth_token not null): +10 points
-    - Wallet connected: +500 points
-    - Each win: +50 points
-    - Each prediction: +1 point
-    - Each referral: +5 points
-    
+    Top players by the points kept in the player_stats table.
+
     Args:
         session: SQLAlchemy session
         search_term: Optional search term for username or wallet address
         search_type: Type of search ('username' or 'wallet')
     """
-    
-    # Subquery for counting wins
-    wins_subquery = session.query(
-        Prediction.player_id,
-        func.count(Prediction.id).label('wins_count')
-    ).filter(Prediction.is_win == True).group_by(Prediction.player_id).subquery()
-    
-    # Subquery for counting predictions
-    predictions_subquery = session.query(
-        Prediction.player_id,
-        func.count(Prediction.id).label('predictions_count')
-    ).group_by(Prediction.player_id).subquery()
-    
-    # Subquery for counting referrals
-    referrals_subquery = session.query(
-        UserReferral.referrer_id,
-        func.count(UserReferral.id).label('referrals_count')
-    ).group_by(UserReferral.referrer_id).subquery()
-    
-    # Main query
     query = session.query(
         Player.telegram_id,
         Player.telegram_username,
         Player.first_name,
         Player.wallet_address,
-        func.coalesce(wins_subquery.c.wins_count, 0).label('wins'),
-        func.coalesce(predictions_subquery.c.predictions_count, 0).label('predictions'),
-        func.coalesce(referrals_subquery.c.referrals_count, 0).label('referrals'),
-        (
-            5 +  # Base points
-            case(
-                (Player.wallet_address.isnot(None), 500),
-                else_=0
-            ) +  # Wallet points
-            (50 * func.coalesce(wins_subquery.c.wins_count, 0)) +  # Win points
-            func.coalesce(predictions_subquery.c.predictions_count, 0) +  # Prediction points
-            (5 * func.coalesce(referrals_subquery.c.referrals_count, 0))  # Referral points
-        ).label('points')
-    ).outerjoin(wins_subquery, Player.telegram_id == wins_subquery.c.player_id) \
-     .outerjoin(predictions_subquery, Player.telegram_id == predictions_subquery.c.player_id) \
-     .outerjoin(referrals_subquery, Player.telegram_id == referrals_subquery.c.referrer_id)
-    
+        PlayerStats.win_count.label('wins'),
+        PlayerStats.prediction_count.label('predictions'),
+        PlayerStats.referral_count.label('referrals'),
+        PlayerStats.point.label('points')
+    ).join(PlayerStats, Player.telegram_id == PlayerStats.player_id)
+
     # Apply search filters if provided
     if search_term and search_type:
         if search_type == 'username':
             query = query.filter(Player.telegram_username.ilike(f'%{search_term}%'))
         elif search_type == 'wallet':
-            query = query.filter(Player.wallet_address.ilike(f'%{search_term}%'))
+            # Looked up in the wallet table by its normalized address, so any form of a whole address matches
+            linked_players = session.query(func.unnest(Wallet.player_ids)).filter(
+                Wallet.address == normalize_wallet_address(search_term))
+            query = query.filter(Player.telegram_id.in_(linked_players))
     
     # Order by points and limit results
     query = query.order_by(desc('points')).limit(100)
@@ -1124,49 +1098,44 @@ def fetch_top_players(session, search_term=None, search_type=None):
     df = fetch_data(query, session)
     return df
 
+def fetch_window_top_players(session, bucket, limit=100):
+    """
+    Top players of a leaderboard window such as 'day:2025-01-21', 'week:2025-W04' or 'countdown:12',
+    read from its snapshot once the window is frozen.
+    """
+    snapshot = session.query(LeaderboardSnapshot).filter(LeaderboardSnapshot.bucket == bucket).first()
+    if snapshot is not None:
+        entries = pd.DataFrame(snapshot.entries[:limit], columns=['telegram_id', 'points'])
+    else:
+        query = session.query(
+            LeaderboardWindowPoint.player_id.label('telegram_id'),
+            LeaderboardWindowPoint.point.label('points')
+        ).filter(LeaderboardWindowPoint.bucket == bucket).order_by(desc(LeaderboardWindowPoint.point)).limit(limit)
+        entries = fetch_data(query, session)
+    if entries.empty:
+        return entries
+    players = fetch_data(session.query(Player.telegram_id, Player.telegram_username, Player.first_name)
+                         .filter(Player.telegram_id.in_(entries['telegram_id'].tolist())), session)
+    return entries.merge(players, on='telegram_id', how='left')[
+        ['telegram_id', 'telegram_username', 'first_name', 'points']]
+
 def fetch_wallet_based_points(session):
     """
     Calculate points for each unique wallet based on the maximum points of connected players.
     Returns a DataFrame with wallet address, telegram_id of max points player, and assigned points.
     """
-    # Subquery for counting wins
-    wins_subquery = session.query(
-        Prediction.player_id,
-        func.count(Prediction.id).label('wins_count')
-    ).filter(Prediction.is_win == True).group_by(Prediction.player_id).subquery()
-    
-    # Subquery for counting predictions
-    predictions_subquery = session.query(
-        Prediction.player_id,
-        func.count(Prediction.id).label('predictions_count')
-    ).group_by(Prediction.player_id).subquery()
-    
-    # Subquery for counting referrals
-    referrals_subquery = session.query(
-        UserReferral.referrer_id,
-        func.count(UserReferral.id).label('referrals_count')
-    ).group_by(UserReferral.referrer_id).subquery()
-    
-    # Calculate points for each player
+    wallet_players_subquery = session.query(
+        Wallet.address.label('wallet_address'),
+        func.unnest(Wallet.player_ids).label('telegram_id')
+    ).subquery()
+
     player_points_subquery = session.query(
-        Player.telegram_id,
-        Player.wallet_address,
-        (
-            5 +  # Base points
-            case(
-                (Player.wallet_address.isnot(None), 500),
-                else_=0
-            ) +  # Wallet points
-            (50 * func.coalesce(wins_subquery.c.wins_count, 0)) +  # Win points
-            func.coalesce(predictions_subquery.c.predictions_count, 0) +  # Prediction points
-            (5 * func.coalesce(referrals_subquery.c.referrals_count, 0))  # Referral points
-        ).label('points')
-    ).outerjoin(wins_subquery, Player.telegram_id == wins_subquery.c.player_id) \
-     .outerjoin(predictions_subquery, Player.telegram_id == predictions_subquery.c.player_id) \
-     .outerjoin(referrals_subquery, Player.telegram_id == referrals_subquery.c.referrer_id) \
-     .filter(Player.wallet_address.isnot(None)) \
+        wallet_players_subquery.c.telegram_id,
+        wallet_players_subquery.c.wallet_address,
+        PlayerStats.point.label('points')
+    ).join(PlayerStats, wallet_players_subquery.c.telegram_id == PlayerStats.player_id) \
      .subquery()
-    
+
     # Get maximum points per wallet
     max_points_subquery = session.query(
         player_points_subquery.c.wallet_address,
@@ -1,4 +1,5 @@
-from sqlalchemy import create_engine, Column, Integer, BigInteger, String, DateTime, ForeignKey, func, distinct, case, desc, Float
+from sqlalchemy import create_engine, Column, Integer, BigInteger, String, DateTime, ForeignKey, Boolean, JSON, func, distinct, case, desc, Float
+from sqlalchemy.dialects.postgresql import ARRAY
 from sqlalchemy.orm import sessionmaker, relationship, declarative_base
 
 
@@ -25,6 +26,7 @@ class Prediction(Base):
     dice_number1 = Column(Integer)
     dice_number2 = Column(Integer)
     slot = Column(Integer)
+    pair_code = Column(Integer)
     is_win = Column(Integer)
     is_active = Column(Integer)
     player_ref = relationship("Player", backref="predictions")
@@ -38,6 +40,37 @@ class UserReferral(Base):
     referrer_ref = relationship("Player", backref="referrals", foreign_keys=[referrer_id])
     referee_ref = relationship("Player", backref="referred_by", foreign_keys=[referee_id])
 
+class PlayerStats(Base):
+    __tablename__ = 'player_stats'
+    player_id = Column(BigInteger, ForeignKey('player.telegram_id'), primary_key=True)
+    prediction_count = Column(Integer)
+    win_count = Column(Integer)
+    referral_count = Column(Integer)
+    wallet = Column(Boolean)
+    mini_app = Column(Boolean)
+    point = Column(Integer)
+
+class LeaderboardWindowPoint(Base):
+    __tablename__ = 'leaderboard_window_point'
+    id = Column(Integer, primary_key=True)
+    bucket = Column(String)
+    player_id = Column(BigInteger, ForeignKey('player.telegram_id'))
+    point = Column(Integer)
+
+class LeaderboardSnapshot(Base):
+    __tablename__ = 'leaderboard_snapshot'
+    id = Column(Integer, primary_key=True)
+    bucket = Column(String, unique=True)
+    player_count = Column(Integer)
+    entries = Column(JSON)
+
+class Wallet(Base):
+    __tablename__ = 'wallet'
+    address = Column(String, primary_key=True)
+    first_seen_dt = Column(DateTime)
+    player_count = Column(Integer)
+    player_ids = Column(ARRAY(BigInteger))
+
 class Asset(Base):
     __tablename__ = 'assets'
     id = Column(Integer, primary_key=True)
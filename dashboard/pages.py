@@ -6,14 +6,13 @@ sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 import streamlit as st
 import streamlit.components.v1 as components
-from helper_functions import fetch_analyzed_data_grouped_by_date, fetch_winners_grouped_by_date, fetch_data_for_date, plot_graphs, plot_histograms, extract_wallet_information, extract_player_information, success_story, assets_section, player_giveaway, referrer_giveaway, plot_frequent_graphs, fetch_hours_histogram, fetch_top_players, fetch_wallet_based_points
+from helper_functions import fetch_analyzed_data_grouped_by_date, fetch_winners_grouped_by_date, fetch_data_for_date, plot_graphs, plot_histograms, extract_wallet_information, extract_player_information, success_story, assets_section, player_giveaway, referrer_giveaway, plot_frequent_graphs, fetch_hours_histogram, fetch_top_players, fetch_wallet_based_points, fetch_window_top_players, normalize_wallet_address, fetch_wallet_players
 from tgstat_helper_functions import plot_tgstat_channel_info, plot_tgstat_channel_stats, plot_tgstat_subscribers_growth, get_channel_posts_with_dates, compare_stats_between_posts
 from datetime import datetime, timedelta
 import plotly.graph_objects as go
 import pandas as pd
 import string
-from sqlalchemy import func, case, text, distinct
-from models import Player
+from sqlalchemy import case, text, distinct
 
 # Page Functions
 def data_sheets_page(session, session_dashboard, DEBUG):
@@ -94,12 +93,13 @@ def frequent_graphs_page(session, session_dashboard, DEBUG):
 def top_players_page(session):
     st.title("🏆 Top Players")
     
-    tab1, tab2, tab3, tab4, tab5 = st.tabs([
+    tab1, tab2, tab3, tab4, tab5, tab6 = st.tabs([
         "🔍 Search Players",
         "📝 Check Wallet List",
         "🔄 Map Wallets to Unique IDs",
         "📊 Wallet Address Analysis",
-        "💰 Wallet-Based Points"
+        "💰 Wallet-Based Points",
+        "📅 Daily & Weekly Leaderboards"
     ])
     
     with tab1:
@@ -244,42 +244,32 @@ def top_players_page(session):
         wallet_list = st.text_area(
             "Enter wallet addresses (one per line)",
             height=200,
-            help="Enter each wallet address on a new line. All punctuation and whitespace will be removed.",
+            help="Enter each wallet address on a new line, in any of its forms.",
             key="map_wallet_list"
         )
         
         if wallet_list:
-            # Process and clean the wallet list
-            wallet_addresses = []
-            for addr in wallet_list.split('\n'):
-                # Remove all punctuation and whitespace
-                cleaned_addr = addr.translate(str.maketrans('', '', string.punctuation)).replace(' ', '').strip()
-                if cleaned_addr:  # Only add non-empty addresses
-                    wallet_addresses.append(cleaned_addr)
-            
+            # Wallets are looked up by their raw form, so any friendly form of an address matches
+            wallet_addresses = [addr.strip() for addr in wallet_list.split('\n') if addr.strip()]
+
             if not wallet_addresses:
                 st.warning("No valid wallet addresses provided.")
                 return
-            
-            # Query all players with these wallet addresses
-            telegram_ids = []
-            
+
+            inputs_by_address = {}
             for wallet in wallet_addresses:
-                # Query all players with this wallet address
-                players = session.query(Player).filter(
-                    func.lower(Player.wallet_address).contains(wallet.lower())
-                ).all()
-                
-                if players:
-                    for player in players:
-                        telegram_ids.append({
-                            'telegram_id': player.telegram_id,
-                            'telegram_username': player.telegram_username,
-                            'first_name': player.first_name,
-                            'wallet_address': player.wallet_address,
-                            'input_wallet': wallet
-                        })
-            
+                inputs_by_address.setdefault(normalize_wallet_address(wallet), wallet)
+
+            telegram_ids = []
+            for player in fetch_wallet_players(session, wallet_addresses):
+                telegram_ids.append({
+                    'telegram_id': player.telegram_id,
+                    'telegram_username': player.telegram_username,
+                    'first_name': player.first_name,
+                    'wallet_address': player.wallet_address,
+                    'input_wallet': inputs_by_address.get(normalize_wallet_address(player.wallet_address))
+                })
+
             if telegram_ids:
                 # Create DataFrame
                 df_results = pd.DataFrame(telegram_ids)
@@ -421,9 +411,29 @@ def top_players_page(session):
             yaxis_title="Number of Wallets",
             template="plotly_dark"
         )
-        
+
         st.plotly_chart(fig)
 
+    with tab6:
+        st.write("📅 Top 100 players by the points earned in a day or an ISO week")
+        col1, col2 = st.columns(2)
+        with col1:
+            window = st.selectbox("Window", options=["Day", "Week"], key="leaderboard_window")
+        with col2:
+            selected_date = st.date_input("Date", datetime.now().date(), key="leaderboard_window_date")
+
+        if window == "Day":
+            bucket = f"day:{selected_date.isoformat()}"
+        else:
+            year, week, _ = selected_date.isocalendar()
+            bucket = f"week:{year}-W{week:02d}"
+
+        df_window_players = fetch_window_top_players(session, bucket)
+        if df_window_players.empty:
+            st.warning(f"No points were earned in {bucket}.")
+        else:
+            st.dataframe(df_window_players)
+
 def tgstat_analytics_page(client, channel="dicemaniacs"):
     st.title("📊 TGStat Channel Analytics")
     
@@ -559,4 +569,4 @@ def tgstat_analytics_page(client, channel="dicemaniacs"):
     # else:
     #     st.warning("Please enter a valid channel username to analyze")
 
-    
\ No newline at end of file
+    
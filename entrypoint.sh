@@ -26,6 +26,8 @@ if [ "${MIGRATE}" == 'True' ]; then
     echo "Running migrate..."
     python manage.py migrate --no-input || exit_with_error "Failed to migrate database"
 fi
+echo "Rebuilding the leaderboard if redis does not have it..."
+python manage.py rebuild_leaderboard --if-missing || exit_with_error "Failed to rebuild the leaderboard"
 echo "Initializing default superuser..."
 python manage.py createsuperuser --email=$DJANGO_SUPERUSER_EMAIL --username="$DJANGO_SUPERUSER_USERNAME"
 status=$?
@@ -39,9 +41,14 @@ if [ "${COLLECT_STATIC}" == 'True' ]; then
 fi
 echo "Starting Project..."
 
-if [ "$DJANGO_ENV" == "prod" ]; then
+if [ "$DJANGO_ENV" == "prod" ] && [ "${SERVER_MODE}" == 'asgi' ]; then
+    echo "Starting Gunicorn with uvicorn workers in production mode..."
+    export POSTGRES_POOL=True
+    gunicorn miniDice.asgi:application --bind 0.0.0.0:8000 --workers "${WEB_WORKERS:-3}" \
+        --worker-class uvicorn.workers.UvicornWorker
+elif [ "$DJANGO_ENV" == "prod" ]; then
     echo "Starting Gunicorn in production mode..."
-    gunicorn miniDice.wsgi:application --bind 0.0.0.0:8000 --workers 3
+    gunicorn miniDice.wsgi:application --bind 0.0.0.0:8000 --workers "${WEB_WORKERS:-3}"
 else
     echo "Starting Django development server..."
     python manage.py runserver 0.0.0.0:8000
@@ -107,6 +107,24 @@ REST_FRAMEWORK = {
 
 WSGI_APPLICATION = 'miniDice.wsgi.application'
 TELEGRAM_BOT_TOKEN = config('TELEGRAM_BOT_TOKEN')
+# "polling" or "webhook", the webhook is served by an ASGI app with TELEGRAM_WEBHOOK_WORKERS uvicorn workers
+TELEGRAM_BOT_MODE = config("TELEGRAM_BOT_MODE", default="polling")
+TELEGRAM_BOT_API_URL = config("TELEGRAM_BOT_API_URL", default="https://api.telegram.org/bot")
+TELEGRAM_WEBHOOK_URL = config("TELEGRAM_WEBHOOK_URL", default="")
+TELEGRAM_WEBHOOK_PATH = config("TELEGRAM_WEBHOOK_PATH", default="telegram/webhook")
+TELEGRAM_WEBHOOK_SECRET = config("TELEGRAM_WEBHOOK_SECRET", default="")
+TELEGRAM_WEBHOOK_PORT = config("TELEGRAM_WEBHOOK_PORT", cast=int, default=8443)
+TELEGRAM_WEBHOOK_WORKERS = config("TELEGRAM_WEBHOOK_WORKERS", cast=int, default=2)
+TELEGRAM_WEBHOOK_MAX_CONNECTIONS = config("TELEGRAM_WEBHOOK_MAX_CONNECTIONS", cast=int, default=40)
+# Seconds a webhook request waits for its update to be admitted before it is answered with 503
+TELEGRAM_WEBHOOK_PUT_TIMEOUT = config("TELEGRAM_WEBHOOK_PUT_TIMEOUT", cast=float, default=1.0)
+# Updates a bot process handles at the same time, and in webhook mode the most it admits before they are processed
+TELEGRAM_CONCURRENT_UPDATES = config("TELEGRAM_CONCURRENT_UPDATES", cast=int, default=16)
+TELEGRAM_UPDATE_QUEUE_SIZE = config("TELEGRAM_UPDATE_QUEUE_SIZE", cast=int, default=1000)
+# Seconds a signed mini app initData stays valid for logging in
+TELEGRAM_INIT_DATA_MAX_AGE = config("TELEGRAM_INIT_DATA_MAX_AGE", cast=int, default=86400)
+# Reject logins with the unsigned telegram_data payload once every client sends init_data
+TELEGRAM_AUTH_REQUIRE_INIT_DATA = config("TELEGRAM_AUTH_REQUIRE_INIT_DATA", cast=bool, default=False)
 
 # Database
 # https://docs.djangoproject.com/en/5.1/ref/settings/#databases
@@ -119,8 +137,18 @@ DATABASES = {
         "PASSWORD": config("POSTGRES_PASSWORD"),
         "HOST": config("POSTGRES_HOST"),
         "PORT": config("POSTGRES_PORT", "5432"),
+        "CONN_MAX_AGE": config("POSTGRES_CONN_MAX_AGE", cast=int, default=0),
+        "CONN_HEALTH_CHECKS": True,
     }
 }
+# psycopg 3 connection pool shared by the threads of a worker, used by the asgi server mode
+if config("POSTGRES_POOL", cast=bool, default=False):
+    DATABASES["default"]["CONN_MAX_AGE"] = 0
+    DATABASES["default"]["OPTIONS"] = {"pool": {
+        "min_size": config("POSTGRES_POOL_MIN_SIZE", cast=int, default=2),
+        "max_size": config("POSTGRES_POOL_MAX_SIZE", cast=int, default=10),
+        "timeout": config("POSTGRES_POOL_TIMEOUT", cast=int, default=10),
+    }}
 REDIS_HOST = config("REDIS_HOST", default="localhost")
 REDIS_PORT = config("REDIS_PORT", cast=int, default=6379)
 REDIS_URL = f"redis://{REDIS_HOST}:{REDIS_PORT}/0"
@@ -135,6 +163,27 @@ CACHES = {
         }
     },
 }
+# Seconds a process keeps the active countdown before asking redis again, it never outlives expire_dt
+ACTIVE_COUNTDOWN_LOCAL_CACHE_TIMEOUT = config("ACTIVE_COUNTDOWN_LOCAL_CACHE_TIMEOUT", cast=int, default=5)
+# Upper bound for a cached prediction board, submits invalidate it earlier
+PREDICTION_BOARD_CACHE_TIMEOUT = config("PREDICTION_BOARD_CACHE_TIMEOUT", cast=int, default=300)
+# "direct" writes each prediction to postgres, "buffered" queues it in redis for the flush_predictions command
+PREDICTION_INGESTION_MODE = config("PREDICTION_INGESTION_MODE", default="direct")
+# Lifetime of a cached countdown list page, saving a countdown moves the list to new keys
+COUNTDOWN_LIST_CACHE_TIMEOUT = config("COUNTDOWN_LIST_CACHE_TIMEOUT", cast=int, default=86400)
+# Browser cache lifetime of the last winners response, it is revalidated with its ETag afterwards
+LAST_WINNERS_MAX_AGE = config("LAST_WINNERS_MAX_AGE", cast=int, default=60)
+# Browser cache lifetime of a finished countdown's winners, the amount can still be edited so it is revalidated too
+WINNERS_MAX_AGE = config("WINNERS_MAX_AGE", cast=int, default=300)
+# Lifetime of a cached token or player row in redis and in process, revoking the token or saving the player drops it earlier
+AUTH_TOKEN_CACHE_TIMEOUT = config("AUTH_TOKEN_CACHE_TIMEOUT", cast=int, default=300)
+AUTH_TOKEN_LOCAL_CACHE_TIMEOUT = config("AUTH_TOKEN_LOCAL_CACHE_TIMEOUT", cast=int, default=5)
+# Seconds the bot trusts a user it has seen with the same profile without touching the database,
+# a player deactivated in the admin is reactivated by the bot only once this expires
+BOT_SEEN_PLAYERS_CACHE_TIMEOUT = config("BOT_SEEN_PLAYERS_CACHE_TIMEOUT", cast=int, default=300)
+BOT_SEEN_PLAYERS_CACHE_SIZE = config("BOT_SEEN_PLAYERS_CACHE_SIZE", cast=int, default=10000)
+# Seconds a process keeps a player's slot count, redis keeps it until the countdown ends or a referral drops it
+SLOT_COUNT_LOCAL_CACHE_TIMEOUT = config("SLOT_COUNT_LOCAL_CACHE_TIMEOUT", cast=int, default=5)
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
 AUTHENTICATION_BACKENDS = [
@@ -188,6 +237,17 @@ CONSTANCE_DBS = "default"
 CONSTANCE_DATABASE_CACHE_BACKEND = "default"
 CONSTANCE_REDIS_CACHE_TIMEOUT = 600
 CONSTANCE_IGNORE_ADMIN_VERSION_CHECK = True
+CONSTANCE_CONFIG = {
+    "POINT_BASE": (5, "Points every player starts with", int),
+    "POINT_PREDICTION": (1, "Points of each prediction", int),
+    "POINT_WIN": (50, "Points of each won prediction", int),
+    "POINT_REFERRAL": (5, "Points of each referred player", int),
+    "POINT_WALLET": (500, "Points of connecting a wallet", int),
+    "POINT_MINI_APP": (10, "Points of logging in to the mini app", int),
+    "USER_TOKEN_SIZE": (40, "Length of the auth tokens of players", int),
+    "USER_TOKEN_EXPIRE_DAY": (30, "Days an auth token of a player stays valid", int),
+}
+POINT_WEIGHTS_LOCAL_CACHE_TIMEOUT = 5
 
 SWAGGER_SETTINGS = dict(USE_SESSION_AUTH=False, PERSIST_AUTH=True, SECURITY_DEFINITIONS={
     "Bearer": {
@@ -0,0 +1,39 @@
+import hashlib
+import hmac
+import json
+import time
+from functools import lru_cache
+from urllib.parse import parse_qsl
+
+from django.conf import settings
+
+
+@lru_cache(maxsize=None)
+def secret_key(bot_token):
+    """
+        HMAC key of the Web App initData of a bot, derived once per process
+    """
+    return hmac.new(b"WebAppData", bot_token.encode(), hashlib.sha256).digest()
+
+
+def verify_init_data(init_data, max_age=None):
+    """
+        Telegram user dict of a mini app initData query string,
+        None if its hash does not match or it is older than max_age seconds
+    """
+    max_age = settings.TELEGRAM_INIT_DATA_MAX_AGE if max_age is None else max_age
+    fields = dict(parse_qsl(init_data, keep_blank_values=True))
+    check_hash = fields.pop("hash", None)
+    if not check_hash:
+        return None
+    data_check_string = "\n".join(f"{key}={value}" for key, value in sorted(fields.items()))
+    calculated_hash = hmac.new(secret_key(settings.TELEGRAM_BOT_TOKEN), data_check_string.encode(),
+                               hashlib.sha256).hexdigest()
+    if not hmac.compare_digest(calculated_hash, check_hash):
+        return None
+    try:
+        if time.time() - int(fields.get("auth_date", 0)) > max_age:
+            return None
+        return json.loads(fields["user"])
+    except (KeyError, ValueError):
+        return None
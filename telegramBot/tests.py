@@ -1,3 +1,240 @@
-from django.test import TestCase
+import asyncio
+import datetime
+import hashlib
+import hmac
+import json
+import threading
+import time
+from urllib.parse import urlencode
 
-# Create your tests here.
+import telegram
+from asgiref.sync import async_to_sync
+from django.core.cache import cache
+from django.db import connection
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+from telegram.ext import ApplicationBuilder
+
+from telegramBot.init_data import secret_key, verify_init_data
+from telegramBot.utils import seen_players, sync_player
+from telegramBot.webhook import AdmissionUpdateProcessor, WebhookApp
+from user.cache import local_cache
+from user.models import CountDown, Player, PlayerStats, PlayerToken, Referral, Slot
+
+TEST_BOT_TOKEN = "123456:test-bot-token"
+
+
+def sign_init_data(fields, bot_token=TEST_BOT_TOKEN):
+    """
+        initData query string of the fields signed like Telegram signs it for the bot
+    """
+    data_check_string = "\n".join(f"{key}={value}" for key, value in sorted(fields.items()))
+    check_hash = hmac.new(secret_key(bot_token), data_check_string.encode(), hashlib.sha256).hexdigest()
+    return urlencode({**fields, "hash": check_hash})
+
+
+class ReferralAttributionConcurrencyTest(TransactionTestCase):
+    """
+        Many referees of one referrer arriving at once, every referral must count exactly once
+    """
+
+    def setUp(self):
+        self.countdown = CountDown.objects.create(expire_dt=timezone.now() + datetime.timedelta(hours=1))
+        CountDown.invalidate_cache()
+        self.referrer = Player.objects.create(telegram_id=1, referral_code="1referrer")
+
+    def refer_concurrently(self, referee_ids):
+        barrier = threading.Barrier(len(referee_ids))
+        errors = []
+
+        def refer(referee_id):
+            try:
+                barrier.wait()
+                Referral.attribute(self.referrer.referral_code, referee_id)
+            except Exception as error:
+                errors.append(error)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=refer, args=(referee_id,)) for referee_id in referee_ids]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+
+    def test_slots_grow_once_per_referee(self):
+        referee_ids = [Player.objects.create(telegram_id=1000 + index).telegram_id for index in range(15)]
+        self.refer_concurrently(referee_ids)
+        self.assertEqual(Referral.objects.filter(referrer=self.referrer).count(), 15)
+        self.assertEqual(Slot.count(self.referrer.telegram_id, self.countdown), 16)
+        self.assertEqual(PlayerStats.objects.get(player=self.referrer).referral_count, 15)
+        self.assertFalse(Player.objects.filter(telegram_id__in=referee_ids, referral_code__isnull=True).exists())
+        self.assertFalse(Slot.objects.exists())
+
+    def test_slots_are_capped(self):
+        referee_ids = [Player.objects.create(telegram_id=2000 + index).telegram_id for index in range(40)]
+        self.refer_concurrently(referee_ids)
+        self.assertEqual(Referral.objects.filter(referrer=self.referrer).count(), 40)
+        self.assertEqual(Slot.count(self.referrer.telegram_id, self.countdown), 21)
+
+    def test_a_referee_counts_once(self):
+        referee = Player.objects.create(telegram_id=3000)
+        self.refer_concurrently([referee.telegram_id] * 20)
+        self.assertEqual(Referral.objects.filter(referee=referee).count(), 1)
+        self.assertEqual(Slot.count(self.referrer.telegram_id, self.countdown), 2)
+        self.assertEqual(PlayerStats.objects.get(player=self.referrer).referral_count, 1)
+
+    def test_own_code_is_ignored(self):
+        self.assertIsNone(Referral.attribute(self.referrer.referral_code, self.referrer.telegram_id))
+        self.assertEqual(Slot.count(self.referrer.telegram_id, self.countdown), 1)
+        self.assertFalse(Slot.objects.exists())
+
+
+class BotPlayerUpsertConcurrencyTest(TransactionTestCase):
+    """
+        First updates of one new user processed at once, every one of them must get the player
+    """
+
+    def test_concurrent_first_updates(self):
+        for telegram_id in range(100, 110):
+            profile = {"telegram_id": telegram_id, "telegram_username": "user", "first_name": "User",
+                       "last_name": None, "telegram_language_code": "en"}
+            barrier = threading.Barrier(8)
+            results, errors = [], []
+
+            def upsert():
+                try:
+                    barrier.wait()
+                    results.append(Player.upsert_from_bot(profile))
+                except Exception as error:
+                    errors.append(error)
+                finally:
+                    connection.close()
+
+            threads = [threading.Thread(target=upsert) for _ in range(8)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            self.assertEqual(errors, [])
+            self.assertEqual([created for _, created in results].count(True), 1)
+            self.assertEqual({player.telegram_id for player, _ in results}, {telegram_id})
+
+
+class SyncPlayerTest(TransactionTestCase):
+    """
+        Users seen recently skip the database, a deactivated player is reactivated once its entry expires
+    """
+
+    def setUp(self):
+        seen_players.clear()
+
+    def test_seen_user_skips_the_database(self):
+        user = telegram.User(id=1, first_name="User", is_bot=False, username="user")
+        self.assertTrue(async_to_sync(sync_player)(user)[1])
+        Player.objects.filter(telegram_id=1).update(is_active=False)
+        player, created = async_to_sync(sync_player)(user)
+        self.assertEqual((player.telegram_id, created), (1, False))
+        self.assertFalse(Player.objects.get(telegram_id=1).is_active)
+        seen_players.clear()
+        async_to_sync(sync_player)(user)
+        self.assertTrue(Player.objects.get(telegram_id=1).is_active)
+
+
+@override_settings(TELEGRAM_BOT_TOKEN=TEST_BOT_TOKEN, TELEGRAM_INIT_DATA_MAX_AGE=3600)
+class InitDataTest(SimpleTestCase):
+    """
+        verify_init_data only trusts initData signed with the bot token, fresh and carrying a user
+    """
+
+    def setUp(self):
+        self.user = {"id": 10, "first_name": "A", "username": "a"}
+        self.fields = {"auth_date": str(int(time.time())), "query_id": "AAH", "user": json.dumps(self.user)}
+
+    def test_valid_data_is_accepted(self):
+        self.assertEqual(verify_init_data(sign_init_data(self.fields)), self.user)
+
+    def test_tampered_data_is_rejected(self):
+        signed = sign_init_data(self.fields)
+        tampered_user = signed.replace("%22a%22", "%22b%22")
+        self.assertNotEqual(tampered_user, signed)
+        self.assertIsNone(verify_init_data(tampered_user))
+        check_hash = signed.rsplit("hash=", 1)[1]
+        tampered_hash = signed.replace(check_hash, ("0" if check_hash[0] != "0" else "1") + check_hash[1:])
+        self.assertIsNone(verify_init_data(tampered_hash))
+        self.assertIsNone(verify_init_data(sign_init_data(self.fields, bot_token="654321:other-bot-token")))
+
+    def test_stale_data_is_rejected(self):
+        self.fields["auth_date"] = str(int(time.time()) - 3601)
+        self.assertIsNone(verify_init_data(sign_init_data(self.fields)))
+
+    def test_missing_user_is_rejected(self):
+        del self.fields["user"]
+        self.assertIsNone(verify_init_data(sign_init_data(self.fields)))
+
+
+class TelegramLoginTest(TestCase):
+    """
+        A login issues one token per player and device, logging in again replaces it
+    """
+
+    def setUp(self):
+        cache.clear()
+        local_cache.clear()
+        self.user = {"id": 10, "first_name": "A", "username": "a"}
+
+    def test_login_creates_the_player(self):
+        token = Player.telegram_login(self.user, device="phone")
+        player = Player.from_token(token)
+        self.assertEqual((player.telegram_id, player.first_name, player.telegram_username), (10, "A", "a"))
+        self.assertTrue(PlayerStats.objects.get(player=player).mini_app)
+        self.assertNotEqual(PlayerToken.objects.get(player=player).key, token)
+
+    def test_relogin_replaces_the_device_token(self):
+        old_token = Player.telegram_login(self.user, device="phone")
+        other_device_token = Player.telegram_login(self.user, device="tablet")
+        self.assertEqual(Player.from_token(old_token).telegram_id, 10)
+        with self.captureOnCommitCallbacks(execute=True):
+            new_token = Player.telegram_login({**self.user, "first_name": "B"}, device="phone")
+        self.assertNotEqual(new_token, old_token)
+        self.assertIsNone(Player.from_token(old_token))
+        self.assertEqual(Player.from_token(new_token).first_name, "B")
+        self.assertEqual(Player.from_token(other_device_token).telegram_id, 10)
+        self.assertEqual(PlayerToken.objects.filter(player_id=10).count(), 2)
+
+
+class WebhookBackpressureTest(SimpleTestCase):
+    """
+        The webhook answers 503 once the admitted updates are not processed fast enough
+    """
+
+    def setUp(self):
+        self.processor = AdmissionUpdateProcessor(max_concurrent_updates=1, max_pending_updates=2)
+        application = ApplicationBuilder().token(TEST_BOT_TOKEN).concurrent_updates(self.processor).build()
+        self.webhook = WebhookApp(application, "/webhook", put_timeout=0.05)
+
+    async def post(self, update_id):
+        body = json.dumps({"update_id": update_id, "message": {
+            "message_id": update_id, "date": int(time.time()), "chat": {"id": 1, "type": "private"}, "text": "hi"}})
+        messages = [{"type": "http.request", "body": body.encode()}]
+        sent = []
+
+        async def receive():
+            return messages.pop(0)
+
+        async def send(message):
+            sent.append(message)
+
+        await self.webhook({"type": "http", "path": "/webhook", "method": "POST", "headers": []}, receive, send)
+        return sent[0]["status"]
+
+    async def test_flood_is_answered_with_503(self):
+        statuses = await asyncio.gather(*[self.post(update_id) for update_id in range(5)])
+        self.assertEqual(sorted(statuses), [200, 200, 503, 503, 503])
+        self.assertEqual(self.webhook.application.update_queue.qsize(), 2)
+
+    async def test_processed_updates_free_their_place(self):
+        self.assertEqual([await self.post(1), await self.post(2), await self.post(3)], [200, 200, 503])
+        await self.processor.process_update(None, asyncio.sleep(0))
+        self.assertEqual(await self.post(4), 200)
@@ -3,4 +3,5 @@ from .views import *
 
 urlpatterns = [
     path('auth/', TelegramAuthView.as_view(), name='auth'),
+    path('logout/', LogoutView.as_view(), name='logout'),
 ]
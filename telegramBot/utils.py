@@ -1,25 +1,71 @@
+import copy
+import datetime
 import sys
 from functools import wraps
 
 import telegram
 from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections
+from django.utils import timezone
 
+from user.cache import ProcessCache
 from user.models import Player, Referral
 
 ERROR_MESSAGE = ('Oops! It seems that an error has occurred, please write to support (contact in bio)!')
 
+# telegram_id -> (profile, player) of the users the bot has seen recently
+seen_players = ProcessCache(maxsize=settings.BOT_SEEN_PLAYERS_CACHE_SIZE)
 
-@sync_to_async
+
+def in_worker_thread(func):
+    """
+        Run a blocking database function in a thread of the default executor.
+        Like around a Django request, the connections of the thread are closed before and after the call
+        once they are unusable or older than CONN_MAX_AGE, so idle worker threads do not keep them open.
+    """
+
+    @wraps(func)
+    def run(*args, **kwargs):
+        close_old_connections()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            close_old_connections()
+
+    return sync_to_async(run, thread_sensitive=False)
+
+
+@in_worker_thread
 def refer_player(referral_code, player):
-    try:
-        referrer = Player.objects.get(referral_code=referral_code)
-        referrer.available_slots.add_slot()
-        player.set_referral_code()
-        Referral.objects.create(referrer=referrer, referee=player)
-    except Referral.DoesNotExist:
+    if Referral.attribute(referral_code, player.telegram_id) is None:
         print("Referral does not exist")
 
 
+async def sync_player(user_details, update_user_info=True):
+    """
+        Player of a telegram user, created, reactivated or updated with one upsert in a worker thread.
+        A user seen active with the same profile within BOT_SEEN_PLAYERS_CACHE_TIMEOUT skips the database,
+        so a player deactivated in the admin meanwhile is only reactivated once that entry expires.
+        Returns (player, created).
+    """
+    profile = {
+        'telegram_id': user_details.id,
+        'telegram_language_code': user_details.language_code or 'en',
+        'telegram_username': user_details.username[:64] if user_details.username else '',
+        'first_name': user_details.first_name[:30] if user_details.first_name else '',
+        'last_name': user_details.last_name[:60] if user_details.last_name else '',
+    }
+    seen = seen_players.get(user_details.id)
+    if seen is not None and (not update_user_info or seen[0] == profile):
+        return copy.copy(seen[1]), False
+    player, created = await in_worker_thread(Player.upsert_from_bot)(profile, update_user_info)
+    if player.is_active:
+        seen_players.set(user_details.id, (profile, copy.copy(player)),
+                         timezone.now() + datetime.timedelta(seconds=settings.BOT_SEEN_PLAYERS_CACHE_TIMEOUT))
+    return player, created
+
+
 def handler_decor(log_type='F', update_user_info=True):
     """
 
@@ -47,33 +93,9 @@ def handler_decor(log_type='F', update_user_info=True):
                     f'handler_decor is made for communication with user, current update has not any user: {update}'
                 )
 
-            user_adding_info = {
-                'telegram_id': '{}'.format(user_details.id),
-                'telegram_language_code': user_details.language_code or 'en',
-                'telegram_username': user_details.username[:64] if user_details.username else '',
-                'first_name': user_details.first_name[:30] if user_details.first_name else '',
-                'last_name': user_details.last_name[:60] if user_details.last_name else '',
-            }
-
-            player, created = await Player.objects.aget_or_create(
-                telegram_id=user_details.id,
-                defaults=user_adding_info
-            )
+            player, created = await sync_player(user_details, update_user_info)
             if created:
                 check_first_income()
-            elif update_user_info:
-                fields_changed = False
-                for key in ['telegram_username', 'first_name', 'last_name']:
-                    if getattr(player, key) != user_adding_info[key]:
-                        setattr(player, key, user_adding_info[key])
-                        fields_changed = True
-                if fields_changed:
-                    player.save()
-
-            if not player.is_active:
-                check_first_income()
-                player.is_active = True
-                await player.asave()
             if referral_code and created:
                 await refer_player(referral_code, player)
             raise_error = None
@@ -1,3 +1,4 @@
+from django.conf import settings
 from drf_yasg import openapi
 from drf_yasg.utils import swagger_auto_schema
 from rest_framework import status
@@ -5,7 +6,8 @@ from rest_framework.permissions import AllowAny
 from rest_framework.response import Response
 from rest_framework.views import APIView
 
-from user.models import Player
+from telegramBot.init_data import verify_init_data
+from user.models import Player, PlayerToken
 
 
 class TelegramAuthView(APIView):
@@ -14,7 +16,8 @@ class TelegramAuthView(APIView):
 
     @swagger_auto_schema(
         operation_summary="Authenticate for players",
-        operation_description="Take telegram data to authenticate players and returns player_id",
+        operation_description="Take the signed mini app init_data, or the unsigned telegram_data while it is "
+                              "allowed, to authenticate players and returns their token as player_id",
         responses={200: openapi.Response(
             description="Count down",
             examples={
@@ -27,45 +30,33 @@ class TelegramAuthView(APIView):
         tags=["Player"]
     )
     def post(self, request):
-        # Extract Telegram data
         data = request.data
-        telegram_data = data.get("telegram_data")
-        if not telegram_data:
+        init_data = data.get("init_data")
+        if init_data:
+            telegram_data = verify_init_data(init_data)
+            if telegram_data is None:
+                return Response({"error": "Invalid data"}, status=status.HTTP_401_UNAUTHORIZED)
+        elif settings.TELEGRAM_AUTH_REQUIRE_INIT_DATA:
+            return Response({"error": "Telegram data missing"}, status=status.HTTP_400_BAD_REQUEST)
+        else:
+            telegram_data = data.get("telegram_data")
+        if not telegram_data or not str(telegram_data.get("id", "")).isdigit():
             return Response({"error": "Telegram data missing"}, status=status.HTTP_400_BAD_REQUEST)
 
-        # Validate Telegram data
-        # auth_date = int(telegram_data.get("auth_date"))
-        # if time.time() - auth_date > 86400:
-        #     return Response({"error": "Auth date expired"}, status=status.HTTP_401_UNAUTHORIZED)
-
-        # secret_key = hashlib.sha256(settings.TELEGRAM_BOT_TOKEN.encode()).digest()
-        # check_hash = telegram_data.pop("hash")
-        # data_check_string = "\n".join([f"{k}={v}" for k, v in sorted(telegram_data.items())])
-        # calculated_hash = hmac.new(secret_key, data_check_string.encode(), hashlib.sha256).hexdigest()
-
-        # if calculated_hash != check_hash:
-        #     return Response({"error": "Invalid data"}, status=status.HTTP_401_UNAUTHORIZED)
-
-        # Get or create user
-        player, created = Player.objects.get_or_create(telegram_id=telegram_data.get("id"))
-
-        # Update the fields if they are provided in telegram_data
-        updated_fields = []
-        if telegram_data.get("first_name"):
-            player.first_name = telegram_data.get("first_name")
-            updated_fields.append("first_name")
-
-        if telegram_data.get("last_name"):
-            player.last_name = telegram_data.get("last_name")
-            updated_fields.append("last_name")
+        token = Player.telegram_login(telegram_data, device=str(data.get("device") or "")[:255])
+        return Response({"player_id": token, "message": "Player authenticated successfully"},
+                        status=status.HTTP_200_OK)
 
-        if telegram_data.get("username"):
-            player.telegram_username = telegram_data.get("username")
-            updated_fields.append("telegram_username")
 
-        # Save only if there are changes
-        if updated_fields:
-            player.save(update_fields=updated_fields)
-        player.telegram_login()
-        return Response({"player_id": player.auth_token, "message": "Player authenticated successfully"},
-                        status=status.HTTP_200_OK)
+class LogoutView(APIView):
+    @swagger_auto_schema(
+        operation_summary="Logout player",
+        operation_description="Revoke the auth token of the player",
+        tags=["Player"]
+    )
+    def post(self, request):
+        player = request.user
+        if not player or not isinstance(player, Player):
+            return Response({"error": "Authentication error."}, status=status.HTTP_401_UNAUTHORIZED)
+        PlayerToken.revoke(request.auth)
+        return Response({"message": "Player logged out successfully"}, status=status.HTTP_200_OK)
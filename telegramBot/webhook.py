@@ -0,0 +1,98 @@
+import asyncio
+import hmac
+import json
+
+from telegram import Update
+from telegram.ext import Application, SimpleUpdateProcessor
+
+
+class AdmissionUpdateProcessor(SimpleUpdateProcessor):
+    """
+        Update processor that also bounds the updates the webhook admitted and the application did not finish.
+        The application takes updates off its queue right away and only waits for max_concurrent_updates in
+        the processing tasks, so the queue alone never fills up. The webhook takes a place with admit before
+        queueing an update and the place is given back once the update is processed.
+    """
+
+    def __init__(self, max_concurrent_updates, max_pending_updates):
+        super().__init__(max_concurrent_updates)
+        self.pending = asyncio.Semaphore(max_pending_updates)
+
+    async def admit(self, timeout):
+        """
+            Wait up to timeout seconds for a place, returns False when none was freed
+        """
+        try:
+            await asyncio.wait_for(self.pending.acquire(), timeout)
+        except asyncio.TimeoutError:
+            return False
+        return True
+
+    async def do_process_update(self, update, coroutine):
+        try:
+            await coroutine
+        finally:
+            self.pending.release()
+
+
+class WebhookApp:
+    """
+        ASGI app receiving the updates of the bot's webhook.
+        Updates are admitted by the application's AdmissionUpdateProcessor and processed concurrently,
+        a request whose update is not admitted within put_timeout seconds is answered with 503 so that
+        Telegram delivers it again later.
+    """
+
+    def __init__(self, application: Application, path, secret_token=None, put_timeout=1.0):
+        self.application = application
+        self.processor: AdmissionUpdateProcessor = application.update_processor
+        self.path = path
+        self.secret_token = secret_token
+        self.put_timeout = put_timeout
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            await self.lifespan(receive, send)
+        elif scope["type"] == "http":
+            status = await self.handle(scope, receive)
+            await send({"type": "http.response.start", "status": status,
+                        "headers": [(b"content-type", b"text/plain")]})
+            await send({"type": "http.response.body", "body": b""})
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                await self.application.initialize()
+                await self.application.start()
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                await self.application.stop()
+                await self.application.shutdown()
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    async def handle(self, scope, receive):
+        if scope["path"] != self.path:
+            return 404
+        if scope["method"] != "POST":
+            return 405
+        if self.secret_token:
+            headers = dict(scope["headers"])
+            secret_token = headers.get(b"x-telegram-bot-api-secret-token", b"").decode()
+            if not hmac.compare_digest(secret_token, self.secret_token):
+                return 403
+        body = b""
+        while True:
+            message = await receive()
+            body += message.get("body", b"")
+            if not message.get("more_body"):
+                break
+        try:
+            update = Update.de_json(json.loads(body), self.application.bot)
+        except (ValueError, KeyError, TypeError):
+            return 400
+        if not await self.processor.admit(self.put_timeout):
+            return 503
+        await self.application.update_queue.put(update)
+        return 200
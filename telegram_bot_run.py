@@ -1,24 +1,79 @@
+import argparse
+import asyncio
+
 from telegram.ext import ApplicationBuilder
+from telegram.request import HTTPXRequest
 from telegram import Bot, Update
 import os, django
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'miniDice.settings')
 django.setup()
 
+from django.conf import settings
 from miniDice.settings import TELEGRAM_BOT_TOKEN
 from telegramBot.routing import add_handlers
+from telegramBot.webhook import AdmissionUpdateProcessor, WebhookApp
 
 
-def main():
-    print("Starting connection with bot")
-    bot = Bot(TELEGRAM_BOT_TOKEN)
-    print("Connected successfully!")
-    application = ApplicationBuilder().bot(bot).build()
+def build_application(concurrent_updates=settings.TELEGRAM_CONCURRENT_UPDATES):
+    """
+        Bot application that processes TELEGRAM_CONCURRENT_UPDATES updates at a time,
+        concurrent_updates can also be an update processor with that limit
+    """
+    request = HTTPXRequest(connection_pool_size=settings.TELEGRAM_CONCURRENT_UPDATES + 4)
+    bot = Bot(TELEGRAM_BOT_TOKEN, base_url=settings.TELEGRAM_BOT_API_URL, request=request)
+    application = ApplicationBuilder().bot(bot).concurrent_updates(concurrent_updates).build()
     add_handlers(application)
+    return application
+
+
+def webhook_app():
+    """
+        ASGI app factory of the webhook mode, every uvicorn worker builds its own application which admits at most
+        TELEGRAM_UPDATE_QUEUE_SIZE updates that are not processed yet
+    """
+    processor = AdmissionUpdateProcessor(settings.TELEGRAM_CONCURRENT_UPDATES, settings.TELEGRAM_UPDATE_QUEUE_SIZE)
+    return WebhookApp(build_application(processor), f"/{settings.TELEGRAM_WEBHOOK_PATH}",
+                      secret_token=settings.TELEGRAM_WEBHOOK_SECRET or None,
+                      put_timeout=settings.TELEGRAM_WEBHOOK_PUT_TIMEOUT)
+
+
+async def set_webhook():
+    bot = Bot(TELEGRAM_BOT_TOKEN, base_url=settings.TELEGRAM_BOT_API_URL)
+    async with bot:
+        await bot.set_webhook(f"{settings.TELEGRAM_WEBHOOK_URL.rstrip('/')}/{settings.TELEGRAM_WEBHOOK_PATH}",
+                              allowed_updates=Update.ALL_TYPES,
+                              secret_token=settings.TELEGRAM_WEBHOOK_SECRET or None,
+                              max_connections=settings.TELEGRAM_WEBHOOK_MAX_CONNECTIONS)
+
+
+def run_polling():
+    print("Starting connection with bot")
+    application = build_application()
     print("Loading application")
     application.run_polling(allowed_updates=Update.ALL_TYPES)
     print("Application loaded successfully!")
 
 
+def run_webhook():
+    import uvicorn
+
+    print("Setting webhook")
+    asyncio.run(set_webhook())
+    print(f"Serving webhook with {settings.TELEGRAM_WEBHOOK_WORKERS} workers")
+    uvicorn.run("telegram_bot_run:webhook_app", factory=True, host="0.0.0.0", port=settings.TELEGRAM_WEBHOOK_PORT,
+                workers=settings.TELEGRAM_WEBHOOK_WORKERS)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--mode", choices=["polling", "webhook"], default=settings.TELEGRAM_BOT_MODE)
+    options = parser.parse_args()
+    if options.mode == "webhook":
+        run_webhook()
+    else:
+        run_polling()
+
+
 if __name__ == '__main__':
     main()
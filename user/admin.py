@@ -1,12 +1,12 @@
-from django.contrib import admin
+from django.contrib import admin, messages
 from django.contrib.admin import DateFieldListFilter
-from django.db.models import Count, Prefetch, Q
-from django.utils import timezone
+from django.db.models.expressions import RawSQL
 from django.utils.translation import gettext_lazy as _
 from import_export.admin import ImportExportModelAdmin
 
-from user.models import CountDown, Slot
+from user.models import CountDown, CountDownSummary, LeaderboardSnapshot, PlayerStats, PlayerToken, Slot, Wallet
 from user.resource import *
+from user.settlement import settle_countdown
 
 
 class ConnectWalletFilter(admin.SimpleListFilter):
@@ -29,7 +29,7 @@ class ConnectWalletFilter(admin.SimpleListFilter):
 
 class OpenWebAppFilter(admin.SimpleListFilter):
     title = _('web app opened')  # Display name in the filter section
-    parameter_name = 'auth_token'  # URL query parameter
+    parameter_name = 'mini_app'  # URL query parameter
 
     def lookups(self, request, model_admin):
         return [
@@ -39,9 +39,9 @@ class OpenWebAppFilter(admin.SimpleListFilter):
 
     def queryset(self, request, queryset):
         if self.value() == 'none':
-            return queryset.filter(auth_token__isnull=True)
+            return queryset.filter(stats__mini_app=False)
         if self.value() == 'exist':
-            return queryset.filter(auth_token__isnull=False)
+            return queryset.filter(stats__mini_app=True)
         return queryset  # Default: show all
 
 
@@ -50,55 +50,53 @@ class PlayerAdmin(ImportExportModelAdmin):
     resource_class = PlayerResource
     list_display = (
         "telegram_id", "insert_dt", "telegram_username", "first_name", "last_name", "telegram_language_code",
-        "auth_token", "referral_code", "available_slots", "wallet_address", "wallet_insert_dt", "point_value")
+        "referral_code", "available_slots", "wallet_address", "wallet_insert_dt", "point_value")
     search_fields = ("telegram_id", "telegram_username")
     list_filter = ("is_active", ConnectWalletFilter, OpenWebAppFilter, "telegram_language_code")
     fieldsets = (
         (None,
          {'fields': (
              "telegram_id", "referral_code", "telegram_username", "first_name", "last_name", "telegram_language_code",
-             "auth_token", "wallet_address", "wallet_insert_dt")},),
+             "wallet_address", "wallet_insert_dt")},),
     )
     ordering = ('telegram_id',)
     date_hierarchy = 'wallet_insert_dt'
     actions = ['sync_referrals']
 
     def point_value(self, obj):
-        return obj.point_value
+        return obj.stats.point
 
-    point_value.admin_order_field = 'point_value'
+    point_value.admin_order_field = 'stats__point'
 
     def available_slots(self, obj):
-        if hasattr(obj, 'available_slot') and obj.available_slot:
-            slot = obj.available_slot[0]
-            return slot.number
-        return "No active slot"
-
-    available_slots.admin_order_field = 'available_slots'
+        slot_count = getattr(obj, "slot_count", None)
+        if slot_count is None:
+            return "No active countdown"
+        return slot_count
 
     def get_queryset(self, request):
+        queryset = super().get_queryset(request).select_related("stats")
         active_countdown = CountDown.get_active_countdown()
-        queryset = super().get_queryset(request).prefetch_related(
-            Prefetch('slot_set', queryset=Slot.objects.filter(countdown=active_countdown), to_attr='available_slot'))
-        return Player.players_with_point_value(queryset)
+        if active_countdown is not None:
+            # Counted by the page query itself instead of one lookup per row
+            queryset = queryset.annotate(slot_count=RawSQL(
+                Slot.count_sql('"player"."telegram_id"', int(active_countdown.id)), []))
+        return queryset
 
     def sync_referrals(self, request, queryset):
-        today = timezone.make_aware(timezone.datetime.combine(timezone.datetime.today(), timezone.datetime.min.time()))
-        referrals = (Referral.objects.filter(insert_dt__gt=today)
-                     .values('referrer')
-                     .annotate(referral_count=Count('referrer')))
-        for referrer_data in referrals:
-            referrer_id = referrer_data['referrer']
-            referral_count = referrer_data['referral_count']
-            player = Player.objects.get(telegram_id=referrer_id)
-            player.available_slots.number = referral_count + 1
-            player.available_slots.save()
+        # Slots are derived from the referrals, recounting them only needs the cached counts dropped
+        active_countdown = CountDown.get_active_countdown()
+        if active_countdown is None:
+            self.message_user(request, "There is no active countdown.", level=messages.WARNING)
+            return
+        for player_id in queryset.values_list("telegram_id", flat=True):
+            Slot.invalidate(player_id, active_countdown.id)
 
 
 @admin.register(Slot)
 class SlotAdmin(ImportExportModelAdmin):
-    list_display = ["player", "countdown", "number"]
-    list_filter = ["number", "countdown"]
+    list_display = ["player", "countdown", "bonus"]
+    list_filter = ["bonus", "countdown"]
     search_fields = ["player__telegram_id", "player__telegram_username"]
 
 
@@ -115,6 +113,7 @@ class PredictionAdmin(ImportExportModelAdmin):
          {'fields': ("player", "dice_number1", "dice_number2", "countdown", "slot")},),
     )
     date_hierarchy = 'insert_dt'
+    list_select_related = ("player", "countdown__summary")
 
     @admin.display(description='wallet address')
     def wallet(self, obj: Prediction):
@@ -125,8 +124,7 @@ class PredictionAdmin(ImportExportModelAdmin):
     @admin.display(description='amount')
     def amount(self, obj: Prediction):
         if obj.is_win:
-            countdown = obj.countdown
-            return countdown.amount / countdown.get_won_players_count()
+            return obj.countdown.get_winner_amount()
         return 0
 
 
@@ -141,33 +139,68 @@ class CountDownAdmin(admin.ModelAdmin):
          {'fields': ("expire_dt", "dice_number1", "dice_number2", "is_active", "amount", "has_end")},),
     )
     actions = ["end_countdown"]
-
-    def get_queryset(self, request):
-        queryset = super().get_queryset(request).annotate(
-            predictions_count=Count('predictions', filter=Q(predictions__is_active=True)),
-            won_players=Count('predictions', filter=Q(predictions__is_win=True)))
-        return queryset
+    list_select_related = ("summary",)
 
     def end_countdown(self, request, queryset):
         countdowns = queryset.all()
         for countdown in countdowns:
             try:
-                countdown.end_countdown()
-                countdown.save()
-            except Exception as e:
-                pass
+                settle_countdown(countdown)
+            except ValueError as e:
+                self.message_user(request, f"{countdown}: {e}", level=messages.WARNING)
 
     @admin.display(description='Won players count')
     def won_players(self, obj: CountDown):
-        if hasattr(obj, 'won_players') and obj.won_players:
-            return obj.won_players
-        return 0
+        summary = getattr(obj, 'summary', None)
+        if summary is not None:
+            return summary.winner_count
+        return "-"
 
     @admin.display(description='All predictions count')
     def predictions_count(self, obj: CountDown):
-        if hasattr(obj, 'predictions_count') and obj.predictions_count:
-            return obj.predictions_count
-        return 0
+        summary = getattr(obj, 'summary', None)
+        if summary is not None:
+            return summary.prediction_count
+        return "-"
+
+
+@admin.register(CountDownSummary)
+class CountDownSummaryAdmin(admin.ModelAdmin):
+    list_display = ("countdown", "winner_count", "winner_amount", "participant_count", "prediction_count")
+    list_select_related = ("countdown",)
+
+
+@admin.register(PlayerStats)
+class PlayerStatsAdmin(admin.ModelAdmin):
+    list_display = ("player", "point", "prediction_count", "win_count", "referral_count", "wallet", "mini_app")
+    list_select_related = ("player",)
+    search_fields = ("player__telegram_id", "player__telegram_username")
+    ordering = ("-point",)
+
+
+@admin.register(Wallet)
+class WalletAdmin(admin.ModelAdmin):
+    list_display = ("address", "first_seen_dt", "player_count")
+    search_fields = ("address",)
+    ordering = ("-player_count",)
+
+
+@admin.register(PlayerToken)
+class PlayerTokenAdmin(admin.ModelAdmin):
+    list_display = ("player", "device", "insert_dt", "expire_dt")
+    search_fields = ("player__telegram_id", "player__telegram_username")
+    raw_id_fields = ("player",)
+    exclude = ("key",)
+
+    def has_add_permission(self, request):
+        # Tokens are issued by logging in, the raw token is never stored
+        return False
+
+
+@admin.register(LeaderboardSnapshot)
+class LeaderboardSnapshotAdmin(admin.ModelAdmin):
+    list_display = ("bucket", "player_count", "insert_dt")
+    search_fields = ("bucket",)
 
 
 @admin.register(Referral)
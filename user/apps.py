@@ -5,6 +5,11 @@ class UserConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'user'
 
+    def ready(self):
+        from constance.signals import config_updated
+        from user.scoring import on_config_updated
+        config_updated.connect(on_config_updated, dispatch_uid="user_point_weights")
+
     # def ready(self):
     #     # Ensure superuser creation on startup
     #     try:
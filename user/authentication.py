@@ -6,12 +6,20 @@ from user.models import Player
 
 
 class UserTokenAuthentication(TokenAuthentication):
+    def authenticate(self, request):
+        # TokenAuthMiddleware already resolved the token of this request
+        if getattr(request._request, "auth_token", None) is not None:
+            return self.check_player(request._request.player, request._request.auth_token)
+        return super().authenticate(request)
+
     def authenticate_credentials(self, token):
         if not token:
             raise exceptions.AuthenticationFailed(_("token not found"))
-        try:
-            player = Player.objects.get(auth_token=token)
-        except Player.DoesNotExist:
+        return self.check_player(Player.from_token(token), token)
+
+    @staticmethod
+    def check_player(player, token):
+        if player is None:
             raise exceptions.AuthenticationFailed(_('invalid token.'))
         if not player.is_active:
             raise exceptions.AuthenticationFailed(_('player inactive or deleted.'))
@@ -13,20 +13,18 @@ class TokenAuthenticationBackend(BaseBackend):
     """
 
     def authenticate(self, request, username=None, password=None, token=None, **kwargs):
-        try:
-            user = User.objects.get(username=username)
-            if user:
-                if user.check_password(password):
-                    return user
-                else:
-                    raise exceptions.AuthenticationFailed()
-        except User.DoesNotExist:
-            pass
-        try:
-            player = Player.objects.get(auth_token=token)
-            return player
-        except Player.DoesNotExist:
-            pass
+        if username is not None:
+            try:
+                user = User.objects.get(username=username)
+                if user:
+                    if user.check_password(password):
+                        return user
+                    else:
+                        raise exceptions.AuthenticationFailed()
+            except User.DoesNotExist:
+                pass
+        if token is not None:
+            return Player.from_token(token)
         return None
 
     def get_user(self, user_id) -> "Optional[User]":
@@ -0,0 +1,81 @@
+import datetime
+import threading
+from collections import OrderedDict
+
+from django.core.cache import cache
+from django.db import transaction
+from django.utils import timezone
+
+
+def seconds_until(dt):
+    """
+        Seconds left until the given datetime, negative if it is in the past
+    """
+    return (dt - timezone.now()).total_seconds()
+
+
+class ProcessCache:
+    """
+        Thread safe in-process LRU cache whose entries expire at an absolute datetime
+    """
+
+    def __init__(self, maxsize=1024):
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return default
+            value, expire_dt = entry
+            if expire_dt <= timezone.now():
+                del self._entries[key]
+                return default
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, expire_dt):
+        with self._lock:
+            self._entries[key] = (value, expire_dt)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+local_cache = ProcessCache()
+
+
+def tiered_get(key, local_timeout):
+    """
+        Value of a key from the process cache, falling back to redis, which refills the process cache
+    """
+    value = local_cache.get(key)
+    if value is None:
+        value = cache.get(key)
+        if value is not None:
+            local_cache.set(key, value, timezone.now() + datetime.timedelta(seconds=local_timeout))
+    return value
+
+
+def tiered_set(key, value, timeout, local_timeout):
+    cache.set(key, value, timeout=timeout)
+    local_cache.set(key, value, timezone.now() + datetime.timedelta(seconds=min(timeout, local_timeout)))
+
+
+def tiered_delete(key):
+    """
+        Drop a key from this process now and from redis once the transaction commits,
+        other processes drop it within their local timeout
+    """
+    local_cache.delete(key)
+    transaction.on_commit(lambda: cache.delete(key))
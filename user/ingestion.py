@@ -0,0 +1,130 @@
+import datetime
+import logging
+
+from django.db import IntegrityError, transaction
+from django_redis import get_redis_connection
+from redis.exceptions import WatchError
+
+from user.models import CountDown, Player, Prediction, Slot, PREDICTION_PICKS_KEY, PREDICTION_BUFFER_KEY, \
+    PREDICTION_DEAD_LETTER_KEY
+
+logger = logging.getLogger(__name__)
+
+
+class PredictionBuffer:
+    """
+        Write-behind buffer for prediction submissions.
+        Picks are validated against a redis hash of the player's board and appended to a redis stream per
+        countdown, the flush_predictions command writes them into the prediction table in bulk.
+        Only one flusher should run at a time, it relies on the stream order to keep the latest pick.
+    """
+
+    @staticmethod
+    def submit(player: Player, countdown: CountDown, dice_number1, dice_number2, slot=1):
+        redis = get_redis_connection("default")
+        key = PREDICTION_PICKS_KEY.format(player_id=player.telegram_id, countdown_id=countdown.id)
+        PredictionBuffer._seed(redis, key, player, countdown)
+        pair = sorted((dice_number1, dice_number2))
+        with redis.pipeline() as pipe:
+            while True:
+                try:
+                    pipe.watch(key)
+                    state = {field.decode(): value.decode() for field, value in pipe.hgetall(key).items()}
+                    if "slots" not in state:
+                        state["slots"] = Slot.count(player.telegram_id, countdown)
+                    if slot > int(state["slots"]):
+                        raise ValueError(f"You don't have slot number {slot}")
+                    for field, value in state.items():
+                        if field.startswith("slot:") and field != f"slot:{slot}" and \
+                                sorted(map(int, value.split(","))) == pair:
+                            raise ValueError("You have predicted this dice before")
+                    pipe.multi()
+                    pipe.hset(key, mapping={f"slot:{slot}": f"{dice_number1},{dice_number2}",
+                                            "slots": state["slots"]})
+                    pipe.expireat(key, countdown.expire_dt + datetime.timedelta(days=1))
+                    pipe.xadd(PREDICTION_BUFFER_KEY.format(countdown_id=countdown.id),
+                              {"player": player.telegram_id, "slot": slot,
+                               "dice_number1": dice_number1, "dice_number2": dice_number2})
+                    pipe.execute()
+                    break
+                except WatchError:
+                    continue
+        return Prediction(player=player, countdown=countdown, dice_number1=dice_number1,
+                          dice_number2=dice_number2, slot=slot)
+
+    @staticmethod
+    def _seed(redis, key, player: Player, countdown: CountDown):
+        """
+            Load the player's active predictions into the picks hash the first time it is used.
+            HSETNX never overwrites, so picks buffered by a concurrent request win over the database.
+        """
+        if redis.hexists(key, "seeded"):
+            return
+        predictions = player.predictions.filter(is_active=True, countdown=countdown).values_list(
+            "slot", "dice_number1", "dice_number2")
+        pipe = redis.pipeline(transaction=True)
+        for slot, dice_number1, dice_number2 in predictions:
+            pipe.hsetnx(key, f"slot:{slot}", f"{dice_number1},{dice_number2}")
+        pipe.hsetnx(key, "seeded", 1)
+        pipe.expireat(key, countdown.expire_dt + datetime.timedelta(days=1))
+        pipe.execute()
+
+    @staticmethod
+    def flush(countdown_id, count=1000):
+        """
+            Write up to count buffered picks of the countdown into the prediction table.
+            The picks were already accepted, so the ones the table rejects are logged and moved to the
+            countdown's dead letter stream before their entries are deleted.
+            Returns the number of stream entries consumed.
+        """
+        redis = get_redis_connection("default")
+        stream = PREDICTION_BUFFER_KEY.format(countdown_id=countdown_id)
+        entries = redis.xrange(stream, count=count)
+        if not entries:
+            return 0
+        latest = {}
+        for _, fields in entries:
+            player_id, slot = int(fields[b"player"]), int(fields[b"slot"])
+            latest.pop((player_id, slot), None)
+            latest[(player_id, slot)] = (player_id, countdown_id, slot, int(fields[b"dice_number1"]),
+                                         int(fields[b"dice_number2"]))
+        rows = list(latest.values())
+        dropped = []
+        try:
+            skipped = PredictionBuffer._store(rows)
+        except IntegrityError:
+            # Retry each player's picks together, so pairs swapping slots still land, then each pick alone
+            skipped = []
+            player_rows = {}
+            for row in rows:
+                player_rows.setdefault(row[0], []).append(row)
+            for rows_of_player in player_rows.values():
+                try:
+                    skipped += PredictionBuffer._store(rows_of_player)
+                except IntegrityError:
+                    for row in rows_of_player:
+                        try:
+                            skipped += PredictionBuffer._store([row])
+                        except IntegrityError:
+                            dropped.append((row, "duplicate pair"))
+        dropped += [(row, "slot not available") for row in skipped]
+        with redis.pipeline() as pipe:
+            for row, reason in dropped:
+                logger.warning("Dropped buffered prediction %s: %s", row, reason)
+                player_id, _, slot, dice_number1, dice_number2 = row
+                pipe.xadd(PREDICTION_DEAD_LETTER_KEY.format(countdown_id=countdown_id),
+                          {"player": player_id, "slot": slot, "dice_number1": dice_number1,
+                           "dice_number2": dice_number2, "reason": reason})
+            pipe.xdel(stream, *[entry_id for entry_id, _ in entries])
+            pipe.execute()
+        for player_id in {row[0] for row in rows}:
+            Prediction.invalidate_board(player_id, countdown_id)
+        return len(entries)
+
+    @staticmethod
+    def _store(rows):
+        """
+            Release the slots the rows change and upsert them in one transaction, returns the skipped rows
+        """
+        with transaction.atomic():
+            return Prediction.upsert(rows, Prediction.release(rows))[1]
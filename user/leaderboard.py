@@ -0,0 +1,112 @@
+from itertools import islice
+
+from django.db import transaction
+from django.utils import timezone
+from django_redis import get_redis_connection
+
+LEADERBOARD_KEY = 'leaderboard:points'
+LEADERBOARD_BUILT_KEY = 'leaderboard:built'
+
+# Rank and neighbours of a member read atomically, so the set cannot shrink between the two reads
+AROUND_SCRIPT = """
+local rank = redis.call('ZREVRANK', KEYS[1], ARGV[1])
+if not rank then
+    return nil
+end
+local count = tonumber(ARGV[2])
+return {rank, redis.call('ZREVRANGE', KEYS[1], math.max(rank - count, 0), rank + count, 'WITHSCORES')}
+"""
+
+
+class Leaderboard:
+    """
+        Player points kept in a redis sorted set.
+        Scoring events store the points returned by the player_stats upsert once their transaction commits,
+        the rebuild_leaderboard command restores the set from player_stats after a redis data loss.
+        The set is only complete once a rebuild has marked it as built, scoring events alone start a partial one.
+    """
+
+    @staticmethod
+    def day_bucket(date):
+        return f"day:{date.isoformat()}"
+
+    @staticmethod
+    def week_bucket(date):
+        year, week, _ = date.isocalendar()
+        return f"week:{year}-W{week:02d}"
+
+    @staticmethod
+    def countdown_bucket(countdown_id):
+        return f"countdown:{countdown_id}"
+
+    @staticmethod
+    def bucket_countdown_id(bucket):
+        return int(bucket.split(":", 1)[1])
+
+    @staticmethod
+    def current_buckets():
+        today = timezone.localdate()
+        return [Leaderboard.day_bucket(today), Leaderboard.week_bucket(today)]
+
+    @staticmethod
+    def set_points(points):
+        """
+            Store a {player_id: point} dict as the players' scores after the current transaction commits
+        """
+        if not points:
+            return
+        transaction.on_commit(lambda: get_redis_connection("default").zadd(LEADERBOARD_KEY, points))
+
+    @staticmethod
+    def remove(player_id):
+        transaction.on_commit(lambda: get_redis_connection("default").zrem(LEADERBOARD_KEY, player_id))
+
+    @staticmethod
+    def is_built():
+        return bool(get_redis_connection("default").exists(LEADERBOARD_BUILT_KEY))
+
+    @staticmethod
+    def top(count=100):
+        """
+            [(player_id, point)] of the best players, highest point first
+        """
+        entries = get_redis_connection("default").zrevrange(LEADERBOARD_KEY, 0, count - 1, withscores=True)
+        return [(int(player_id), int(point)) for player_id, point in entries]
+
+    @staticmethod
+    def around(player_id, count):
+        """
+            (rank, point, entries) where rank and point are the player's 1-based rank and point and entries are
+            the [(player_id, point)] of the player and up to count players above and below, starting at rank - count.
+            None when the player is not on the leaderboard.
+        """
+        result = get_redis_connection("default").eval(AROUND_SCRIPT, 1, LEADERBOARD_KEY, player_id, count)
+        if result is None:
+            return None
+        rank, flat = result
+        entries = [(int(flat[index]), int(float(flat[index + 1]))) for index in range(0, len(flat), 2)]
+        return rank + 1, dict(entries)[player_id], entries
+
+    @staticmethod
+    def rebuild(rows, batch_size=10000):
+        """
+            Replace the set with the given (player_id, point) rows and mark it as built.
+            The new set is built under a temporary key and renamed over the old one, so readers never see
+            a partial set, but points added while it is being built are lost.
+        """
+        redis = get_redis_connection("default")
+        temp_key = f"{LEADERBOARD_KEY}:rebuild"
+        redis.delete(temp_key)
+        rows = iter(rows)
+        total = 0
+        while batch := list(islice(rows, batch_size)):
+            redis.zadd(temp_key, {player_id: point for player_id, point in batch})
+            total += len(batch)
+        with redis.pipeline() as pipe:
+            if total:
+                pipe.rename(temp_key, LEADERBOARD_KEY)
+            else:
+                pipe.delete(LEADERBOARD_KEY)
+            pipe.set(LEADERBOARD_BUILT_KEY, 1)
+            pipe.execute()
+        return total
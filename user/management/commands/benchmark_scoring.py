@@ -0,0 +1,53 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.utils import timezone
+
+from user.scoring import rescore
+
+
+class Command(BaseCommand):
+    help = "Times a full re-score of synthetic player stats, every row it creates is rolled back at the end"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--players", type=int, default=1_000_000)
+        parser.add_argument("--batch-size", type=int, default=100_000)
+
+    def handle(self, *args, **options):
+        players = options["players"]
+        with transaction.atomic():
+            now = timezone.now()
+            started = time.perf_counter()
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    """
+                    INSERT INTO player (telegram_id, is_active, insert_dt, update_dt, telegram_language_code)
+                    SELECT -player_number, TRUE, %(now)s, %(now)s, 'en'
+                    FROM generate_series(1, %(players)s) AS player_number
+                    ON CONFLICT DO NOTHING
+                    """,
+                    {"now": now, "players": players}
+                )
+                # Spread counters and flags, the stored point of 0 makes every row stale.
+                cursor.execute(
+                    """
+                    INSERT INTO player_stats (player_id, prediction_count, win_count, referral_count, wallet,
+                                              mini_app, point, is_active, insert_dt, update_dt)
+                    SELECT -player_number, player_number %% 997, player_number %% 31, player_number %% 17,
+                           player_number %% 3 = 0, player_number %% 2 = 0, 0, TRUE, %(now)s, %(now)s
+                    FROM generate_series(1, %(players)s) AS player_number
+                    ON CONFLICT (player_id) DO UPDATE SET point = 0
+                    """,
+                    {"now": now, "players": players}
+                )
+                cursor.execute("ANALYZE player_stats")
+            self.stdout.write(f"Inserted {players} player stats in {time.perf_counter() - started:.2f}s")
+
+            started = time.perf_counter()
+            changed = rescore(batch_size=options["batch_size"])
+            self.stdout.write(f"Re-score of {changed} players: {time.perf_counter() - started:.3f}s")
+            started = time.perf_counter()
+            rescore(batch_size=options["batch_size"])
+            self.stdout.write(f"Second re-score (nothing stale): {time.perf_counter() - started:.3f}s")
+            transaction.set_rollback(True)
@@ -0,0 +1,59 @@
+import datetime
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.utils import timezone
+
+from user.models import CountDown
+from user.settlement import settle_countdown
+
+
+class Command(BaseCommand):
+    help = "Times settlement of a synthetic countdown, every row it creates is rolled back at the end"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--predictions", type=int, default=1_000_000)
+
+    def handle(self, *args, **options):
+        predictions = options["predictions"]
+        # Every synthetic player fills its 21 slots with the 21 different dice pairs.
+        players = (predictions + 20) // 21
+        with transaction.atomic():
+            now = timezone.now()
+            countdown = CountDown.objects.create(expire_dt=now - datetime.timedelta(seconds=1), dice_number1=3,
+                                                 dice_number2=5)
+            started = time.perf_counter()
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    """
+                    INSERT INTO player (telegram_id, is_active, insert_dt, update_dt, telegram_language_code)
+                    SELECT -player_number, TRUE, %(now)s, %(now)s, 'en'
+                    FROM generate_series(1, %(players)s) AS player_number
+                    ON CONFLICT DO NOTHING
+                    """,
+                    {"now": now, "players": players}
+                )
+                cursor.execute(
+                    """
+                    INSERT INTO prediction (is_active, insert_dt, update_dt, player_id, countdown_id,
+                                            dice_number1, dice_number2, slot, is_win)
+                    SELECT TRUE, %(now)s, %(now)s, -(row_number / 21 + 1), %(countdown)s,
+                           pair.dice_number1, pair.dice_number2, row_number %% 21 + 1, FALSE
+                    FROM generate_series(0, %(predictions)s - 1) AS row_number
+                    JOIN (SELECT row_number() OVER () - 1 AS pair_number, low AS dice_number1, high AS dice_number2
+                          FROM generate_series(1, 6) AS low, generate_series(1, 6) AS high
+                          WHERE low <= high) AS pair ON pair.pair_number = row_number %% 21
+                    """,
+                    {"now": now, "countdown": countdown.id, "predictions": predictions}
+                )
+                cursor.execute("ANALYZE prediction")
+            self.stdout.write(f"Inserted {predictions} predictions in {time.perf_counter() - started:.2f}s")
+
+            started = time.perf_counter()
+            settle_countdown(countdown)
+            self.stdout.write(f"Settlement: {time.perf_counter() - started:.3f}s")
+            started = time.perf_counter()
+            settle_countdown(countdown)
+            self.stdout.write(f"Second settlement (no-op): {time.perf_counter() - started:.3f}s")
+            transaction.set_rollback(True)
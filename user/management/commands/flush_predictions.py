@@ -0,0 +1,28 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from user.ingestion import PredictionBuffer
+from user.models import CountDown
+
+
+class Command(BaseCommand):
+    help = "Writes buffered prediction submissions into the prediction table"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--loop", action="store_true", help="Keep flushing until the process is stopped")
+        parser.add_argument("--interval", type=float, default=0.5, help="Seconds to sleep when the buffer is empty")
+        parser.add_argument("--batch-size", type=int, default=1000)
+
+    def handle(self, *args, **options):
+        while True:
+            flushed = 0
+            for countdown in (CountDown.get_last_countdown(), CountDown.get_active_countdown()):
+                if countdown is not None:
+                    flushed += PredictionBuffer.flush(countdown.id, count=options["batch_size"])
+            if flushed:
+                self.stdout.write(f"Flushed {flushed} buffered predictions.")
+            if not options["loop"]:
+                break
+            if not flushed:
+                time.sleep(options["interval"])
@@ -0,0 +1,24 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from user.models import LeaderboardSnapshot
+
+
+class Command(BaseCommand):
+    help = "Freezes the closed day, week and countdown leaderboard windows into snapshots"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--size", type=int, default=1000, help="Players kept in each snapshot")
+        parser.add_argument("--loop", action="store_true", help="Keep freezing until the process is stopped")
+        parser.add_argument("--interval", type=float, default=3600, help="Seconds between two runs")
+
+    def handle(self, *args, **options):
+        while True:
+            for bucket in LeaderboardSnapshot.closed_buckets():
+                snapshot = LeaderboardSnapshot.freeze(bucket, size=options["size"])
+                self.stdout.write(self.style.SUCCESS(f"Leaderboard {bucket} frozen with {snapshot.player_count} "
+                                                     f"players."))
+            if not options["loop"]:
+                break
+            time.sleep(options["interval"])
@@ -0,0 +1,21 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from user.models import PlayerToken
+
+
+class Command(BaseCommand):
+    help = "Deletes the expired auth tokens of players"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--loop", action="store_true", help="Keep pruning until the process is stopped")
+        parser.add_argument("--interval", type=float, default=3600, help="Seconds between two runs")
+
+    def handle(self, *args, **options):
+        while True:
+            deleted = PlayerToken.prune()
+            self.stdout.write(self.style.SUCCESS(f"{deleted} expired tokens deleted."))
+            if not options["loop"]:
+                break
+            time.sleep(options["interval"])
@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+
+from user.leaderboard import Leaderboard
+from user.models import PlayerStats
+
+
+class Command(BaseCommand):
+    help = "Rebuilds the redis leaderboard from the player_stats table"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=10000, help="Players written to redis per command")
+        parser.add_argument("--if-missing", action="store_true",
+                            help="Only rebuild when the leaderboard was never built or redis lost it")
+
+    def handle(self, *args, **options):
+        if options["if_missing"] and Leaderboard.is_built():
+            self.stdout.write("Leaderboard is already built.")
+            return
+        rows = PlayerStats.objects.values_list("player_id", "point").iterator(chunk_size=options["batch_size"])
+        total = Leaderboard.rebuild(rows, batch_size=options["batch_size"])
+        self.stdout.write(self.style.SUCCESS(f"Leaderboard rebuilt with {total} players."))
@@ -0,0 +1,26 @@
+import time
+
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+
+from user.scoring import rescore, RESCORE_PENDING_CACHE_KEY
+
+
+class Command(BaseCommand):
+    help = "Recomputes every player's point with the current constance weights"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=100_000, help="Players scored per batch")
+        parser.add_argument("--loop", action="store_true",
+                            help="Keep running and rescore whenever a point weight is changed")
+        parser.add_argument("--interval", type=float, default=60, help="Seconds between two checks in loop mode")
+
+    def handle(self, *args, **options):
+        while True:
+            # Cleared before scoring, so a weight changed during the run triggers another one.
+            if not options["loop"] or cache.delete(RESCORE_PENDING_CACHE_KEY):
+                changed = rescore(batch_size=options["batch_size"])
+                self.stdout.write(self.style.SUCCESS(f"{changed} player points changed."))
+            if not options["loop"]:
+                break
+            time.sleep(options["interval"])
@@ -0,0 +1,21 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from user.settlement import settle_finished_countdowns
+
+
+class Command(BaseCommand):
+    help = "Settles finished countdowns, safe to run from a scheduler as often as needed"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--loop", action="store_true", help="Keep settling until the process is stopped")
+        parser.add_argument("--interval", type=float, default=30, help="Seconds between two settlement runs")
+
+    def handle(self, *args, **options):
+        while True:
+            for countdown in settle_finished_countdowns():
+                self.stdout.write(self.style.SUCCESS(f"Count down {countdown.id} settled."))
+            if not options["loop"]:
+                break
+            time.sleep(options["interval"])
@@ -1,12 +1,18 @@
 from django.utils.deprecation import MiddlewareMixin
-from .backends import TokenAuthenticationBackend
+
+from user.models import Player
 
 
 class TokenAuthMiddleware(MiddlewareMixin):
+    """
+        Resolve the player of the token header once per request, UserTokenAuthentication reuses request.player
+    """
+
     def process_request(self, request):
+        request.player = None
         auth_header = request.headers.get('Authorization')
         if auth_header and auth_header.startswith('token '):
             token = auth_header.split(' ')[1]  # Extract token part
-            backend = TokenAuthenticationBackend()
-            user = backend.authenticate(request, token=token)
-            request.user = user
+            request.player = Player.from_token(token)
+            request.auth_token = token
+            request.user = request.player
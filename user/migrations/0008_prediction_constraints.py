@@ -0,0 +1,47 @@
+# Generated by Django 5.1.5 on 2026-10-18 12:09
+
+import django.db.models.functions.comparison
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('user', '0007_alter_referral_referrer'),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            sql="""
+            UPDATE prediction SET is_active = FALSE WHERE id IN (
+                SELECT id FROM (
+                    SELECT id, row_number() OVER (PARTITION BY player_id, countdown_id, slot
+                                                  ORDER BY insert_dt DESC, id DESC) AS row_number
+                    FROM prediction WHERE is_active
+                ) duplicated WHERE row_number > 1
+            );
+            UPDATE prediction SET is_active = FALSE WHERE id IN (
+                SELECT id FROM (
+                    SELECT id, row_number() OVER (PARTITION BY player_id, countdown_id,
+                                                               LEAST(dice_number1, dice_number2),
+                                                               GREATEST(dice_number1, dice_number2)
+                                                  ORDER BY insert_dt DESC, id DESC) AS row_number
+                    FROM prediction WHERE is_active
+                ) duplicated WHERE row_number > 1
+            );
+            """,
+            reverse_sql=migrations.RunSQL.noop,
+        ),
+        migrations.AddConstraint(
+            model_name='prediction',
+            constraint=models.CheckConstraint(condition=models.Q(('slot__gte', 1), ('slot__lte', 21)), name='prediction_slot_range'),
+        ),
+        migrations.AddConstraint(
+            model_name='prediction',
+            constraint=models.UniqueConstraint(condition=models.Q(('is_active', True)), fields=('player', 'countdown', 'slot'), name='prediction_active_slot_unique'),
+        ),
+        migrations.AddConstraint(
+            model_name='prediction',
+            constraint=models.UniqueConstraint(models.F('player'), models.F('countdown'), django.db.models.functions.comparison.Least('dice_number1', 'dice_number2'), django.db.models.functions.comparison.Greatest('dice_number1', 'dice_number2'), condition=models.Q(('is_active', True)), name='prediction_active_pair_unique'),
+        ),
+    ]
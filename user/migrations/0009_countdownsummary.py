@@ -0,0 +1,55 @@
+# Generated by Django 5.1.5 on 2026-10-18 12:14
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, Q
+from django.db.models.functions import Least, Greatest
+
+
+def backfill_summaries(apps, schema_editor):
+    CountDown = apps.get_model('user', 'CountDown')
+    CountDownSummary = apps.get_model('user', 'CountDownSummary')
+    Prediction = apps.get_model('user', 'Prediction')
+    for countdown in CountDown.objects.filter(has_end=True):
+        predictions = Prediction.objects.filter(countdown=countdown, is_active=True)
+        totals = predictions.aggregate(winner_count=Count('player', filter=Q(is_win=True), distinct=True),
+                                       participant_count=Count('player', distinct=True),
+                                       prediction_count=Count('id'))
+        pair_distribution = {f"{low}-{high}": 0 for low in range(1, 7) for high in range(low, 7)}
+        pairs = predictions.values(low=Least('dice_number1', 'dice_number2'),
+                                   high=Greatest('dice_number1', 'dice_number2')).annotate(total=Count('id'))
+        for pair in pairs:
+            pair_distribution[f"{pair['low']}-{pair['high']}"] = pair['total']
+        winner_amount = countdown.amount / totals['winner_count'] if totals['winner_count'] and countdown.amount else 0
+        CountDownSummary.objects.create(countdown=countdown, winner_amount=winner_amount,
+                                        pair_distribution=pair_distribution, **totals)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('user', '0008_prediction_constraints'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CountDownSummary',
+            fields=[
+                ('is_active', models.BooleanField(default=True, verbose_name='is active')),
+                ('insert_dt', models.DateTimeField(auto_now_add=True, verbose_name='insert time')),
+                ('update_dt', models.DateTimeField(auto_now=True, verbose_name='update time')),
+                ('countdown', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='summary', serialize=False, to='user.countdown')),
+                ('winner_count', models.PositiveIntegerField(default=0)),
+                ('winner_amount', models.FloatField(default=0)),
+                ('participant_count', models.PositiveIntegerField(default=0)),
+                ('prediction_count', models.PositiveIntegerField(default=0)),
+                ('pair_distribution', models.JSONField(default=dict)),
+            ],
+            options={
+                'verbose_name': 'CountDownSummary',
+                'verbose_name_plural': 'CountDownSummaries',
+                'db_table': 'countdown_summary',
+            },
+        ),
+        migrations.RunPython(backfill_summaries, migrations.RunPython.noop),
+    ]
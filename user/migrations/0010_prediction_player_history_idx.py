@@ -0,0 +1,20 @@
+# Generated by Django 5.1.5 on 2026-10-18 12:16
+
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    # The prediction table is the largest one, the index is built without blocking writes
+    atomic = False
+
+    dependencies = [
+        ('user', '0009_countdownsummary'),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name='prediction',
+            index=models.Index(fields=['player', '-insert_dt', '-id'], include=('dice_number1', 'dice_number2', 'slot', 'is_win', 'is_active'), name='prediction_player_history_idx'),
+        ),
+    ]
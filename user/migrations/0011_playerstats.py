@@ -0,0 +1,52 @@
+# Generated by Django 5.1.5 on 2026-10-18 12:19
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+BACKFILL_SQL = """
+INSERT INTO player_stats (player_id, prediction_count, win_count, referral_count, wallet, mini_app, point,
+                          is_active, insert_dt, update_dt)
+SELECT player.telegram_id, COALESCE(predictions.total, 0), COALESCE(predictions.wins, 0),
+       COALESCE(referrals.total, 0), player.wallet_address IS NOT NULL, player.auth_token IS NOT NULL,
+       5 + 10 * (player.auth_token IS NOT NULL)::int + 500 * (player.wallet_address IS NOT NULL)::int +
+       50 * COALESCE(predictions.wins, 0) + COALESCE(predictions.total, 0) + 5 * COALESCE(referrals.total, 0),
+       TRUE, now(), now()
+FROM player
+LEFT JOIN (SELECT player_id, COUNT(*) AS total, COUNT(*) FILTER (WHERE is_win) AS wins
+           FROM prediction GROUP BY player_id) AS predictions ON predictions.player_id = player.telegram_id
+LEFT JOIN (SELECT referrer_id, COUNT(*) AS total
+           FROM user_referral GROUP BY referrer_id) AS referrals ON referrals.referrer_id = player.telegram_id
+ON CONFLICT (player_id) DO NOTHING
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('user', '0010_prediction_player_history_idx'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PlayerStats',
+            fields=[
+                ('is_active', models.BooleanField(default=True, verbose_name='is active')),
+                ('insert_dt', models.DateTimeField(auto_now_add=True, verbose_name='insert time')),
+                ('update_dt', models.DateTimeField(auto_now=True, verbose_name='update time')),
+                ('player', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stats', serialize=False, to='user.player')),
+                ('prediction_count', models.PositiveIntegerField(default=0)),
+                ('win_count', models.PositiveIntegerField(default=0)),
+                ('referral_count', models.PositiveIntegerField(default=0)),
+                ('wallet', models.BooleanField(default=False)),
+                ('mini_app', models.BooleanField(default=False)),
+                ('point', models.PositiveIntegerField(db_index=True, default=0)),
+            ],
+            options={
+                'verbose_name': 'PlayerStats',
+                'verbose_name_plural': 'PlayerStats',
+                'db_table': 'player_stats',
+            },
+        ),
+        migrations.RunSQL(BACKFILL_SQL, migrations.RunSQL.noop),
+    ]
@@ -0,0 +1,50 @@
+# Generated by Django 5.1.5 on 2026-10-18 12:20
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('user', '0011_playerstats'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LeaderboardSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('is_active', models.BooleanField(default=True, verbose_name='is active')),
+                ('insert_dt', models.DateTimeField(auto_now_add=True, verbose_name='insert time')),
+                ('update_dt', models.DateTimeField(auto_now=True, verbose_name='update time')),
+                ('bucket', models.CharField(max_length=32, unique=True)),
+                ('player_count', models.PositiveIntegerField(default=0)),
+                ('entries', models.JSONField(default=list)),
+            ],
+            options={
+                'verbose_name': 'LeaderboardSnapshot',
+                'verbose_name_plural': 'LeaderboardSnapshots',
+                'db_table': 'leaderboard_snapshot',
+            },
+        ),
+        migrations.CreateModel(
+            name='LeaderboardWindowPoint',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('is_active', models.BooleanField(default=True, verbose_name='is active')),
+                ('insert_dt', models.DateTimeField(auto_now_add=True, verbose_name='insert time')),
+                ('update_dt', models.DateTimeField(auto_now=True, verbose_name='update time')),
+                ('bucket', models.CharField(max_length=32)),
+                ('point', models.PositiveIntegerField(default=0)),
+                ('player', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='window_points', to='user.player')),
+            ],
+            options={
+                'verbose_name': 'LeaderboardWindowPoint',
+                'verbose_name_plural': 'LeaderboardWindowPoints',
+                'db_table': 'leaderboard_window_point',
+                'indexes': [models.Index(fields=['bucket', '-point'], name='leaderboard_window_point_idx')],
+                'constraints': [models.UniqueConstraint(fields=('bucket', 'player'), name='leaderboard_window_point_unique')],
+            },
+        ),
+    ]
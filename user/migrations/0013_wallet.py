@@ -0,0 +1,58 @@
+# Generated by Django 5.1.5 on 2026-10-18 12:23
+
+import django.contrib.postgres.fields
+from django.db import migrations, models
+from pytonlib.utils.address import detect_address
+
+
+def normalize(address):
+    try:
+        raw_form = detect_address(address.strip())["raw_form"]
+    except Exception:
+        return address.strip()
+    workchain, _, account = raw_form.partition(":")
+    return f"{workchain}:{account.lower()}"
+
+
+def backfill_wallets(apps, schema_editor):
+    Player = apps.get_model('user', 'Player')
+    Wallet = apps.get_model('user', 'Wallet')
+    wallets = {}
+    players = Player.objects.filter(wallet_address__isnull=False).values_list(
+        'telegram_id', 'wallet_address', 'wallet_insert_dt', 'insert_dt')
+    for telegram_id, wallet_address, wallet_insert_dt, insert_dt in players.iterator(chunk_size=10000):
+        seen_dt = wallet_insert_dt or insert_dt
+        wallet = wallets.setdefault(normalize(wallet_address), Wallet(address=normalize(wallet_address),
+                                                                      first_seen_dt=seen_dt))
+        wallet.first_seen_dt = min(wallet.first_seen_dt, seen_dt)
+        wallet.player_ids.append(telegram_id)
+        wallet.player_count += 1
+    Wallet.objects.bulk_create(wallets.values(), batch_size=10000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('user', '0012_leaderboard_windows'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Wallet',
+            fields=[
+                ('is_active', models.BooleanField(default=True, verbose_name='is active')),
+                ('insert_dt', models.DateTimeField(auto_now_add=True, verbose_name='insert time')),
+                ('update_dt', models.DateTimeField(auto_now=True, verbose_name='update time')),
+                ('address', models.CharField(max_length=255, primary_key=True, serialize=False)),
+                ('first_seen_dt', models.DateTimeField(db_index=True)),
+                ('player_count', models.PositiveIntegerField(default=0)),
+                ('player_ids', django.contrib.postgres.fields.ArrayField(base_field=models.BigIntegerField(), default=list, size=None)),
+            ],
+            options={
+                'verbose_name': 'Wallet',
+                'verbose_name_plural': 'Wallets',
+                'db_table': 'wallet',
+            },
+        ),
+        migrations.RunPython(backfill_wallets, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,64 @@
+# Generated by Django 5.1.5 on 2026-10-18 12:24
+
+import django.db.models.expressions
+import django.db.models.functions.comparison
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    """
+        Adding the stored pair_code column rewrites the prediction table under an ACCESS EXCLUSIVE lock,
+        reads and writes of predictions wait for the whole rewrite, so run it outside of a countdown.
+        The indexes are built concurrently afterwards, the new pair index is swapped in for the old one
+        only once it is built, so duplicates can not slip in between.
+    """
+    atomic = False
+
+    dependencies = [
+        ('user', '0013_wallet'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='countdown',
+            name='pair_code',
+            field=models.GeneratedField(db_persist=True, expression=django.db.models.expressions.CombinedExpression(django.db.models.expressions.CombinedExpression(django.db.models.expressions.CombinedExpression(django.db.models.expressions.CombinedExpression(django.db.models.expressions.CombinedExpression(django.db.models.functions.comparison.Least('dice_number1', 'dice_number2'), '-', models.Value(1)), '*', django.db.models.expressions.CombinedExpression(models.Value(14), '-', django.db.models.functions.comparison.Least('dice_number1', 'dice_number2'))), '/', models.Value(2)), '+', django.db.models.functions.comparison.Greatest('dice_number1', 'dice_number2')), '-', django.db.models.functions.comparison.Least('dice_number1', 'dice_number2')), output_field=models.PositiveSmallIntegerField(null=True)),
+        ),
+        migrations.AddField(
+            model_name='prediction',
+            name='pair_code',
+            field=models.GeneratedField(db_persist=True, expression=django.db.models.expressions.CombinedExpression(django.db.models.expressions.CombinedExpression(django.db.models.expressions.CombinedExpression(django.db.models.expressions.CombinedExpression(django.db.models.expressions.CombinedExpression(django.db.models.functions.comparison.Least('dice_number1', 'dice_number2'), '-', models.Value(1)), '*', django.db.models.expressions.CombinedExpression(models.Value(14), '-', django.db.models.functions.comparison.Least('dice_number1', 'dice_number2'))), '/', models.Value(2)), '+', django.db.models.functions.comparison.Greatest('dice_number1', 'dice_number2')), '-', django.db.models.functions.comparison.Least('dice_number1', 'dice_number2')), output_field=models.PositiveSmallIntegerField()),
+        ),
+        AddIndexConcurrently(
+            model_name='prediction',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['countdown', 'pair_code'], name='prediction_countdown_pair_idx'),
+        ),
+        migrations.SeparateDatabaseAndState(
+            database_operations=[
+                migrations.RunSQL(
+                    sql="CREATE UNIQUE INDEX CONCURRENTLY prediction_active_pair_code_unique "
+                        "ON prediction (player_id, countdown_id, pair_code) WHERE is_active",
+                    reverse_sql="DROP INDEX CONCURRENTLY IF EXISTS prediction_active_pair_code_unique",
+                ),
+                migrations.RunSQL(
+                    sql="DROP INDEX prediction_active_pair_unique; "
+                        "ALTER INDEX prediction_active_pair_code_unique RENAME TO prediction_active_pair_unique",
+                    reverse_sql="ALTER INDEX prediction_active_pair_unique RENAME TO prediction_active_pair_code_unique; "
+                                "CREATE UNIQUE INDEX prediction_active_pair_unique ON prediction "
+                                "(player_id, countdown_id, LEAST(dice_number1, dice_number2), "
+                                "GREATEST(dice_number1, dice_number2)) WHERE is_active",
+                ),
+            ],
+            state_operations=[
+                migrations.RemoveConstraint(
+                    model_name='prediction',
+                    name='prediction_active_pair_unique',
+                ),
+                migrations.AddConstraint(
+                    model_name='prediction',
+                    constraint=models.UniqueConstraint(condition=models.Q(('is_active', True)), fields=('player', 'countdown', 'pair_code'), name='prediction_active_pair_unique'),
+                ),
+            ],
+        ),
+    ]
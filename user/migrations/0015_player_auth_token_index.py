@@ -0,0 +1,18 @@
+# Generated by Django 5.1.5 on 2026-10-18 12:27
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('user', '0014_pair_code'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='player',
+            name='auth_token',
+            field=models.CharField(blank=True, db_index=True, max_length=255, null=True),
+        ),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 5.1.5 on 2026-10-18 12:28
+
+import django.db.models.deletion
+import utils.server_utils
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('user', '0015_player_auth_token_index'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='player',
+            name='auth_token',
+        ),
+        migrations.CreateModel(
+            name='PlayerToken',
+            fields=[
+                ('is_active', models.BooleanField(default=True, verbose_name='is active')),
+                ('insert_dt', models.DateTimeField(auto_now_add=True, verbose_name='insert time')),
+                ('update_dt', models.DateTimeField(auto_now=True, verbose_name='update time')),
+                ('key', models.CharField(max_length=64, primary_key=True, serialize=False)),
+                ('device', models.CharField(blank=True, default='', max_length=255)),
+                ('expire_dt', models.DateTimeField(db_index=True, default=utils.server_utils.token_expire_dt_generator)),
+                ('player', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='tokens', to='user.player')),
+            ],
+            options={
+                'verbose_name': 'PlayerToken',
+                'verbose_name_plural': 'PlayerTokens',
+                'db_table': 'player_token',
+                'constraints': [models.UniqueConstraint(fields=('player', 'device'), name='player_token_device_unique')],
+            },
+        ),
+    ]
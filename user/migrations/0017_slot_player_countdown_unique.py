@@ -0,0 +1,27 @@
+# Generated by Django 5.1.5 on 2026-10-18 12:38
+
+from django.db import migrations, models
+
+# Keep the largest slot count of every player and countdown before they become unique
+DEDUPLICATE_SQL = """
+DELETE FROM slot duplicate
+USING slot kept
+WHERE duplicate.player_id = kept.player_id
+  AND duplicate.countdown_id = kept.countdown_id
+  AND (duplicate.number < kept.number OR (duplicate.number = kept.number AND duplicate.id < kept.id))
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('user', '0016_playertoken'),
+    ]
+
+    operations = [
+        migrations.RunSQL(DEDUPLICATE_SQL, migrations.RunSQL.noop),
+        migrations.AddConstraint(
+            model_name='slot',
+            constraint=models.UniqueConstraint(fields=('player', 'countdown'), name='slot_player_countdown_unique'),
+        ),
+    ]
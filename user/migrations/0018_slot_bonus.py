@@ -0,0 +1,41 @@
+# Generated by Django 5.1.5 on 2026-10-18 12:42
+
+import django.core.validators
+from django.db import migrations, models
+
+# Keep only the part of every slot count the countdown's referrals do not explain, then drop the rows left with none
+BONUS_SQL = """
+UPDATE slot
+SET number = GREATEST(slot.number - 1 - (
+    SELECT count(*)
+    FROM user_referral
+    JOIN countdown_result slot_countdown ON slot_countdown.id = slot.countdown_id
+    WHERE user_referral.referrer_id = slot.player_id
+      AND user_referral.insert_dt <= slot_countdown.expire_dt
+      AND user_referral.insert_dt > COALESCE(
+          (SELECT max(previous.expire_dt) FROM countdown_result previous
+           WHERE previous.expire_dt < slot_countdown.expire_dt), '-infinity'::timestamptz)
+), 0);
+DELETE FROM slot WHERE number = 0;
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('user', '0017_slot_player_countdown_unique'),
+    ]
+
+    operations = [
+        migrations.RunSQL(BONUS_SQL, migrations.RunSQL.noop),
+        migrations.RenameField(
+            model_name='slot',
+            old_name='number',
+            new_name='bonus',
+        ),
+        migrations.AlterField(
+            model_name='slot',
+            name='bonus',
+            field=models.PositiveSmallIntegerField(default=1, validators=[django.core.validators.MinValueValidator(1), django.core.validators.MaxValueValidator(20)]),
+        ),
+    ]
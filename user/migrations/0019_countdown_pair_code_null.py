@@ -0,0 +1,25 @@
+# Generated by Django 5.1.5 on 2026-10-18 12:54
+
+import django.db.models.expressions
+import django.db.models.functions.comparison
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('user', '0018_slot_bonus'),
+    ]
+
+    # Generated fields cannot be altered in place, the column is dropped and added back
+    operations = [
+        migrations.RemoveField(
+            model_name='countdown',
+            name='pair_code',
+        ),
+        migrations.AddField(
+            model_name='countdown',
+            name='pair_code',
+            field=models.GeneratedField(db_persist=True, expression=models.Case(models.When(models.Q(('dice_number1__isnull', False), ('dice_number2__isnull', False)), then=django.db.models.expressions.CombinedExpression(django.db.models.expressions.CombinedExpression(django.db.models.expressions.CombinedExpression(django.db.models.expressions.CombinedExpression(django.db.models.expressions.CombinedExpression(django.db.models.functions.comparison.Least('dice_number1', 'dice_number2'), '-', models.Value(1)), '*', django.db.models.expressions.CombinedExpression(models.Value(14), '-', django.db.models.functions.comparison.Least('dice_number1', 'dice_number2'))), '/', models.Value(2)), '+', django.db.models.functions.comparison.Greatest('dice_number1', 'dice_number2')), '-', django.db.models.functions.comparison.Least('dice_number1', 'dice_number2')))), output_field=models.PositiveSmallIntegerField(null=True)),
+        ),
+    ]
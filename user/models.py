@@ -1,14 +1,52 @@
+import datetime
+import hashlib
 import random
 import string
 
+from django.conf import settings
+from django.contrib.postgres.fields import ArrayField
+from django.core.cache import cache
 from django.core.validators import MinValueValidator, MaxValueValidator
-from django.db import models
+from django.db import models, connection, transaction, IntegrityError
+from django.db.models.functions import Least, Greatest
 from django.utils import timezone
 from django.utils.functional import cached_property
 from django_autoutils.model_utils import AbstractModel
+from django_redis import get_redis_connection
+from pytonlib.utils.address import detect_address
 
-from django.db.models import F, Count, IntegerField, Case, When, Value
-from utils.server_utils import calculate_player_point
+from django.db.models import Q, Count, Case, When
+from user.cache import local_cache, seconds_until, tiered_get, tiered_set, tiered_delete
+from user.leaderboard import Leaderboard
+from user.scoring import get_point_weights, point_params, point_sql
+from utils.server_utils import token_generator, token_expire_dt_generator
+
+ACTIVE_COUNTDOWN_CACHE_KEY = 'countdown:active'
+COUNTDOWN_LIST_VERSION_KEY = 'countdown:list:version'
+PREDICTION_BOARD_CACHE_KEY = 'prediction:board:{player_id}:{countdown_id}'
+PREDICTION_PICKS_KEY = 'prediction:picks:{countdown_id}:{player_id}'
+PREDICTION_BUFFER_KEY = 'prediction:buffer:{countdown_id}'
+PREDICTION_DEAD_LETTER_KEY = 'prediction:dead:{countdown_id}'
+PLAYER_CACHE_KEY = 'player:{player_id}'
+WINNERS_CACHE_KEY = 'winners:{countdown_id}:{distinct_players}'
+PLAYER_TOKEN_CACHE_KEY = 'player:token:{key}'
+SLOT_COUNT_CACHE_KEY = 'slot:count:{countdown_id}:{player_id}'
+
+# Unordered dice pairs in pair code order, (1, 1) is 0 and (6, 6) is 20
+DICE_PAIRS = [(low, high) for low in range(1, 7) for high in range(low, 7)]
+
+
+def pair_code(dice_number1, dice_number2):
+    """
+        Canonical code of an unordered dice pair, its index in DICE_PAIRS
+    """
+    low, high = min(dice_number1, dice_number2), max(dice_number1, dice_number2)
+    return (low - 1) * (14 - low) // 2 + high - low
+
+
+def pair_code_expression(dice_number1, dice_number2):
+    low, high = Least(dice_number1, dice_number2), Greatest(dice_number1, dice_number2)
+    return (low - 1) * (14 - low) / 2 + high - low
 
 
 class Player(AbstractModel):
@@ -17,7 +55,6 @@ class Player(AbstractModel):
     first_name = models.CharField(max_length=255, null=True, blank=True)
     last_name = models.CharField(max_length=255, null=True, blank=True)
     telegram_language_code = models.CharField(max_length=16, default='en')
-    auth_token = models.CharField(max_length=255, null=True, blank=True)
     wallet_address = models.CharField(max_length=255, null=True, blank=True)
     wallet_insert_dt = models.DateTimeField(blank=True, null=True)
     referral_code = models.CharField(max_length=255, unique=True, null=True, blank=True)
@@ -36,49 +73,166 @@ class Player(AbstractModel):
         verbose_name = 'Player'
         verbose_name_plural = 'Players'
 
+    def save(self, *args, **kwargs):
+        adding = self._state.adding
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            if adding:
+                PlayerStats.record({self.telegram_id: {"wallet": self.wallet_address is not None}})
+            tiered_delete(PLAYER_CACHE_KEY.format(player_id=self.telegram_id))
+
+    def delete(self, *args, **kwargs):
+        Leaderboard.remove(self.telegram_id)
+        tiered_delete(PLAYER_CACHE_KEY.format(player_id=self.telegram_id))
+        with transaction.atomic():
+            if self.wallet_address is not None:
+                Wallet.unlink(self.wallet_address, self.telegram_id)
+            return super().delete(*args, **kwargs)
+
     @cached_property
     def available_slots(self):
-        return Slot.get_slot(self)
+        return Slot.count(self.telegram_id, CountDown.get_active_countdown())
 
     @cached_property
     def point(self):
-        wallet = self.wallet_address is not None
-        win = self.predictions.filter(is_win=True).count()
-        prediction = self.predictions.count()
-        referral_count = self.get_referrals().count()
-        mini_app = self.auth_token is not None
-        return calculate_player_point(wallet, win, prediction, referral_count, mini_app)
-
-    @staticmethod
-    def players_with_point_value(queryset):
-        return queryset.prefetch_related("predictions", "refers").annotate(
-            wallet=Case(
-                When(wallet_address__isnull=False, then=Value(1)),
-                default=Value(0),
-                output_field=IntegerField()
-            ),
-            win=Count('predictions', filter=F('predictions__is_win'), distinct=True),
-            prediction=Count('predictions', distinct=True),
-            referral_count=Count('refers', distinct=True),
-            mini_app=Case(
-                When(auth_token__isnull=False, then=Value(1)),
-                default=Value(0),
-                output_field=IntegerField()
+        return self.stats.point
+
+    @staticmethod
+    def telegram_login(telegram_user, device=''):
+        """
+            Create or update the player of a Telegram user dict and issue a token for the device with one
+            statement, returns the raw token. Only the first login of a player writes its stats.
+        """
+        token = token_generator()
+        player_id = int(telegram_user["id"])
+        now = timezone.now()
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(
+                """
+                WITH previous_token AS (
+                    SELECT key FROM player_token WHERE player_id = %(player)s AND device = %(device)s
+                ), stats AS (
+                    SELECT mini_app FROM player_stats WHERE player_id = %(player)s
+                ), stored_player AS (
+                    INSERT INTO player AS stored (telegram_id, first_name, last_name, telegram_username,
+                                                  telegram_language_code, is_active, insert_dt, update_dt)
+                    VALUES (%(player)s, %(first_name)s, %(last_name)s, %(username)s, %(language_code)s, TRUE,
+                            %(now)s, %(now)s)
+                    ON CONFLICT (telegram_id) DO UPDATE
+                    SET first_name = COALESCE(EXCLUDED.first_name, stored.first_name),
+                        last_name = COALESCE(EXCLUDED.last_name, stored.last_name),
+                        telegram_username = COALESCE(EXCLUDED.telegram_username, stored.telegram_username),
+                        update_dt = EXCLUDED.update_dt
+                    RETURNING telegram_id
+                ), stored_token AS (
+                    INSERT INTO player_token (key, player_id, device, expire_dt, is_active, insert_dt, update_dt)
+                    SELECT %(key)s, telegram_id, %(device)s, %(expire_dt)s, TRUE, %(now)s, %(now)s
+                    FROM stored_player
+                    ON CONFLICT (player_id, device) DO UPDATE
+                    SET key = EXCLUDED.key, expire_dt = EXCLUDED.expire_dt, update_dt = EXCLUDED.update_dt
+                )
+                SELECT (SELECT key FROM previous_token), COALESCE((SELECT mini_app FROM stats), FALSE)
+                """,
+                {"player": player_id, "device": device, "key": PlayerToken.hash(token),
+                 "expire_dt": token_expire_dt_generator(), "now": now,
+                 "first_name": telegram_user.get("first_name") or None,
+                 "last_name": telegram_user.get("last_name") or None,
+                 "username": telegram_user.get("username") or None,
+                 "language_code": telegram_user.get("language_code") or 'en'}
             )
-        ).annotate(
-            point_value=(
-                    5 +
-                    (10 * F('mini_app')) +
-                    (500 * F('wallet')) +
-                    (50 * F('win')) +
-                    F('prediction') +
-                    (5 * F('referral_count'))
+            previous_key, mini_app = cursor.fetchone()
+            if previous_key is not None:
+                tiered_delete(PLAYER_TOKEN_CACHE_KEY.format(key=previous_key))
+            tiered_delete(PLAYER_CACHE_KEY.format(player_id=player_id))
+            if not mini_app:
+                PlayerStats.record({player_id: {"mini_app": True}})
+        return token
+
+    @staticmethod
+    def upsert_from_bot(profile, update_profile=True):
+        """
+            Create the player of a bot user, or reactivate it and update its profile, with one statement that only
+            writes when something changed. profile holds telegram_id, telegram_username, first_name, last_name and
+            telegram_language_code, returns (player, created).
+        """
+        fields = Player._meta.concrete_fields
+        columns = ", ".join(field.column for field in fields)
+        updated = ["is_active"] + (["telegram_username", "first_name", "last_name"] if update_profile else [])
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(
+                f"""
+                WITH stored AS (
+                    INSERT INTO player AS current (telegram_id, telegram_username, first_name, last_name,
+                                                   telegram_language_code, is_active, insert_dt, update_dt)
+                    VALUES (%(telegram_id)s, %(telegram_username)s, %(first_name)s, %(last_name)s,
+                            %(telegram_language_code)s, TRUE, %(now)s, %(now)s)
+                    ON CONFLICT (telegram_id) DO UPDATE
+                    SET {", ".join(f"{column} = EXCLUDED.{column}" for column in updated)},
+                        update_dt = EXCLUDED.update_dt
+                    WHERE ({", ".join(f"current.{column}" for column in updated)})
+                          IS DISTINCT FROM ({", ".join(f"EXCLUDED.{column}" for column in updated)})
+                    RETURNING {columns}, xmax = 0, TRUE
+                )
+                SELECT * FROM stored
+                UNION ALL
+                SELECT {columns}, FALSE, FALSE FROM player
+                WHERE telegram_id = %(telegram_id)s AND NOT EXISTS (SELECT 1 FROM stored)
+                """,
+                {**profile, "now": timezone.now()}
             )
-        )
+            row = cursor.fetchone()
+            if row is None:
+                # A concurrent first update inserted the row after this statement's snapshot was taken, the
+                # conflict left it unchanged and only a new statement can see it.
+                cursor.execute(f"SELECT {columns}, FALSE, FALSE FROM player WHERE telegram_id = %s",
+                               [profile["telegram_id"]])
+                row = cursor.fetchone()
+            *values, created, written = row
+            if created:
+                PlayerStats.record({profile["telegram_id"]: {}})
+            elif written:
+                tiered_delete(PLAYER_CACHE_KEY.format(player_id=profile["telegram_id"]))
+        return Player.from_db(Player.objects.db, [field.attname for field in fields], values), created
+
+    @staticmethod
+    def cached(player_id):
+        """
+            Player by id or None. The row is cached in redis for AUTH_TOKEN_CACHE_TIMEOUT seconds and in process
+            for AUTH_TOKEN_LOCAL_CACHE_TIMEOUT seconds, every call builds a new instance from it so requests never
+            share one.
+        """
+        key = PLAYER_CACHE_KEY.format(player_id=player_id)
+        field_names = [field.attname for field in Player._meta.concrete_fields]
+        values = tiered_get(key, settings.AUTH_TOKEN_LOCAL_CACHE_TIMEOUT)
+        if values is None or len(values) != len(field_names):
+            values = Player.objects.filter(telegram_id=player_id).values_list(*field_names).first()
+            if values is None:
+                return None
+            tiered_set(key, values, settings.AUTH_TOKEN_CACHE_TIMEOUT, settings.AUTH_TOKEN_LOCAL_CACHE_TIMEOUT)
+        return Player.from_db(Player.objects.db, field_names, values)
+
+    @staticmethod
+    def from_token(token):
+        """
+            Player of a raw token or None once the token is unknown or expired
+        """
+        player_id = PlayerToken.player_id_of(token)
+        if player_id is None:
+            return None
+        return Player.cached(player_id)
 
-    def telegram_login(self):
-        self.auth_token = self.telegram_id
-        self.save()
+    def connect_wallet(self, address):
+        previous_address = self.wallet_address
+        self.wallet_address = address
+        if not self.wallet_insert_dt:
+            self.wallet_insert_dt = timezone.now()
+        with transaction.atomic():
+            self.save(update_fields=['wallet_address', 'wallet_insert_dt', 'update_dt'])
+            if previous_address is not None and Wallet.normalize(previous_address) != Wallet.normalize(address):
+                Wallet.unlink(previous_address, self.telegram_id)
+            Wallet.link(address, self.telegram_id)
+            if previous_address is None:
+                PlayerStats.record({self.telegram_id: {"wallet": True}})
 
     def set_referral_code(self):
         if not self.referral_code:
@@ -93,6 +247,65 @@ class Player(AbstractModel):
         return Referral.objects.filter(referrer=self)
 
 
+class PlayerToken(AbstractModel):
+    """
+        Auth token of a player on one device, only the sha256 of the token is stored
+    """
+    key = models.CharField(max_length=64, primary_key=True)
+    player = models.ForeignKey(Player, on_delete=models.CASCADE, related_name='tokens')
+    device = models.CharField(max_length=255, default='', blank=True)
+    expire_dt = models.DateTimeField(default=token_expire_dt_generator, db_index=True)
+
+    class Meta:
+        db_table = 'player_token'
+        verbose_name = 'PlayerToken'
+        verbose_name_plural = 'PlayerTokens'
+        constraints = [
+            models.UniqueConstraint(fields=['player', 'device'], name='player_token_device_unique'),
+        ]
+
+    def __str__(self):
+        return f"{self.player_id} {self.device}"
+
+    @staticmethod
+    def hash(token):
+        return hashlib.sha256(str(token).encode()).hexdigest()
+
+    @staticmethod
+    def revoke(token):
+        key = PlayerToken.hash(token)
+        PlayerToken.objects.filter(key=key).delete()
+        tiered_delete(PLAYER_TOKEN_CACHE_KEY.format(key=key))
+
+    @staticmethod
+    def player_id_of(token):
+        """
+            Player id of a raw token or None once it is unknown or expired, the (player_id, expire_dt) of the
+            token is cached like Player.cached but never past the token's expiry
+        """
+        key = PlayerToken.hash(token)
+        cache_key = PLAYER_TOKEN_CACHE_KEY.format(key=key)
+        entry = tiered_get(cache_key, settings.AUTH_TOKEN_LOCAL_CACHE_TIMEOUT)
+        if entry is None:
+            entry = PlayerToken.objects.filter(key=key).values_list("player_id", "expire_dt").first()
+            if entry is None:
+                return None
+            timeout = min(settings.AUTH_TOKEN_CACHE_TIMEOUT, seconds_until(entry[1]))
+            if timeout > 0:
+                tiered_set(cache_key, entry, timeout, settings.AUTH_TOKEN_LOCAL_CACHE_TIMEOUT)
+        player_id, expire_dt = entry
+        if expire_dt <= timezone.now():
+            return None
+        return player_id
+
+    @staticmethod
+    def prune():
+        """
+            Delete the expired tokens, returns how many were deleted
+        """
+        return PlayerToken.objects.filter(expire_dt__lte=timezone.now()).delete()[0]
+
+
 class CountDown(AbstractModel):
     expire_dt = models.DateTimeField()
     dice_number1 = models.PositiveSmallIntegerField(validators=[MinValueValidator(1), MaxValueValidator(6)],
@@ -103,6 +316,11 @@ class CountDown(AbstractModel):
                                                     blank=True)
     amount = models.PositiveIntegerField(default=0, null=True, blank=True)
     has_end = models.BooleanField(default=False)
+    # LEAST and GREATEST skip nulls, so the code stays null until both dice are set
+    pair_code = models.GeneratedField(
+        expression=Case(When(Q(dice_number1__isnull=False, dice_number2__isnull=False),
+                             then=pair_code_expression('dice_number1', 'dice_number2'))),
+        output_field=models.PositiveSmallIntegerField(null=True), db_persist=True)
 
     def __str__(self):
         return f"({self.dice_number1} {self.dice_number2}) {self.expire_dt}"
@@ -112,35 +330,96 @@ class CountDown(AbstractModel):
         verbose_name = 'CountDownResult'
         verbose_name_plural = 'CountDownResults'
 
-    @cached_property
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        CountDown.invalidate_cache()
+        if self.has_end:
+            # The amount can be edited after settlement, the summary and the rendered winners follow it
+            summary = CountDownSummary.objects.filter(countdown=self).first()
+            if summary is not None:
+                summary.winner_amount = CountDownSummary.winner_amount_of(self.amount, summary.winner_count)
+                summary.save(update_fields=["winner_amount", "update_dt"])
+            cache.delete_many([WINNERS_CACHE_KEY.format(countdown_id=self.id, distinct_players=distinct_players)
+                               for distinct_players in (0, 1)])
+
+    def delete(self, *args, **kwargs):
+        result = super().delete(*args, **kwargs)
+        CountDown.invalidate_cache()
+        return result
+
+    @property
     def is_finished(self):
         return self.expire_dt <= timezone.now()
 
-    def end_countdown(self):
-        if not self.has_end:
-            predictions_filter = self.predictions.filter(is_active=True)
-            predictions_filter.update(is_win=False)
-            if self.is_finished:
-                self.has_end = True
-                self.save()
-                predictions_filter.filter(dice_number1=self.dice_number1, dice_number2=self.dice_number2).update(
-                    is_win=True)
-                predictions_filter.filter(dice_number1=self.dice_number2, dice_number2=self.dice_number1).update(
-                    is_win=True)
-            else:
-                raise ValueError("Count down time is not finished yet.")
+    def get_buffered_predictions_count(self):
+        return get_redis_connection("default").xlen(PREDICTION_BUFFER_KEY.format(countdown_id=self.id))
 
     def get_won_players_count(self):
         return self.predictions.filter(is_win=True).distinct("player").count()
 
+    def get_winner_amount(self):
+        """
+            Amount each winner receives, read from the summary once the countdown is settled
+        """
+        summary = getattr(self, 'summary', None)
+        if summary is not None:
+            return summary.winner_amount
+        won_count = self.get_won_players_count()
+        if won_count == 0:
+            return 0
+        return self.amount / won_count
+
     @staticmethod
     def get_active_countdown():
-        return CountDown.objects.filter(expire_dt__gte=timezone.now()).order_by('expire_dt').first()
+        """
+            Active countdown cached in process and in redis until its expire_dt
+        """
+        countdown = local_cache.get(ACTIVE_COUNTDOWN_CACHE_KEY)
+        if countdown is not None:
+            return countdown
+        countdown = cache.get(ACTIVE_COUNTDOWN_CACHE_KEY)
+        if countdown is None:
+            countdown = CountDown.objects.filter(expire_dt__gte=timezone.now()).order_by('expire_dt').first()
+            if countdown is None:
+                return None
+            cache.set(ACTIVE_COUNTDOWN_CACHE_KEY, countdown, timeout=seconds_until(countdown.expire_dt))
+        local_expire_dt = timezone.now() + datetime.timedelta(seconds=settings.ACTIVE_COUNTDOWN_LOCAL_CACHE_TIMEOUT)
+        local_cache.set(ACTIVE_COUNTDOWN_CACHE_KEY, countdown, min(countdown.expire_dt, local_expire_dt))
+        return countdown
+
+    @staticmethod
+    async def aget_active_countdown():
+        """
+            get_active_countdown for async views
+        """
+        countdown = local_cache.get(ACTIVE_COUNTDOWN_CACHE_KEY)
+        if countdown is not None:
+            return countdown
+        countdown = await cache.aget(ACTIVE_COUNTDOWN_CACHE_KEY)
+        if countdown is None:
+            countdown = await CountDown.objects.filter(expire_dt__gte=timezone.now()).order_by('expire_dt').afirst()
+            if countdown is None:
+                return None
+            await cache.aset(ACTIVE_COUNTDOWN_CACHE_KEY, countdown, timeout=seconds_until(countdown.expire_dt))
+        local_expire_dt = timezone.now() + datetime.timedelta(seconds=settings.ACTIVE_COUNTDOWN_LOCAL_CACHE_TIMEOUT)
+        local_cache.set(ACTIVE_COUNTDOWN_CACHE_KEY, countdown, min(countdown.expire_dt, local_expire_dt))
+        return countdown
+
+    @staticmethod
+    def invalidate_cache():
+        cache.delete(ACTIVE_COUNTDOWN_CACHE_KEY)
+        local_cache.delete(ACTIVE_COUNTDOWN_CACHE_KEY)
+        cache.add(COUNTDOWN_LIST_VERSION_KEY, 0, timeout=None)
+        cache.incr(COUNTDOWN_LIST_VERSION_KEY)
 
     @staticmethod
     def get_last_countdown():
         return CountDown.objects.filter(expire_dt__lte=timezone.now()).order_by("-expire_dt").first()
 
+    @staticmethod
+    async def aget_last_countdown():
+        return await CountDown.objects.filter(expire_dt__lte=timezone.now()).order_by("-expire_dt").afirst()
+
 
 class Prediction(AbstractModel):
     player = models.ForeignKey(Player, on_delete=models.CASCADE, related_name='predictions')
@@ -149,18 +428,197 @@ class Prediction(AbstractModel):
     is_win = models.BooleanField(default=False)
     countdown = models.ForeignKey(CountDown, on_delete=models.CASCADE, related_name='predictions')
     slot = models.PositiveSmallIntegerField(validators=[MinValueValidator(1), MaxValueValidator(21)], default=1)
+    pair_code = models.GeneratedField(expression=pair_code_expression('dice_number1', 'dice_number2'),
+                                      output_field=models.PositiveSmallIntegerField(), db_persist=True)
 
     def save(self, *args, force_insert=False, force_update=False, using=None, update_fields=None):
         if self.countdown_id is None:
             self.countdown = CountDown.get_active_countdown()
-        Prediction.objects.filter(is_active=True, player=self.player, countdown=self.countdown, slot=self.slot).update(
-            is_active=False)
-        super().save(force_insert, force_update, using, update_fields)
+        adding = self._state.adding
+        with transaction.atomic():
+            # Same counting rule as upsert: a pick that takes the place of an active row is not a new prediction.
+            replaced = Prediction.objects.filter(is_active=True, player=self.player, countdown=self.countdown,
+                                                 slot=self.slot).exclude(pk=self.pk).update(is_active=False)
+            super().save(force_insert, force_update, using, update_fields)
+            if adding and not replaced:
+                PlayerStats.record({self.player_id: {"prediction_count": 1}}, countdown_id=self.countdown_id)
+        Prediction.invalidate_board(self.player_id, self.countdown_id)
+
+    @staticmethod
+    def upsert(rows, replaced=()):
+        """
+            Store (player_id, countdown_id, slot, dice_number1, dice_number2) rows with one upsert statement.
+            Slot availability is checked inside the statement, the duplicate pair and the
+            one-active-row-per-slot rules are enforced by the prediction constraints.
+            Every inserted row adds a prediction to its player's stats, except the rows whose
+            (player_id, countdown_id, slot) is in replaced, which take the place of a row the caller deactivated.
+            Returns the (player_id, countdown_id, slot, id, insert_dt, inserted) of the stored rows and the
+            given rows that were skipped because their slot is not available.
+        """
+        columns = list(zip(*rows))
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(
+                f"""
+                INSERT INTO prediction (is_active, insert_dt, update_dt, player_id, countdown_id,
+                                        dice_number1, dice_number2, slot, is_win)
+                SELECT TRUE, %(now)s, %(now)s, pick.player_id, pick.countdown_id, pick.dice_number1,
+                       pick.dice_number2, pick.slot, FALSE
+                FROM unnest(%(player)s::bigint[], %(countdown)s::bigint[], %(slot)s::smallint[],
+                            %(dice_number1)s::smallint[], %(dice_number2)s::smallint[])
+                     AS pick(player_id, countdown_id, slot, dice_number1, dice_number2)
+                WHERE pick.slot <= {Slot.count_sql('pick.player_id', 'pick.countdown_id')}
+                ON CONFLICT (player_id, countdown_id, slot) WHERE is_active
+                DO UPDATE SET dice_number1 = EXCLUDED.dice_number1,
+                              dice_number2 = EXCLUDED.dice_number2,
+                              update_dt = EXCLUDED.update_dt
+                RETURNING player_id, countdown_id, slot, id, insert_dt, xmax = 0
+                """,
+                {"now": timezone.now(), "player": list(columns[0]), "countdown": list(columns[1]),
+                 "slot": list(columns[2]), "dice_number1": list(columns[3]), "dice_number2": list(columns[4])}
+            )
+            stored = cursor.fetchall()
+            changes = {}
+            for row in stored:
+                if row[5] and row[:3] not in replaced:
+                    player_changes = changes.setdefault(row[1], {}).setdefault(row[0], {"prediction_count": 0})
+                    player_changes["prediction_count"] += 1
+            for countdown_id, countdown_changes in changes.items():
+                PlayerStats.record(countdown_changes, countdown_id=countdown_id)
+            stored_keys = {row[:3] for row in stored}
+            return stored, [row for row in rows if tuple(row[:3]) not in stored_keys]
+
+    @staticmethod
+    def release(rows):
+        """
+            Deactivate the active rows that the (player_id, countdown_id, slot, dice_number1, dice_number2) rows
+            change, so pairs moving between slots of one batch do not collide row by row in upsert.
+            Rows whose slot is not available keep their active row, upsert skips them.
+            Returns the released (player_id, countdown_id, slot) keys, to be passed to upsert as replaced.
+        """
+        columns = list(zip(*rows))
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"""
+                UPDATE prediction SET is_active = FALSE, update_dt = %(now)s
+                FROM unnest(%(player)s::bigint[], %(countdown)s::bigint[], %(slot)s::smallint[],
+                            %(dice_number1)s::smallint[], %(dice_number2)s::smallint[])
+                     AS pick(player_id, countdown_id, slot, dice_number1, dice_number2)
+                WHERE prediction.is_active
+                  AND prediction.player_id = pick.player_id
+                  AND prediction.countdown_id = pick.countdown_id
+                  AND prediction.slot = pick.slot
+                  AND (prediction.dice_number1, prediction.dice_number2) <> (pick.dice_number1, pick.dice_number2)
+                  AND pick.slot <= {Slot.count_sql('pick.player_id', 'pick.countdown_id')}
+                RETURNING prediction.player_id, prediction.countdown_id, prediction.slot
+                """,
+                {"now": timezone.now(), "player": list(columns[0]), "countdown": list(columns[1]),
+                 "slot": list(columns[2]), "dice_number1": list(columns[3]), "dice_number2": list(columns[4])}
+            )
+            return set(cursor.fetchall())
+
+    @staticmethod
+    def submit(player: Player, countdown: CountDown, dice_number1, dice_number2, slot=1):
+        try:
+            stored, _ = Prediction.upsert([(player.telegram_id, countdown.id, slot, dice_number1, dice_number2)])
+        except IntegrityError:
+            raise ValueError("You have predicted this dice before")
+        if not stored:
+            raise ValueError(f"You don't have slot number {slot}")
+        Prediction.invalidate_board(player.telegram_id, countdown.id)
+        return Prediction(id=stored[0][3], insert_dt=stored[0][4], player=player, countdown=countdown,
+                          dice_number1=dice_number1, dice_number2=dice_number2, slot=slot)
+
+    @staticmethod
+    def submit_many(player: Player, countdown: CountDown, picks):
+        """
+            Validate a batch of slot picks together and store the accepted ones with one upsert.
+            Returns a {slot: error message or None} dict.
+        """
+        slot_count = Slot.count(player.telegram_id, countdown)
+        errors = {}
+        accepted = {}
+        for pick in picks:
+            slot = pick.get("slot", 1)
+            if slot in errors or slot in accepted:
+                accepted.pop(slot, None)
+                errors[slot] = f"Slot number {slot} is submitted more than once"
+            elif slot > slot_count:
+                errors[slot] = f"You don't have slot number {slot}"
+            else:
+                accepted[slot] = (pick["dice_number1"], pick["dice_number2"])
+        stored = set()
+        try:
+            with transaction.atomic():
+                active = player.predictions.select_for_update().filter(is_active=True, countdown=countdown)
+                current = {prediction["slot"]: (prediction["dice_number1"], prediction["dice_number2"])
+                           for prediction in active.values("slot", "dice_number1", "dice_number2")}
+                # Reject picks whose pair ends up on another slot too, until the final board is valid.
+                while True:
+                    board = {**current, **accepted}
+                    taken = {}
+                    for slot, pair in board.items():
+                        taken.setdefault(pair_code(*pair), []).append(slot)
+                    duplicated = [slot for slots in taken.values() if len(slots) > 1 for slot in slots
+                                  if slot in accepted]
+                    if not duplicated:
+                        break
+                    for slot in duplicated:
+                        del accepted[slot]
+                        errors[slot] = "You have predicted this dice before"
+                # The final board is valid, but pairs moving between slots collide row by row,
+                # so the touched slots are released first and their picks inserted as fresh rows.
+                changed = {slot: pair for slot, pair in accepted.items() if current.get(slot) != pair}
+                replaced = {(player.telegram_id, countdown.id, slot) for slot in changed if slot in current}
+                active.filter(slot__in=list(changed)).update(is_active=False, update_dt=timezone.now())
+                rows = [(player.telegram_id, countdown.id, slot, pair[0], pair[1]) for slot, pair in changed.items()]
+                stored = {row[2] for row in Prediction.upsert(rows, replaced)[0]} if rows else set()
+                if len(stored) != len(rows):
+                    raise IntegrityError("Slot count changed during the batch")
+                stored.update(accepted)
+        except IntegrityError:
+            # Only a concurrent submit of the same player can get here, none of the batch was stored.
+            stored = set()
+            for slot in accepted:
+                errors[slot] = "Your predictions changed meanwhile, please try again"
+        if stored:
+            Prediction.invalidate_board(player.telegram_id, countdown.id)
+        return {slot: errors.get(slot) for slot in [pick.get("slot", 1) for pick in picks]}
+
+    @staticmethod
+    def get_board(player: Player, countdown: CountDown):
+        """
+            Filled and empty slots of the player for the countdown, built from one query
+        """
+        predictions = list(player.predictions.filter(is_active=True, countdown=countdown).order_by("slot").values(
+            "slot", "dice_number1", "dice_number2"))
+        slots = Slot.count(player.telegram_id, countdown)
+        filled = {prediction["slot"] for prediction in predictions}
+        for i in range(1, slots + 1):
+            if i not in filled:
+                predictions.append({"slot": i, "dice_number1": None, "dice_number2": None})
+        return {"predictions": predictions, "slots": slots}
+
+    @staticmethod
+    def invalidate_board(player_id, countdown_id):
+        cache.delete(PREDICTION_BOARD_CACHE_KEY.format(player_id=player_id, countdown_id=countdown_id))
 
     class Meta:
         db_table = 'prediction'
         verbose_name = 'Prediction'
         verbose_name_plural = 'Predictions'
+        constraints = [
+            models.CheckConstraint(condition=Q(slot__gte=1, slot__lte=21), name='prediction_slot_range'),
+            models.UniqueConstraint(fields=['player', 'countdown', 'slot'], condition=Q(is_active=True),
+                                    name='prediction_active_slot_unique'),
+            models.UniqueConstraint(fields=['player', 'countdown', 'pair_code'], condition=Q(is_active=True),
+                                    name='prediction_active_pair_unique'),
+        ]
+        indexes = [
+            models.Index(fields=['countdown', 'pair_code'], condition=Q(is_active=True),
+                         name='prediction_countdown_pair_idx'),
+            models.Index(fields=['player', '-insert_dt', '-id'], name='prediction_player_history_idx',
+                         include=['dice_number1', 'dice_number2', 'slot', 'is_win', 'is_active']),
+        ]
 
 
 class Referral(AbstractModel):
@@ -171,25 +629,417 @@ class Referral(AbstractModel):
     def __str__(self):
         return f"{self.referrer} -> {self.referee}"
 
+    def save(self, *args, **kwargs):
+        adding = self._state.adding
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            if adding:
+                PlayerStats.record({self.referrer_id: {"referral_count": 1}})
+                countdown = CountDown.get_active_countdown()
+                if countdown is not None:
+                    transaction.on_commit(lambda: Slot.invalidate(self.referrer_id, countdown.id))
+
+    @staticmethod
+    def attribute(referral_code, referee_id):
+        """
+            Refer a player by a referral code in one statement: the referral is inserted unless the referee already
+            has one and the referee gets its own referral code. The referrer's slots of the active countdown are
+            derived from its referrals, so only their cached count is dropped.
+            Returns the referrer's id or None if nothing was attributed.
+        """
+        countdown = CountDown.get_active_countdown()
+        countdown_id = countdown.id if countdown is not None else None
+        now = timezone.now()
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(
+                """
+                WITH referee_code AS (
+                    UPDATE player SET referral_code = %(referee_code)s, update_dt = %(now)s
+                    WHERE telegram_id = %(referee)s AND referral_code IS NULL
+                ), referral AS (
+                    INSERT INTO user_referral (referrer_id, referee_id, is_active, insert_dt, update_dt)
+                    SELECT telegram_id, %(referee)s, TRUE, %(now)s, %(now)s
+                    FROM player
+                    WHERE referral_code = %(referral_code)s AND telegram_id <> %(referee)s
+                    ON CONFLICT (referee_id) DO NOTHING
+                    RETURNING referrer_id
+                )
+                SELECT referrer_id FROM referral
+                """,
+                {"referral_code": referral_code, "referee": referee_id, "now": now,
+                 "referee_code": f"{referee_id}{Player.generate_referral_code()}"}
+            )
+            row = cursor.fetchone()
+            tiered_delete(PLAYER_CACHE_KEY.format(player_id=referee_id))
+            if row is None:
+                return None
+            referrer_id = row[0]
+            PlayerStats.record({referrer_id: {"referral_count": 1}})
+            if countdown_id is not None:
+                transaction.on_commit(lambda: Slot.invalidate(referrer_id, countdown_id))
+        return referrer_id
+
 
 class Slot(AbstractModel):
+    """
+        Extra slots granted to a player for one countdown on top of the referral ones,
+        only players with a bonus have a row
+    """
     player = models.ForeignKey(Player, on_delete=models.CASCADE)
     countdown = models.ForeignKey(CountDown, on_delete=models.CASCADE)
-    number = models.PositiveSmallIntegerField(validators=[MinValueValidator(1), MaxValueValidator(21)], default=1)
+    bonus = models.PositiveSmallIntegerField(validators=[MinValueValidator(1), MaxValueValidator(20)], default=1)
 
     class Meta:
         db_table = 'slot'
         verbose_name = 'Slot'
         verbose_name_plural = 'Slots'
+        constraints = [
+            models.UniqueConstraint(fields=['player', 'countdown'], name='slot_player_countdown_unique'),
+        ]
 
     def __str__(self):
-        return str(self.number)
+        return f"+{self.bonus}"
+
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        Slot.invalidate(self.player_id, self.countdown_id)
 
-    def add_slot(self):
-        if self.number < 21:
-            self.number += 1
-            self.save()
+    def delete(self, *args, **kwargs):
+        result = super().delete(*args, **kwargs)
+        Slot.invalidate(self.player_id, self.countdown_id)
+        return result
 
     @staticmethod
-    def get_slot(player: Player):
-        return Slot.objects.get_or_create(player=player, countdown=CountDown.get_active_countdown())[0]
+    def count_sql(player, countdown):
+        """
+            SQL of a player's slots for a countdown over two sql expressions: one, plus the referrals the player
+            made while the countdown was the active one, plus the countdown's bonus, up to 21
+        """
+        return f"""LEAST(1 + (
+                    SELECT count(*)
+                    FROM user_referral
+                    JOIN countdown_result slot_countdown ON slot_countdown.id = {countdown}
+                    WHERE user_referral.referrer_id = {player}
+                      AND user_referral.insert_dt <= slot_countdown.expire_dt
+                      AND user_referral.insert_dt > COALESCE(
+                          (SELECT max(previous.expire_dt) FROM countdown_result previous
+                           WHERE previous.expire_dt < slot_countdown.expire_dt), '-infinity'::timestamptz)
+                ) + COALESCE((SELECT bonus FROM slot
+                              WHERE slot.player_id = {player} AND slot.countdown_id = {countdown}), 0), 21)"""
+
+    @staticmethod
+    def count(player_id, countdown: CountDown):
+        """
+            Slots of a player for a countdown, read without writing anything and cached until the countdown ends
+        """
+        if countdown is None:
+            return 1
+        cache_key = SLOT_COUNT_CACHE_KEY.format(countdown_id=countdown.id, player_id=player_id)
+        number = tiered_get(cache_key, settings.SLOT_COUNT_LOCAL_CACHE_TIMEOUT)
+        if number is None:
+            with connection.cursor() as cursor:
+                cursor.execute(f"SELECT {Slot.count_sql('%(player)s::bigint', '%(countdown)s::bigint')}",
+                               {"player": player_id, "countdown": countdown.id})
+                number = cursor.fetchone()[0]
+            timeout = seconds_until(countdown.expire_dt)
+            if timeout > 0:
+                tiered_set(cache_key, number, timeout, settings.SLOT_COUNT_LOCAL_CACHE_TIMEOUT)
+        return number
+
+    @staticmethod
+    def invalidate(player_id, countdown_id):
+        """
+            Drop the cached prediction board and slot counts of a player's countdown
+        """
+        Prediction.invalidate_board(player_id, countdown_id)
+        tiered_delete(SLOT_COUNT_CACHE_KEY.format(countdown_id=countdown_id, player_id=player_id))
+        get_redis_connection("default").hdel(
+            PREDICTION_PICKS_KEY.format(player_id=player_id, countdown_id=countdown_id), "slots")
+
+
+class CountDownSummary(AbstractModel):
+    countdown = models.OneToOneField(CountDown, on_delete=models.CASCADE, primary_key=True, related_name='summary')
+    winner_count = models.PositiveIntegerField(default=0)
+    winner_amount = models.FloatField(default=0)
+    participant_count = models.PositiveIntegerField(default=0)
+    prediction_count = models.PositiveIntegerField(default=0)
+    pair_distribution = models.JSONField(default=dict)
+
+    class Meta:
+        db_table = 'countdown_summary'
+        verbose_name = 'CountDownSummary'
+        verbose_name_plural = 'CountDownSummaries'
+
+    def __str__(self):
+        return str(self.countdown)
+
+    @staticmethod
+    def create_for(countdown: CountDown):
+        """
+            Aggregate the active predictions of a settled countdown into its summary
+        """
+        predictions = Prediction.objects.filter(countdown=countdown, is_active=True)
+        totals = predictions.aggregate(winner_count=Count('player', filter=Q(is_win=True), distinct=True),
+                                       participant_count=Count('player', distinct=True),
+                                       prediction_count=Count('id'))
+        pair_distribution = {f"{low}-{high}": 0 for low, high in DICE_PAIRS}
+        for pair in predictions.values("pair_code").annotate(total=Count('id')).order_by():
+            low, high = DICE_PAIRS[pair["pair_code"]]
+            pair_distribution[f"{low}-{high}"] = pair['total']
+        winner_amount = CountDownSummary.winner_amount_of(countdown.amount, totals['winner_count'])
+        summary, _ = CountDownSummary.objects.update_or_create(
+            countdown=countdown, defaults=dict(winner_amount=winner_amount, pair_distribution=pair_distribution,
+                                               **totals))
+        return summary
+
+    @staticmethod
+    def winner_amount_of(amount, winner_count):
+        return amount / winner_count if winner_count and amount else 0
+
+
+class PlayerStats(AbstractModel):
+    player = models.OneToOneField(Player, on_delete=models.CASCADE, primary_key=True, related_name='stats')
+    prediction_count = models.PositiveIntegerField(default=0)
+    win_count = models.PositiveIntegerField(default=0)
+    referral_count = models.PositiveIntegerField(default=0)
+    wallet = models.BooleanField(default=False)
+    mini_app = models.BooleanField(default=False)
+    point = models.PositiveIntegerField(default=0, db_index=True)
+
+    COUNTERS = ("prediction_count", "win_count", "referral_count")
+    FLAGS = ("wallet", "mini_app")
+
+    class Meta:
+        db_table = 'player_stats'
+        verbose_name = 'PlayerStats'
+        verbose_name_plural = 'PlayerStats'
+
+    def __str__(self):
+        return f"{self.player_id}: {self.point}"
+
+    @staticmethod
+    def record(changes, countdown_id=None):
+        """
+            Apply a {player_id: {column: change}} dict to the players' stats inside the current transaction,
+            counters grow by their change and flags are set by a True change.
+            The recomputed points go to the leaderboard once the transaction commits and the points of the
+            counters are added to the time windowed leaderboards, including the countdown's if it is given.
+        """
+        if not changes:
+            return
+        weights = get_point_weights()
+        player_ids = list(changes)
+        params = {"now": timezone.now(), "player": player_ids, **point_params(weights)}
+        for column in PlayerStats.COUNTERS:
+            params[column] = [changes[player_id].get(column, 0) for player_id in player_ids]
+        for column in PlayerStats.FLAGS:
+            params[column] = [bool(changes[player_id].get(column, False)) for player_id in player_ids]
+        updated = {column: f"stats.{column} + change.{column}" for column in PlayerStats.COUNTERS}
+        updated.update({column: f"stats.{column} OR change.{column}" for column in PlayerStats.FLAGS})
+        with connection.cursor() as cursor:
+            # Missing rows are created empty first, a single upsert would check a negative change
+            # against the constraints of the row it proposes to insert.
+            cursor.execute(
+                """
+                INSERT INTO player_stats (player_id, prediction_count, win_count, referral_count, wallet, mini_app,
+                                          point, is_active, insert_dt, update_dt)
+                SELECT player_id, 0, 0, 0, FALSE, FALSE, %(weight_base)s, TRUE, %(now)s, %(now)s
+                FROM unnest(%(player)s::bigint[]) AS change(player_id)
+                ON CONFLICT (player_id) DO NOTHING
+                """,
+                params
+            )
+            cursor.execute(
+                f"""
+                UPDATE player_stats AS stats
+                SET {", ".join(f"{column} = {sql}" for column, sql in updated.items())},
+                    point = {point_sql(updated)},
+                    update_dt = %(now)s
+                FROM unnest(%(player)s::bigint[], %(prediction_count)s::int[], %(win_count)s::int[],
+                            %(referral_count)s::int[], %(wallet)s::bool[], %(mini_app)s::bool[])
+                     AS change(player_id, prediction_count, win_count, referral_count, wallet, mini_app)
+                WHERE stats.player_id = change.player_id
+                RETURNING stats.player_id, stats.point
+                """,
+                params
+            )
+            Leaderboard.set_points(dict(cursor.fetchall()))
+        LeaderboardWindowPoint.add({
+            player_id: sum(weights[column] * player_changes.get(column, 0) for column in PlayerStats.COUNTERS)
+            for player_id, player_changes in changes.items()
+        }, countdown_id)
+
+
+class LeaderboardWindowPoint(AbstractModel):
+    """
+        Points a player earned by predictions, wins and referrals inside a leaderboard window,
+        the bucket is one of Leaderboard.day_bucket, week_bucket and countdown_bucket
+    """
+    bucket = models.CharField(max_length=32)
+    player = models.ForeignKey(Player, on_delete=models.CASCADE, related_name='window_points')
+    point = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        db_table = 'leaderboard_window_point'
+        verbose_name = 'LeaderboardWindowPoint'
+        verbose_name_plural = 'LeaderboardWindowPoints'
+        constraints = [
+            models.UniqueConstraint(fields=['bucket', 'player'], name='leaderboard_window_point_unique'),
+        ]
+        indexes = [
+            models.Index(fields=['bucket', '-point'], name='leaderboard_window_point_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.bucket} {self.player_id}: {self.point}"
+
+    @staticmethod
+    def add(points, countdown_id=None):
+        """
+            Add a {player_id: point} dict to today's, this week's and the countdown's windows
+        """
+        points = {player_id: point for player_id, point in points.items() if point}
+        if not points:
+            return
+        buckets = Leaderboard.current_buckets()
+        if countdown_id is not None:
+            buckets.append(Leaderboard.countdown_bucket(countdown_id))
+        with connection.cursor() as cursor:
+            cursor.execute(
+                """
+                INSERT INTO leaderboard_window_point (bucket, player_id, point, is_active, insert_dt, update_dt)
+                SELECT window_bucket.bucket, change.player_id, GREATEST(change.point, 0), TRUE, %(now)s, %(now)s
+                FROM unnest(%(player)s::bigint[], %(point)s::int[]) AS change(player_id, point)
+                CROSS JOIN unnest(%(buckets)s::varchar[]) AS window_bucket(bucket)
+                ON CONFLICT (bucket, player_id) DO UPDATE
+                SET point = GREATEST(leaderboard_window_point.point + EXCLUDED.point, 0),
+                    update_dt = EXCLUDED.update_dt
+                """,
+                {"now": timezone.now(), "player": list(points), "point": list(points.values()), "buckets": buckets}
+            )
+
+    @staticmethod
+    def top(bucket, count=100):
+        """
+            [(player_id, point)] of the best players of the window, read from its snapshot once it is frozen
+        """
+        snapshot = LeaderboardSnapshot.objects.filter(bucket=bucket).only("entries").first()
+        if snapshot is not None:
+            return [tuple(entry) for entry in snapshot.entries[:count]]
+        return list(LeaderboardWindowPoint.objects.filter(bucket=bucket).order_by("-point").values_list(
+            "player_id", "point")[:count])
+
+
+class LeaderboardSnapshot(AbstractModel):
+    """
+        Frozen top players of a closed leaderboard window, entries are [player_id, point] pairs, highest first
+    """
+    bucket = models.CharField(max_length=32, unique=True)
+    player_count = models.PositiveIntegerField(default=0)
+    entries = models.JSONField(default=list)
+
+    class Meta:
+        db_table = 'leaderboard_snapshot'
+        verbose_name = 'LeaderboardSnapshot'
+        verbose_name_plural = 'LeaderboardSnapshots'
+
+    def __str__(self):
+        return self.bucket
+
+    @staticmethod
+    def freeze(bucket, size=1000):
+        """
+            Store the best size players of a closed window in a snapshot and delete its rows.
+            Rows that land in an already frozen window are merged into its snapshot, the points of a player
+            are summed and the best size players are taken again.
+        """
+        with transaction.atomic():
+            rows = LeaderboardWindowPoint.objects.filter(bucket=bucket)
+            late = dict(rows.values_list("player_id", "point"))
+            snapshot = LeaderboardSnapshot.objects.select_for_update().filter(bucket=bucket).first()
+            if snapshot is None:
+                snapshot = LeaderboardSnapshot(bucket=bucket)
+            points = {player_id: point for player_id, point in snapshot.entries}
+            snapshot.player_count += len(late.keys() - points.keys())
+            for player_id, point in late.items():
+                points[player_id] = points.get(player_id, 0) + point
+            snapshot.entries = [list(entry) for entry in
+                                sorted(points.items(), key=lambda entry: entry[1], reverse=True)[:size]]
+            snapshot.save()
+            rows.delete()
+        return snapshot
+
+    @staticmethod
+    def closed_buckets():
+        """
+            Buckets with rows whose window is over, countdown windows close when the countdown is settled
+        """
+        current = set(Leaderboard.current_buckets())
+        buckets = set(LeaderboardWindowPoint.objects.values_list("bucket", flat=True).distinct()) - current
+        settled = {Leaderboard.countdown_bucket(countdown_id) for countdown_id in CountDown.objects.filter(
+            has_end=True, id__in=[Leaderboard.bucket_countdown_id(bucket) for bucket in buckets
+                                  if bucket.startswith("countdown:")]).values_list("id", flat=True)}
+        return sorted(bucket for bucket in buckets if not bucket.startswith("countdown:") or bucket in settled)
+
+
+class Wallet(AbstractModel):
+    """
+        Players linked to each wallet, keyed by the raw form of the address
+    """
+    address = models.CharField(max_length=255, primary_key=True)
+    first_seen_dt = models.DateTimeField(db_index=True)
+    player_count = models.PositiveIntegerField(default=0)
+    player_ids = ArrayField(models.BigIntegerField(), default=list)
+
+    class Meta:
+        db_table = 'wallet'
+        verbose_name = 'Wallet'
+        verbose_name_plural = 'Wallets'
+
+    def __str__(self):
+        return self.address
+
+    @staticmethod
+    def normalize(address):
+        """
+            Raw form (workchain:hex) of a TON address with lowercase hex, so every form of one wallet shares a row.
+            pytonlib keeps the case of a raw address it is given. Addresses it can not parse are only stripped.
+        """
+        try:
+            raw_form = detect_address(address.strip())["raw_form"]
+        except Exception:
+            return address.strip()
+        workchain, _, account = raw_form.partition(":")
+        return f"{workchain}:{account.lower()}"
+
+    @staticmethod
+    def link(address, player_id):
+        now = timezone.now()
+        with connection.cursor() as cursor:
+            cursor.execute(
+                """
+                INSERT INTO wallet AS linked (address, first_seen_dt, player_count, player_ids, is_active, insert_dt,
+                                              update_dt)
+                VALUES (%(address)s, %(now)s, 1, ARRAY[%(player)s]::bigint[], TRUE, %(now)s, %(now)s)
+                ON CONFLICT (address) DO UPDATE
+                SET player_ids = array_append(linked.player_ids, %(player)s::bigint),
+                    player_count = linked.player_count + 1,
+                    update_dt = EXCLUDED.update_dt
+                WHERE NOT %(player)s::bigint = ANY(linked.player_ids)
+                """,
+                {"address": Wallet.normalize(address), "player": player_id, "now": now}
+            )
+
+    @staticmethod
+    def unlink(address, player_id):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                """
+                UPDATE wallet
+                SET player_ids = array_remove(player_ids, %(player)s::bigint),
+                    player_count = player_count - 1,
+                    update_dt = %(now)s
+                WHERE address = %(address)s AND %(player)s::bigint = ANY(player_ids)
+                """,
+                {"address": Wallet.normalize(address), "player": player_id, "now": timezone.now()}
+            )
@@ -0,0 +1,12 @@
+from rest_framework.pagination import CursorPagination
+
+
+class CountdownCursorPagination(CursorPagination):
+    ordering = "-expire_dt"
+    page_size = 20
+
+
+class PredictionCursorPagination(CursorPagination):
+    # Batch submits share one insert_dt, the id keeps the order of their rows stable across pages
+    ordering = ("-insert_dt", "-id")
+    page_size = 50
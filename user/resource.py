@@ -18,6 +18,9 @@ class PredictionResource(resources.ModelResource):
         model = Prediction
         fields = ["player", "insert_dt", "countdown", "dice_number1", "dice_number2", "slot", "is_win", "is_active"]
 
+    def get_queryset(self):
+        return super().get_queryset().select_related("player", "countdown__summary")
+
     def dehydrate_wallet(self, obj: Prediction):
         if obj.player.wallet_address:
             return obj.player.wallet_address
@@ -25,8 +28,7 @@ class PredictionResource(resources.ModelResource):
 
     def dehydrate_amount(self, obj: Prediction):
         if obj.is_win:
-            countdown = obj.countdown
-            return countdown.amount / countdown.get_won_players_count()
+            return obj.countdown.get_winner_amount()
         return 0
 
 
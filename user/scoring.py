@@ -0,0 +1,116 @@
+import datetime
+
+import numpy as np
+from constance import config
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.utils import timezone
+
+from user.cache import local_cache
+from user.leaderboard import Leaderboard
+
+# Constance setting of the weight of each player_stats column, base is the point every player starts with
+POINT_WEIGHT_SETTINGS = {
+    "base": "POINT_BASE",
+    "prediction_count": "POINT_PREDICTION",
+    "win_count": "POINT_WIN",
+    "referral_count": "POINT_REFERRAL",
+    "wallet": "POINT_WALLET",
+    "mini_app": "POINT_MINI_APP",
+}
+POINT_COLUMNS = ("prediction_count", "win_count", "referral_count", "wallet", "mini_app")
+POINT_WEIGHTS_CACHE_KEY = 'point:weights'
+RESCORE_PENDING_CACHE_KEY = 'point:rescore:pending'
+
+
+def get_point_weights():
+    """
+        {column: weight} of the point formula, cached in process for POINT_WEIGHTS_LOCAL_CACHE_TIMEOUT seconds
+    """
+    weights = local_cache.get(POINT_WEIGHTS_CACHE_KEY)
+    if weights is None:
+        weights = {column: getattr(config, setting) for column, setting in POINT_WEIGHT_SETTINGS.items()}
+        local_cache.set(POINT_WEIGHTS_CACHE_KEY, weights,
+                        timezone.now() + datetime.timedelta(seconds=settings.POINT_WEIGHTS_LOCAL_CACHE_TIMEOUT))
+    return weights
+
+
+def point_sql(columns):
+    """
+        SQL of the point formula over a {column: sql expression} dict, the weights come from point_params
+    """
+    terms = [f"%(weight_{column})s * ({columns[column]})::int" for column in POINT_COLUMNS]
+    return " + ".join(["%(weight_base)s"] + terms)
+
+
+def point_params(weights=None):
+    weights = weights or get_point_weights()
+    return {f"weight_{column}": weight for column, weight in weights.items()}
+
+
+def on_config_updated(sender, key, old_value, new_value, **kwargs):
+    """
+        Mark the points as stale when a weight changes, rescore_players --loop picks it up
+    """
+    if key in POINT_WEIGHT_SETTINGS.values():
+        local_cache.delete(POINT_WEIGHTS_CACHE_KEY)
+        cache.set(RESCORE_PENDING_CACHE_KEY, True, timeout=None)
+
+
+def rescore(batch_size=100_000):
+    """
+        Recompute the point of every player_stats row with the current weights.
+        Each batch is loaded into a NumPy array, scored in one vectorized expression and the changed points
+        are written back with one update, which skips rows whose counters changed in the meantime since the
+        event that changed them already stored a point with the current weights.
+        Returns the number of rows whose point changed.
+    """
+    weights = get_point_weights()
+    weight_vector = np.array([weights[column] for column in POINT_COLUMNS], dtype=np.int64)
+    last_player_id = None
+    changed_total = 0
+    while True:
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(
+                f"""
+                SELECT player_id, prediction_count, win_count, referral_count, wallet::int, mini_app::int, point
+                FROM player_stats
+                {"WHERE player_id > %(last)s" if last_player_id is not None else ""}
+                ORDER BY player_id
+                LIMIT %(limit)s
+                """,
+                {"last": last_player_id, "limit": batch_size}
+            )
+            rows = cursor.fetchall()
+            if not rows:
+                break
+            stats = np.array(rows, dtype=np.int64)
+            points = weights["base"] + stats[:, 1:6] @ weight_vector
+            stale = points != stats[:, 6]
+            changed = stats[stale]
+            if len(changed):
+                cursor.execute(
+                    """
+                    UPDATE player_stats
+                    SET point = batch.point
+                    FROM unnest(%(player)s::bigint[], %(point)s::int[], %(prediction_count)s::int[],
+                                %(win_count)s::int[], %(referral_count)s::int[], %(wallet)s::int[],
+                                %(mini_app)s::int[])
+                         AS batch(player_id, point, prediction_count, win_count, referral_count, wallet, mini_app)
+                    WHERE player_stats.player_id = batch.player_id
+                      AND player_stats.prediction_count = batch.prediction_count
+                      AND player_stats.win_count = batch.win_count
+                      AND player_stats.referral_count = batch.referral_count
+                      AND player_stats.wallet::int = batch.wallet
+                      AND player_stats.mini_app::int = batch.mini_app
+                    RETURNING player_stats.player_id, player_stats.point
+                    """,
+                    {"player": changed[:, 0].tolist(), "point": points[stale].tolist(),
+                     **{column: changed[:, index].tolist() for index, column in enumerate(POINT_COLUMNS, start=1)}}
+                )
+                updated = cursor.fetchall()
+                Leaderboard.set_points(dict(updated))
+                changed_total += len(updated)
+        last_player_id = rows[-1][0]
+    return changed_total
@@ -1,6 +1,7 @@
 from rest_framework import serializers
 
-from user.models import Prediction, CountDown, Player, Referral
+from user.leaderboard import Leaderboard
+from user.models import Prediction, CountDown, Player, PlayerStats, Referral, LeaderboardWindowPoint
 
 
 class PredictDiceSerializer(serializers.ModelSerializer):
@@ -19,24 +20,7 @@ class PredictDiceSerializer(serializers.ModelSerializer):
         return obj.player.__str__()
 
     def get_amount(self, obj: Prediction):
-        won_count = obj.countdown.get_won_players_count()
-        if won_count == 0:
-            return 0
-        else:
-            return round(obj.countdown.amount / won_count, 3)
-
-    def is_valid_predict(self, player, countdown):
-        dice_number1 = self.validated_data["dice_number1"]
-        dice_number2 = self.validated_data["dice_number2"]
-        slot = self.validated_data["slot"]
-        if slot > player.available_slots.number:
-            raise ValueError(f"You don't have slot number {slot}")
-        predictions = player.predictions.filter(countdown=countdown, is_active=True)
-        for predict in predictions:
-            if predict.dice_number1 == dice_number1 and predict.dice_number2 == dice_number2:
-                raise ValueError("You have predicted this dice before")
-            if predict.dice_number1 == dice_number2 and predict.dice_number2 == dice_number1:
-                raise ValueError("You've predict this dice before")
+        return round(obj.countdown.get_winner_amount(), 3)
 
 
 class PredictSerializer(serializers.ModelSerializer):
@@ -45,6 +29,16 @@ class PredictSerializer(serializers.ModelSerializer):
         fields = ["slot", "dice_number1", "dice_number2"]
 
 
+class PredictBatchSerializer(serializers.Serializer):
+    predictions = PredictSerializer(many=True, allow_empty=False, max_length=21)
+
+
+class PredictBatchResultSerializer(serializers.Serializer):
+    slot = serializers.IntegerField()
+    success = serializers.BooleanField()
+    error = serializers.CharField(allow_null=True)
+
+
 class PredictBoxSerializer(serializers.Serializer):
     predictions = PredictSerializer(many=True)
     slots = serializers.IntegerField()
@@ -114,15 +108,8 @@ class ReferralsListSerializer(serializers.Serializer):
 
 
 class MissionCheckboxSerializer(serializers.Serializer):
-    has_invite = serializers.SerializerMethodField()
-    has_submit = serializers.SerializerMethodField()
-
-    def get_has_invite(self, obj: Player):
-        return obj.available_slots.number > 1
-
-    def get_has_submit(self, obj: Player):
-        countdown = CountDown.get_active_countdown()
-        return obj.predictions.filter(countdown=countdown, is_active=True).exists()
+    has_invite = serializers.BooleanField()
+    has_submit = serializers.BooleanField()
 
 
 class LeaderboardRowSerializer(serializers.ModelSerializer):
@@ -135,6 +122,39 @@ class LeaderboardSerializer(serializers.Serializer):
     players = serializers.SerializerMethodField()
 
     def get_players(self, obj):
-        queryset = Player.objects.all()
-        players = Player.players_with_point_value(queryset).order_by("-point_value")[:100]
-        return LeaderboardRowSerializer(players, many=True).data
+        bucket = self.context.get("bucket")
+        if bucket is not None:
+            return LeaderboardRowSerializer(leaderboard_players(LeaderboardWindowPoint.top(bucket)), many=True).data
+        if not Leaderboard.is_built():
+            players = [stats.player for stats in PlayerStats.objects.select_related("player").order_by("-point")[:100]]
+            return LeaderboardRowSerializer(players, many=True).data
+        return LeaderboardRowSerializer(leaderboard_players(Leaderboard.top(100)), many=True).data
+
+
+class RankedLeaderboardRowSerializer(LeaderboardRowSerializer):
+    rank = serializers.IntegerField()
+
+    class Meta(LeaderboardRowSerializer.Meta):
+        fields = ["rank"] + LeaderboardRowSerializer.Meta.fields
+
+
+class PlayerRankSerializer(serializers.Serializer):
+    rank = serializers.IntegerField()
+    point = serializers.IntegerField()
+    players = RankedLeaderboardRowSerializer(many=True)
+
+
+def leaderboard_players(entries, first_rank=1):
+    """
+        Players of the [(player_id, point)] leaderboard entries loaded with one query, in the entries' order,
+        with their point and rank set
+    """
+    players = Player.objects.only("telegram_id", "telegram_username", "first_name").in_bulk(
+        [player_id for player_id, _ in entries])
+    rows = []
+    for rank, (player_id, point) in enumerate(entries, start=first_rank):
+        if player_id in players:
+            players[player_id].point = point
+            players[player_id].rank = rank
+            rows.append(players[player_id])
+    return rows
@@ -0,0 +1,72 @@
+import logging
+
+from django.db import connection, transaction
+from django.utils import timezone
+
+from user.models import CountDown, CountDownSummary, PlayerStats
+
+# First key of the postgres advisory lock, the second one is the countdown id
+SETTLEMENT_LOCK_NAMESPACE = 1001
+
+logger = logging.getLogger(__name__)
+
+
+def settle_countdown(countdown: CountDown):
+    """
+        Mark the winning predictions of a finished countdown with one set-based update and store its summary.
+        The update only reads the predictions of the result's pair, through the countdown pair index.
+        The countdown is locked with a transaction scoped advisory lock and settling it again is a no-op.
+        Returns True when this call settled the countdown.
+    """
+    if countdown.get_buffered_predictions_count():
+        raise ValueError("Buffered predictions are not flushed yet.")
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute("SELECT pg_try_advisory_xact_lock(%s, %s)", [SETTLEMENT_LOCK_NAMESPACE, countdown.id])
+        if not cursor.fetchone()[0]:
+            return False
+        cursor.execute(
+            "SELECT has_end, expire_dt, pair_code, amount FROM countdown_result WHERE id = %s",
+            [countdown.id])
+        has_end, expire_dt, pair_code, countdown.amount = cursor.fetchone()
+        if has_end:
+            countdown.has_end = True
+            return False
+        now = timezone.now()
+        if expire_dt > now:
+            raise ValueError("Count down time is not finished yet.")
+        if pair_code is None:
+            raise ValueError("Dice numbers of the count down are not set yet.")
+        cursor.execute(
+            """
+            UPDATE prediction
+            SET is_win = TRUE, update_dt = %(now)s
+            WHERE countdown_id = %(countdown)s AND pair_code = %(pair_code)s AND is_active AND NOT is_win
+            RETURNING player_id
+            """,
+            {"now": now, "countdown": countdown.id, "pair_code": pair_code}
+        )
+        changes = {}
+        for player_id, in cursor.fetchall():
+            changes.setdefault(player_id, {"win_count": 0})["win_count"] += 1
+        PlayerStats.record(changes, countdown_id=countdown.id)
+        cursor.execute("UPDATE countdown_result SET has_end = TRUE, update_dt = %s WHERE id = %s",
+                       [now, countdown.id])
+        CountDownSummary.create_for(countdown)
+    countdown.has_end = True
+    return True
+
+
+def settle_finished_countdowns():
+    """
+        Settle every finished countdown whose dice numbers are set, returns the settled ones
+    """
+    countdowns = CountDown.objects.filter(has_end=False, expire_dt__lte=timezone.now(),
+                                          dice_number1__isnull=False, dice_number2__isnull=False).order_by("expire_dt")
+    settled = []
+    for countdown in countdowns:
+        try:
+            if settle_countdown(countdown):
+                settled.append(countdown)
+        except ValueError as e:
+            logger.warning("Count down %s is not settled: %s", countdown.id, e)
+    return settled
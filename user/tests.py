@@ -1,3 +1,450 @@
-from django.test import TestCase
+import datetime
 
-# Create your tests here.
+from django.contrib.admin import site
+from django.core.cache import cache
+from django.db import IntegrityError, transaction
+from django.test import RequestFactory, TestCase
+from django.utils import timezone
+from django_redis import get_redis_connection
+
+from user.admin import PlayerAdmin
+from user.cache import local_cache
+from user.ingestion import PredictionBuffer
+from user.leaderboard import Leaderboard
+from user.models import DICE_PAIRS, CountDown, CountDownSummary, LeaderboardSnapshot, LeaderboardWindowPoint, Player, \
+    PlayerStats, PlayerToken, Prediction, Slot, Wallet, PREDICTION_BOARD_CACHE_KEY, PREDICTION_BUFFER_KEY, \
+    PREDICTION_DEAD_LETTER_KEY, WINNERS_CACHE_KEY
+from user.settlement import settle_countdown
+
+
+class ActiveCountDownCacheTest(TestCase):
+    """
+        The active countdown is served from the process and redis caches until a countdown write drops them
+    """
+
+    def setUp(self):
+        cache.clear()
+        local_cache.clear()
+        self.countdown = CountDown.objects.create(expire_dt=timezone.now() + datetime.timedelta(hours=1))
+
+    def test_reads_are_cached(self):
+        self.assertEqual(CountDown.get_active_countdown().id, self.countdown.id)
+        with self.assertNumQueries(0):
+            self.assertEqual(CountDown.get_active_countdown().id, self.countdown.id)
+        local_cache.clear()
+        with self.assertNumQueries(0):
+            self.assertEqual(CountDown.get_active_countdown().id, self.countdown.id)
+
+    def test_save_drops_the_cached_countdown(self):
+        CountDown.get_active_countdown()
+        self.countdown.amount = 50
+        self.countdown.save()
+        self.assertEqual(CountDown.get_active_countdown().amount, 50)
+        sooner = CountDown.objects.create(expire_dt=timezone.now() + datetime.timedelta(minutes=5))
+        self.assertEqual(CountDown.get_active_countdown().id, sooner.id)
+
+    def test_delete_drops_the_cached_countdown(self):
+        CountDown.get_active_countdown()
+        self.countdown.delete()
+        self.assertIsNone(CountDown.get_active_countdown())
+
+
+class CountDownListCacheTest(TestCase):
+    """
+        Countdown list pages are cached under the list version, which every countdown write moves on
+    """
+
+    def setUp(self):
+        cache.clear()
+        local_cache.clear()
+        self.countdown = CountDown.objects.create(expire_dt=timezone.now() - datetime.timedelta(days=1))
+
+    def countdown_ids(self):
+        return [countdown["id"] for countdown in self.client.get("/api/count-downs/").json()["results"]]
+
+    def test_pages_are_cached_until_a_countdown_is_written(self):
+        self.assertEqual(self.countdown_ids(), [self.countdown.id])
+        with self.assertNumQueries(0):
+            self.assertEqual(self.countdown_ids(), [self.countdown.id])
+        newer = CountDown.objects.create(expire_dt=timezone.now() - datetime.timedelta(minutes=1))
+        self.assertEqual(self.countdown_ids(), [newer.id, self.countdown.id])
+        newer.delete()
+        self.assertEqual(self.countdown_ids(), [self.countdown.id])
+
+
+class PredictionBoardCacheTest(TestCase):
+    """
+        Every prediction or slot write drops the cached prediction board of the player
+    """
+
+    def setUp(self):
+        cache.clear()
+        local_cache.clear()
+        self.countdown = CountDown.objects.create(expire_dt=timezone.now() + datetime.timedelta(hours=1))
+        self.player = Player.objects.create(telegram_id=1, telegram_username="player")
+        self.cache_key = PREDICTION_BOARD_CACHE_KEY.format(player_id=1, countdown_id=self.countdown.id)
+
+    def assertDropped(self, write):
+        cache.set(self.cache_key, {"predictions": [], "slots": 1})
+        write()
+        self.assertIsNone(cache.get(self.cache_key))
+
+    def test_writes_drop_the_board(self):
+        self.assertDropped(lambda: Prediction.submit(self.player, self.countdown, 1, 2, slot=1))
+        self.assertDropped(lambda: Prediction.objects.create(player=self.player, countdown=self.countdown,
+                                                             dice_number1=3, dice_number2=4))
+        self.assertDropped(lambda: Slot.objects.create(player=self.player, countdown=self.countdown, bonus=1))
+        self.assertDropped(lambda: Prediction.submit_many(self.player, self.countdown, [
+            {"slot": 2, "dice_number1": 5, "dice_number2": 5}]))
+        self.assertEqual(Prediction.get_board(self.player, self.countdown), {
+            "predictions": [{"slot": 1, "dice_number1": 3, "dice_number2": 4},
+                            {"slot": 2, "dice_number1": 5, "dice_number2": 5}], "slots": 2})
+
+
+class PredictionHistoryTest(TestCase):
+    """
+        Prediction history pages neither skip nor repeat rows that share one insert time
+    """
+
+    def setUp(self):
+        cache.clear()
+        local_cache.clear()
+        self.token = Player.telegram_login({"id": 1, "username": "player"})
+        now = timezone.now()
+        predictions = []
+        for day in range(3):
+            countdown = CountDown.objects.create(expire_dt=now - datetime.timedelta(days=day + 1))
+            predictions += [Prediction(player_id=1, countdown=countdown, slot=slot,
+                                       dice_number1=DICE_PAIRS[(slot + day) % 21][0],
+                                       dice_number2=DICE_PAIRS[(slot + day) % 21][1]) for slot in range(1, 21)]
+        Prediction.objects.bulk_create(predictions)
+        Prediction.objects.update(insert_dt=now)
+
+    def test_pages_cover_every_row_once(self):
+        rows = []
+        url = "/api/predictions/"
+        while url:
+            page = self.client.get(url, HTTP_AUTHORIZATION=f"Token {self.token}").json()
+            rows += [(row["slot"], row["dice_number1"], row["dice_number2"]) for row in page["results"]]
+            url = page["next"]
+        self.assertEqual(len(rows), 60)
+        self.assertEqual(len(set(rows)), 60)
+
+
+class PlayerAdminTest(TestCase):
+    """
+        The player changelist reads the slot counts of a page with its own query
+    """
+
+    def setUp(self):
+        cache.clear()
+        local_cache.clear()
+        self.countdown = CountDown.objects.create(expire_dt=timezone.now() + datetime.timedelta(hours=1))
+        for telegram_id in (1, 2, 3):
+            Player.objects.create(telegram_id=telegram_id, telegram_username=f"player{telegram_id}")
+        Slot.objects.create(player_id=2, countdown=self.countdown, bonus=3)
+
+    def test_available_slots_are_annotated(self):
+        player_admin = PlayerAdmin(Player, site)
+        request = RequestFactory().get("/admin/user/player/")
+        CountDown.get_active_countdown()
+        with self.assertNumQueries(1):
+            slots = [player_admin.available_slots(player) for player in player_admin.get_queryset(request)]
+        self.assertEqual(slots, [1, 4, 1])
+
+
+class PredictionUpsertTest(TestCase):
+    """
+        Slot and pair rules of Prediction.upsert, enforced by the statement and the prediction constraints
+    """
+
+    def setUp(self):
+        cache.clear()
+        local_cache.clear()
+        self.countdown = CountDown.objects.create(expire_dt=timezone.now() + datetime.timedelta(hours=1))
+        self.player = Player.objects.create(telegram_id=1, telegram_username="player")
+
+    def test_slot_above_the_count_is_rejected(self):
+        row = (1, self.countdown.id, 2, 1, 2)
+        self.assertEqual(Prediction.upsert([row]), ([], [row]))
+        with self.assertRaisesMessage(ValueError, "You don't have slot number 2"):
+            Prediction.submit(self.player, self.countdown, 1, 2, slot=2)
+        self.assertFalse(Prediction.objects.exists())
+
+    def test_same_pair_in_either_order_is_rejected(self):
+        Slot.objects.create(player=self.player, countdown=self.countdown, bonus=1)
+        Prediction.submit(self.player, self.countdown, 1, 2, slot=1)
+        for dice_number1, dice_number2 in [(1, 2), (2, 1)]:
+            with self.assertRaisesMessage(ValueError, "You have predicted this dice before"):
+                Prediction.submit(self.player, self.countdown, dice_number1, dice_number2, slot=2)
+        self.assertEqual(list(Prediction.objects.values_list("slot", flat=True)), [1])
+
+    def test_resubmit_updates_the_slot_in_place(self):
+        first = Prediction.submit(self.player, self.countdown, 1, 2, slot=1)
+        second = Prediction.submit(self.player, self.countdown, 3, 4, slot=1)
+        self.assertEqual(first.id, second.id)
+        self.assertEqual(list(Prediction.objects.values_list("id", "dice_number1", "dice_number2", "is_active")),
+                         [(first.id, 3, 4, True)])
+        self.assertEqual(PlayerStats.objects.get(player=self.player).prediction_count, 1)
+
+    def test_save_and_submit_count_the_same_way(self):
+        Prediction.submit(self.player, self.countdown, 1, 2, slot=1)
+        Prediction.objects.create(player=self.player, countdown=self.countdown, dice_number1=3, dice_number2=4)
+        Slot.objects.create(player=self.player, countdown=self.countdown, bonus=1)
+        Prediction.objects.create(player=self.player, countdown=self.countdown, dice_number1=5, dice_number2=6, slot=2)
+        Prediction.submit(self.player, self.countdown, 1, 1, slot=2)
+        self.assertEqual(PlayerStats.objects.get(player=self.player).prediction_count, 2)
+        self.assertEqual(dict(Prediction.objects.filter(is_active=True).values_list("slot", "dice_number1")),
+                         {1: 3, 2: 1})
+
+    def test_slot_range_is_checked(self):
+        for slot in (0, 22):
+            with self.assertRaises(IntegrityError), transaction.atomic():
+                Prediction.objects.bulk_create([Prediction(player=self.player, countdown=self.countdown,
+                                                           dice_number1=1, dice_number2=2, slot=slot)])
+        self.assertFalse(Prediction.objects.exists())
+
+
+class PredictionBatchTest(TestCase):
+    """
+        Prediction.submit_many validates the final board of the batch as a whole
+    """
+
+    def setUp(self):
+        cache.clear()
+        local_cache.clear()
+        self.countdown = CountDown.objects.create(expire_dt=timezone.now() + datetime.timedelta(hours=1))
+        self.player = Player.objects.create(telegram_id=1, telegram_username="player")
+        Slot.objects.create(player=self.player, countdown=self.countdown, bonus=2)
+
+    def board(self):
+        return {slot: (dice_number1, dice_number2) for slot, dice_number1, dice_number2 in
+                self.player.predictions.filter(is_active=True).values_list("slot", "dice_number1", "dice_number2")}
+
+    def test_pairs_can_swap_slots(self):
+        Prediction.submit(self.player, self.countdown, 1, 2, slot=1)
+        Prediction.submit(self.player, self.countdown, 3, 4, slot=2)
+        errors = Prediction.submit_many(self.player, self.countdown, [
+            {"slot": 1, "dice_number1": 3, "dice_number2": 4}, {"slot": 2, "dice_number1": 2, "dice_number2": 1}])
+        self.assertEqual(errors, {1: None, 2: None})
+        self.assertEqual(self.board(), {1: (3, 4), 2: (2, 1)})
+        self.assertEqual(PlayerStats.objects.get(player=self.player).prediction_count, 2)
+
+    def test_duplicated_pairs_are_rejected(self):
+        Prediction.submit(self.player, self.countdown, 1, 2, slot=1)
+        errors = Prediction.submit_many(self.player, self.countdown, [
+            {"slot": 2, "dice_number1": 2, "dice_number2": 1}, {"slot": 3, "dice_number1": 5, "dice_number2": 5},
+            {"slot": 4, "dice_number1": 6, "dice_number2": 6}])
+        self.assertEqual(errors, {2: "You have predicted this dice before", 3: None,
+                                  4: "You don't have slot number 4"})
+        self.assertEqual(self.board(), {1: (1, 2), 3: (5, 5)})
+
+
+class PredictionBufferTest(TestCase):
+    """
+        Buffered picks the prediction table rejects are kept in the dead letter stream
+    """
+
+    def setUp(self):
+        cache.clear()
+        local_cache.clear()
+        self.countdown = CountDown.objects.create(expire_dt=timezone.now() + datetime.timedelta(hours=1))
+        self.player = Player.objects.create(telegram_id=1, telegram_username="player")
+        self.redis = get_redis_connection("default")
+
+    def buffer(self, slot, dice_number1, dice_number2):
+        self.redis.xadd(PREDICTION_BUFFER_KEY.format(countdown_id=self.countdown.id),
+                        {"player": 1, "slot": slot, "dice_number1": dice_number1, "dice_number2": dice_number2})
+
+    def test_rejected_picks_are_dead_lettered(self):
+        Prediction.submit(self.player, self.countdown, 1, 2, slot=1)
+        Slot.objects.create(player=self.player, countdown=self.countdown, bonus=1)
+        self.buffer(2, 2, 1)
+        self.buffer(3, 4, 4)
+        self.assertEqual(PredictionBuffer.flush(self.countdown.id), 2)
+        dead = [{field.decode(): value.decode() for field, value in fields.items()} for _, fields in
+                self.redis.xrange(PREDICTION_DEAD_LETTER_KEY.format(countdown_id=self.countdown.id))]
+        self.assertEqual({(entry["slot"], entry["reason"]) for entry in dead},
+                         {("2", "duplicate pair"), ("3", "slot not available")})
+        self.assertEqual(self.redis.xlen(PREDICTION_BUFFER_KEY.format(countdown_id=self.countdown.id)), 0)
+        self.assertEqual(list(Prediction.objects.values_list("slot", flat=True)), [1])
+
+
+    def test_pairs_swapping_slots_are_stored(self):
+        Slot.objects.create(player=self.player, countdown=self.countdown, bonus=1)
+        Prediction.submit(self.player, self.countdown, 1, 2, slot=1)
+        Prediction.submit(self.player, self.countdown, 3, 4, slot=2)
+        self.buffer(1, 3, 4)
+        self.buffer(2, 2, 1)
+        self.assertEqual(PredictionBuffer.flush(self.countdown.id), 2)
+        self.assertEqual(self.redis.xlen(PREDICTION_DEAD_LETTER_KEY.format(countdown_id=self.countdown.id)), 0)
+        self.assertEqual(dict(Prediction.objects.filter(is_active=True).values_list("slot", "dice_number1")),
+                         {1: 3, 2: 2})
+        self.assertEqual(PlayerStats.objects.get(player=self.player).prediction_count, 2)
+
+class SettlementTest(TestCase):
+    """
+        settle_countdown marks the winners of a finished countdown once and refuses unfinished ones
+    """
+
+    def setUp(self):
+        cache.clear()
+        local_cache.clear()
+        self.countdown = CountDown.objects.create(expire_dt=timezone.now() - datetime.timedelta(minutes=1),
+                                                  dice_number1=3, dice_number2=5, amount=100)
+        self.winner = Player.objects.create(telegram_id=1, telegram_username="winner")
+        self.loser = Player.objects.create(telegram_id=2, telegram_username="loser")
+        self.win = Prediction.objects.create(player=self.winner, countdown=self.countdown, dice_number1=5,
+                                             dice_number2=3)
+        self.loss = Prediction.objects.create(player=self.loser, countdown=self.countdown, dice_number1=1,
+                                              dice_number2=1)
+
+    def test_winners_are_marked(self):
+        self.assertTrue(settle_countdown(self.countdown))
+        self.assertEqual(dict(Prediction.objects.values_list("id", "is_win")), {self.win.id: True, self.loss.id: False})
+        self.assertEqual(dict(PlayerStats.objects.values_list("player_id", "win_count")), {1: 1, 2: 0})
+        summary = CountDownSummary.objects.get(countdown=self.countdown)
+        self.assertEqual((summary.winner_count, summary.winner_amount, summary.participant_count), (1, 100, 2))
+        self.assertTrue(CountDown.objects.get(id=self.countdown.id).has_end)
+
+    def test_second_run_is_a_noop(self):
+        self.assertTrue(settle_countdown(self.countdown))
+        Prediction.objects.filter(id=self.loss.id).update(is_win=True)
+        self.assertFalse(settle_countdown(CountDown.objects.get(id=self.countdown.id)))
+        self.assertTrue(Prediction.objects.get(id=self.loss.id).is_win)
+        self.assertEqual(PlayerStats.objects.get(player=self.winner).win_count, 1)
+
+    def test_amount_edited_after_settlement(self):
+        settle_countdown(self.countdown)
+        cache_key = WINNERS_CACHE_KEY.format(countdown_id=self.countdown.id, distinct_players=1)
+        cache.set(cache_key, (b"[]", '"etag"'), timeout=None)
+        countdown = CountDown.objects.get(id=self.countdown.id)
+        countdown.amount = 250
+        countdown.save()
+        self.assertEqual(CountDownSummary.objects.get(countdown=countdown).winner_amount, 250)
+        self.assertIsNone(cache.get(cache_key))
+
+    def test_unfinished_countdown_is_refused(self):
+        CountDown.objects.filter(id=self.countdown.id).update(expire_dt=timezone.now() + datetime.timedelta(hours=1))
+        with self.assertRaisesMessage(ValueError, "Count down time is not finished yet."):
+            settle_countdown(self.countdown)
+        self.assertNotSettled()
+
+    def test_countdown_without_dice_is_refused(self):
+        CountDown.objects.filter(id=self.countdown.id).update(dice_number2=None)
+        with self.assertRaisesMessage(ValueError, "Dice numbers of the count down are not set yet."):
+            settle_countdown(self.countdown)
+        self.assertNotSettled()
+
+    def test_countdown_with_buffered_predictions_is_refused(self):
+        get_redis_connection("default").xadd(PREDICTION_BUFFER_KEY.format(countdown_id=self.countdown.id),
+                                             {"player": 1, "slot": 1, "dice_number1": 2, "dice_number2": 2})
+        with self.assertRaisesMessage(ValueError, "Buffered predictions are not flushed yet."):
+            settle_countdown(self.countdown)
+        self.assertNotSettled()
+
+    def assertNotSettled(self):
+        self.assertFalse(CountDown.objects.get(id=self.countdown.id).has_end)
+        self.assertFalse(CountDownSummary.objects.exists())
+        self.assertEqual(dict(Prediction.objects.values_list("id", "is_win")),
+                         {self.win.id: False, self.loss.id: False})
+
+
+class TokenCacheTest(TestCase):
+    """
+        Tokens and their players resolve from the tiered cache until a revoke or a player write drops them
+    """
+
+    def setUp(self):
+        cache.clear()
+        local_cache.clear()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.token = Player.telegram_login({"id": 1, "username": "player"})
+
+    def test_lookups_are_cached(self):
+        self.assertEqual(Player.from_token(self.token).telegram_id, 1)
+        with self.assertNumQueries(0):
+            self.assertEqual(Player.from_token(self.token).telegram_id, 1)
+
+    def test_player_save_and_revoke_drop_the_cache(self):
+        Player.from_token(self.token)
+        player = Player.objects.get(telegram_id=1)
+        player.first_name = "renamed"
+        with self.captureOnCommitCallbacks(execute=True):
+            player.save()
+        self.assertEqual(Player.from_token(self.token).first_name, "renamed")
+        with self.captureOnCommitCallbacks(execute=True):
+            PlayerToken.revoke(self.token)
+        self.assertIsNone(Player.from_token(self.token))
+
+
+class ConnectWalletTest(TestCase):
+    """
+        Connecting a wallet from a cached player only writes the wallet columns
+    """
+
+    def setUp(self):
+        cache.clear()
+        local_cache.clear()
+        Player.objects.create(telegram_id=1, telegram_username="player")
+
+    def test_other_columns_are_kept(self):
+        player = Player.cached(1)
+        Player.objects.filter(telegram_id=1).update(telegram_username="renamed")
+        player.connect_wallet("0:" + "AB" * 32)
+        player = Player.objects.get(telegram_id=1)
+        self.assertEqual((player.telegram_username, player.wallet_address), ("renamed", "0:" + "AB" * 32))
+        self.assertEqual(list(Wallet.objects.values_list("address", "player_ids")), [("0:" + "ab" * 32, [1])])
+
+
+class LeaderboardTest(TestCase):
+    """
+        Ranks read from the sorted set follow the points, players with equal points keep one order
+    """
+
+    def setUp(self):
+        cache.clear()
+        with self.captureOnCommitCallbacks(execute=True):
+            Leaderboard.set_points({1: 10, 2: 30, 3: 20, 4: 20, 5: 5})
+
+    def test_top_is_ordered_by_point(self):
+        self.assertEqual(Leaderboard.top(3), [(2, 30), (4, 20), (3, 20)])
+
+    def test_around_matches_the_top_order(self):
+        top = Leaderboard.top()
+        for player_id, point in top:
+            rank, player_point, entries = Leaderboard.around(player_id, 1)
+            self.assertEqual(top[rank - 1], (player_id, point))
+            self.assertEqual(player_point, point)
+            self.assertEqual(entries, top[max(rank - 2, 0):rank + 1])
+        self.assertEqual(Leaderboard.around(3, 1), (3, 20, [(4, 20), (3, 20), (1, 10)]))
+
+    def test_missing_player_has_no_rank(self):
+        self.assertIsNone(Leaderboard.around(6, 1))
+
+    def test_rebuild_replaces_the_set(self):
+        self.assertFalse(Leaderboard.is_built())
+        Leaderboard.rebuild([(1, 7), (6, 7)])
+        self.assertTrue(Leaderboard.is_built())
+        self.assertEqual(Leaderboard.top(), [(6, 7), (1, 7)])
+
+
+class LeaderboardSnapshotTest(TestCase):
+    """
+        Freezing a window twice merges the late rows into its snapshot
+    """
+
+    def setUp(self):
+        for telegram_id in (1, 2, 3):
+            Player.objects.create(telegram_id=telegram_id, telegram_username=f"player{telegram_id}")
+
+    def test_late_rows_are_merged(self):
+        LeaderboardWindowPoint.objects.create(bucket="day:2026-10-17", player_id=1, point=10)
+        LeaderboardWindowPoint.objects.create(bucket="day:2026-10-17", player_id=2, point=7)
+        LeaderboardSnapshot.freeze("day:2026-10-17")
+        LeaderboardWindowPoint.objects.create(bucket="day:2026-10-17", player_id=2, point=5)
+        LeaderboardWindowPoint.objects.create(bucket="day:2026-10-17", player_id=3, point=1)
+        snapshot = LeaderboardSnapshot.freeze("day:2026-10-17", size=2)
+        self.assertEqual(snapshot.entries, [[2, 12], [1, 10]])
+        self.assertEqual(snapshot.player_count, 3)
+        self.assertFalse(LeaderboardWindowPoint.objects.exists())
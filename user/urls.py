@@ -3,6 +3,7 @@ from .views import *
 
 urlpatterns = [
     path('predict/', PredictDiceAPI.as_view(), name='predict'),
+    path('predict/batch/', PredictDiceBatchAPI.as_view(), name='predict-batch'),
     path('predictions/', PredictionsAPI.as_view(), name='predictions'),
     path('count-down/', CountDownResultAPI.as_view(), name='countDown'),
     path('count-downs/', CountdownsAPI.as_view(), name='count-downs'),
@@ -15,4 +16,5 @@ urlpatterns = [
     path('referrals/', ReferralsAPI.as_view(), name='referrals'),
     path('missions/', MissionsCheckboxAPI.as_view(), name='missions'),
     path('leaderboard/', LeaderboardAPI.as_view(), name='leaderboard'),
+    path('leaderboard/me/', PlayerRankAPI.as_view(), name='leaderboard-me'),
 ]
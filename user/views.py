@@ -1,12 +1,30 @@
+import hashlib
+import re
+
+from adrf.views import APIView as AsyncAPIView
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse, HttpResponseNotModified
 from django.utils import timezone
+from django.utils.http import parse_etags
 from drf_yasg import openapi
 from drf_yasg.utils import swagger_auto_schema
 from rest_framework import status
 from rest_framework.permissions import AllowAny
+from rest_framework.renderers import JSONRenderer
 from rest_framework.response import Response
 from rest_framework.views import APIView
 
+from user.cache import seconds_until
+from user.ingestion import PredictionBuffer
+from user.leaderboard import Leaderboard
+from user.models import PREDICTION_BOARD_CACHE_KEY, COUNTDOWN_LIST_VERSION_KEY, WINNERS_CACHE_KEY, Slot, Wallet
+from user.pagination import CountdownCursorPagination, PredictionCursorPagination
 from user.serializers import *
+from user.settlement import settle_countdown
+
+COUNTDOWNS_CACHE_KEY = 'countdowns:{version}:{cursor}'
 
 
 class PredictDiceAPI(APIView):
@@ -27,7 +45,7 @@ class PredictDiceAPI(APIView):
     )
     def post(self, request):
         countdown = CountDown.get_active_countdown()
-        if countdown.is_finished:
+        if countdown is None or countdown.is_finished:
             return Response({"error": "Countdown is finished. wait for new event."}, status=status.HTTP_200_OK)
         player = request.user
         if not player or not isinstance(player, Player):
@@ -36,13 +54,14 @@ class PredictDiceAPI(APIView):
             return Response({"error": "Wallet is not connected yet."}, status=status.HTTP_200_OK)
         predicted_dices = PredictDiceSerializer(data=request.data)
         predicted_dices.is_valid(raise_exception=True)
-        predicted_dices.validated_data["player"] = player
+        data = predicted_dices.validated_data
+        submit = PredictionBuffer.submit if settings.PREDICTION_INGESTION_MODE == "buffered" else Prediction.submit
         try:
-            predicted_dices.is_valid_predict(player=player, countdown=countdown)
-        except Exception as e:
+            prediction = submit(player=player, countdown=countdown, dice_number1=data["dice_number1"],
+                                dice_number2=data["dice_number2"], slot=data.get("slot", 1))
+        except ValueError as e:
             return Response({"error": str(e)}, status=status.HTTP_200_OK)
-        predicted_dices.save()
-        return Response(predicted_dices.data, status=status.HTTP_200_OK)
+        return Response(PredictDiceSerializer(prediction).data, status=status.HTTP_200_OK)
 
     @swagger_auto_schema(
         operation_summary="Predict dice",
@@ -71,23 +90,46 @@ class PredictDiceAPI(APIView):
     )
     def get(self, request):
         count_down: "CountDown" = CountDown.get_active_countdown()
-        if count_down.is_finished:
+        if count_down is None or count_down.is_finished:
             return Response({"predictions": [], "slots": 1},
                             status=status.HTTP_200_OK)
         player = request.user
         if not player or not isinstance(player, Player):
             return Response({"error": "Authentication error."}, status=status.HTTP_401_UNAUTHORIZED)
-        _predictions = player.predictions.filter(is_active=True, countdown=count_down).order_by("slot")
-        slots = player.available_slots.number
-        predictions = list(_predictions)
-        for i in range(1, slots + 1):
-            if not _predictions.filter(slot=i).exists():
-                predictions.append({"slot": i, "dice_number1": None, "dice_number2": None})
-        serializer = PredictBoxSerializer({"predictions": predictions, "slots": slots})
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        cache_key = PREDICTION_BOARD_CACHE_KEY.format(player_id=player.telegram_id, countdown_id=count_down.id)
+        board = cache.get(cache_key)
+        if board is None:
+            board = PredictBoxSerializer(Prediction.get_board(player, count_down)).data
+            timeout = min(seconds_until(count_down.expire_dt), settings.PREDICTION_BOARD_CACHE_TIMEOUT)
+            cache.set(cache_key, board, timeout=timeout)
+        return Response(board, status=status.HTTP_200_OK)
+
+
+class PredictDiceBatchAPI(APIView):
+    @swagger_auto_schema(
+        operation_summary="Predict dice for many slots",
+        operation_description="Saves the predictions of several slots at once and reports the result of each slot.",
+        request_body=PredictBatchSerializer,
+        responses={200: PredictBatchResultSerializer(many=True)},
+        tags=["Predict"]
+    )
+    def post(self, request):
+        countdown = CountDown.get_active_countdown()
+        if countdown is None or countdown.is_finished:
+            return Response({"error": "Countdown is finished. wait for new event."}, status=status.HTTP_200_OK)
+        player = request.user
+        if not player or not isinstance(player, Player):
+            return Response({"error": "Authentication error."}, status=status.HTTP_401_UNAUTHORIZED)
+        if not player.wallet_address:
+            return Response({"error": "Wallet is not connected yet."}, status=status.HTTP_200_OK)
+        serializer = PredictBatchSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        errors = Prediction.submit_many(player, countdown, serializer.validated_data["predictions"])
+        results = [{"slot": slot, "success": error is None, "error": error} for slot, error in errors.items()]
+        return Response(PredictBatchResultSerializer(results, many=True).data, status=status.HTTP_200_OK)
 
 
-class CountDownResultAPI(APIView):
+class CountDownResultAPI(AsyncAPIView):
     authentication_classes = []
     permission_classes = [AllowAny]
 
@@ -105,15 +147,8 @@ class CountDownResultAPI(APIView):
         )},
         tags=["Count down"]
     )
-    def get(self, request):
-        prev_count_down: "CountDown" = CountDown.get_last_countdown()
-        if prev_count_down:
-            try:
-                prev_count_down.end_countdown()
-                prev_count_down.save()
-            except Exception:
-                pass
-        count_down: "CountDown" = CountDown.get_active_countdown()
+    async def get(self, request):
+        count_down: "CountDown" = await CountDown.aget_active_countdown()
         if count_down:
             serializer = CountDownTimeSerializer(count_down)
             return Response(serializer.data, status=status.HTTP_200_OK)
@@ -141,8 +176,8 @@ class EndCountDownResultAPI(APIView):
         count_down: "CountDown" = CountDown.get_last_countdown()
         if count_down:
             try:
-                count_down.end_countdown()
-            except Exception as e:
+                settle_countdown(count_down)
+            except ValueError as e:
                 return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
             serializer = CountDownSerializer(count_down)
             return Response(serializer.data, status=status.HTTP_200_OK)
@@ -150,7 +185,38 @@ class EndCountDownResultAPI(APIView):
             return Response({"error": "Active count down is not found"}, status=status.HTTP_404_NOT_FOUND)
 
 
-class LastWinnersAPI(APIView):
+async def winners_response(request, countdown: CountDown, distinct_players, cache_control):
+    """
+        Winners of a countdown rendered once after settlement and served with a strong ETag.
+        Editing a settled countdown drops the rendered body,
+        clients revalidate with the ETag once cache_control expires.
+        Responses of countdowns that are not settled yet are rendered on every request and never cached.
+    """
+    cache_key = WINNERS_CACHE_KEY.format(countdown_id=countdown.id, distinct_players=int(distinct_players))
+    cached = await cache.aget(cache_key) if countdown.has_end else None
+    if cached is None:
+        predictions = countdown.predictions.filter(is_win=True).select_related("player", "countdown__summary")
+        if distinct_players:
+            predictions = predictions.distinct("player")
+        predictions = [prediction async for prediction in predictions]
+        body = JSONRenderer().render(PredictDiceSerializer(predictions, many=True).data)
+        cached = (body, f'"{hashlib.sha256(body).hexdigest()}"')
+        if countdown.has_end:
+            await cache.aset(cache_key, cached, timeout=None)
+        else:
+            cache_control = "no-cache"
+    body, etag = cached
+    if_none_match = request.headers.get("If-None-Match")
+    if if_none_match and (if_none_match.strip() == "*" or etag in parse_etags(if_none_match)):
+        response = HttpResponseNotModified()
+    else:
+        response = HttpResponse(body, content_type="application/json")
+    response["ETag"] = etag
+    response["Cache-Control"] = cache_control
+    return response
+
+
+class LastWinnersAPI(AsyncAPIView):
     authentication_classes = []
     permission_classes = [AllowAny]
 
@@ -172,14 +238,15 @@ class LastWinnersAPI(APIView):
         )},
         tags=["Count down"]
     )
-    def get(self, request):
-        countdown: "CountDown" = CountDown.get_last_countdown()
-        predictions = countdown.predictions.filter(is_win=True).distinct("player")
-        serializer = PredictDiceSerializer(predictions, many=True)
-        return Response(serializer.data, status=status.HTTP_200_OK)
+    async def get(self, request):
+        countdown: "CountDown" = await CountDown.aget_last_countdown()
+        if countdown is None:
+            return Response([], status=status.HTTP_200_OK)
+        return await winners_response(request, countdown, distinct_players=True,
+                                      cache_control=f"public, max-age={settings.LAST_WINNERS_MAX_AGE}")
 
 
-class WinnersAPI(APIView):
+class WinnersAPI(AsyncAPIView):
     authentication_classes = []
     permission_classes = [AllowAny]
 
@@ -205,16 +272,15 @@ class WinnersAPI(APIView):
         )},
         tags=["Count down"]
     )
-    def get(self, request):
+    async def get(self, request):
         countdown_id = request.query_params.get('id')
-        if not CountDown.objects.filter(id=countdown_id).exists():
+        countdown: "CountDown" = await CountDown.objects.filter(id=countdown_id).afirst()
+        if countdown is None:
             return Response({"error": "Count down not found."}, status=status.HTTP_404_NOT_FOUND)
-        countdown: "CountDown" = CountDown.objects.get(pk=countdown_id)
         if not countdown.is_finished:
             return Response({"error": "Countdown is not finished yet."}, status=status.HTTP_400_BAD_REQUEST)
-        predictions = countdown.predictions.filter(is_win=True)
-        serializer = PredictDiceSerializer(predictions, many=True)
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        return await winners_response(request, countdown, distinct_players=False,
+                                      cache_control=f"public, max-age={settings.WINNERS_MAX_AGE}")
 
 
 class CountdownsAPI(APIView):
@@ -223,12 +289,14 @@ class CountdownsAPI(APIView):
 
     @swagger_auto_schema(
         operation_summary="Countdowns",
-        operation_description="Get all count downs.",
+        operation_description="Get finished count downs, newest first, paginated with the cursor of the next link.",
         responses={200: openapi.Response(
             description="Count down",
             examples={
                 "application/json": {
-                    "predictions": [{
+                    "next": "https://example.com/api/count-downs/?cursor=cD0yMDI1LTAxLTIx",
+                    "previous": None,
+                    "results": [{
                         "id": 4,
                         "expire_dt": "2025-01-21 15:44:42.210841+03:30"
                     }, ]
@@ -238,9 +306,24 @@ class CountdownsAPI(APIView):
         tags=["Count down"]
     )
     def get(self, request):
-        countdowns = CountDown.objects.filter(expire_dt__lt=timezone.now()).order_by("-expire_dt")
-        serializer = CountdownListSerializer(countdowns, many=True)
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        paginator = CountdownCursorPagination()
+        cursor = paginator.decode_cursor(request)
+        cache_key = COUNTDOWNS_CACHE_KEY.format(version=cache.get(COUNTDOWN_LIST_VERSION_KEY, 0),
+                                                cursor=request.query_params.get(paginator.cursor_query_param, ""))
+        data = cache.get(cache_key)
+        if data is None:
+            countdowns = CountDown.objects.filter(expire_dt__lt=timezone.now())
+            page = paginator.paginate_queryset(countdowns, request, view=self)
+            data = paginator.get_paginated_response(CountdownListSerializer(page, many=True).data).data
+            if cursor is not None and not cursor.reverse:
+                # Countdowns only join the list at its head, pages after a forward cursor never change.
+                cache.set(cache_key, data, timeout=settings.COUNTDOWN_LIST_CACHE_TIMEOUT)
+            else:
+                active_countdown = CountDown.get_active_countdown()
+                timeout = seconds_until(active_countdown.expire_dt) if active_countdown else 60
+                timeout = min(timeout, settings.COUNTDOWN_LIST_CACHE_TIMEOUT)
+                cache.set(cache_key, data, timeout=timeout)
+        return Response(data, status=status.HTTP_200_OK)
 
 
 class ConnectWalletAPI(APIView):
@@ -257,21 +340,16 @@ class ConnectWalletAPI(APIView):
             address = serializer.validated_data["wallet_address"]
         except Exception as e:
             return Response({"error": "Invalid data input"}, status=status.HTTP_400_BAD_REQUEST)
-        is_first_time = False
-        if Player.objects.filter(wallet_address=address).exists():
-            is_first_time = True
+        is_first_time = Wallet.objects.filter(address=Wallet.normalize(address)).exists()
         player = request.user
         if not player or not isinstance(player, Player):
             return Response({"error": "Authentication error."}, status=status.HTTP_401_UNAUTHORIZED)
-        player.wallet_address = address
-        if not player.wallet_insert_dt:
-            player.wallet_insert_dt = timezone.now()
-        player.save()
+        player.connect_wallet(address)
         return Response({"wallet_address": player.wallet_address, "is_first_time": is_first_time},
                         status=status.HTTP_200_OK)
 
 
-class PlayerInfoAPI(APIView):
+class PlayerInfoAPI(AsyncAPIView):
     @swagger_auto_schema(
         operation_summary="Players base information",
         operation_description="Get player info",
@@ -288,10 +366,12 @@ class PlayerInfoAPI(APIView):
         )},
         tags=["Player"]
     )
-    def get(self, request):
+    async def get(self, request):
         player = request.user
         if not player or not isinstance(player, Player):
             return Response({"error": "Authentication error."}, status=status.HTTP_401_UNAUTHORIZED)
+        player.point = await PlayerStats.objects.filter(player_id=player.telegram_id).values_list(
+            "point", flat=True).afirst()
         serializer = PlayerSerializer(player)
         return Response(serializer.data, status=status.HTTP_200_OK)
 
@@ -342,7 +422,7 @@ class ReferralsAPI(APIView):
         return Response(serializer.data, status=status.HTTP_200_OK)
 
 
-class MissionsCheckboxAPI(APIView):
+class MissionsCheckboxAPI(AsyncAPIView):
     @swagger_auto_schema(
         operation_summary="Players referrals",
         operation_description="Get player referrals",
@@ -356,18 +436,29 @@ class MissionsCheckboxAPI(APIView):
         )},
         tags=["Player"]
     )
-    def get(self, request):
+    async def get(self, request):
         player = request.user
         if not player or not isinstance(player, Player):
             return Response({"error": "Authentication error."}, status=status.HTTP_401_UNAUTHORIZED)
-        serializer = MissionCheckboxSerializer(player)
+        countdown = await CountDown.aget_active_countdown()
+        slots = await sync_to_async(Slot.count)(player.telegram_id, countdown)
+        has_submit = await player.predictions.filter(countdown=countdown, is_active=True).aexists()
+        serializer = MissionCheckboxSerializer({"has_invite": slots > 1, "has_submit": has_submit})
         return Response(serializer.data, status=status.HTTP_200_OK)
 
 
 class PredictionsAPI(APIView):
+    status_filters = {
+        "active": {"is_active": True},
+        "win": {"is_active": True, "is_win": True},
+    }
+
     @swagger_auto_schema(
         operation_summary="Prediction history",
-        operation_description="Gets all predictions of a player .",
+        operation_description="Gets the predictions of a player, newest first, paginated with the cursor of the next "
+                              "link. Use status=active for the current predictions or status=win for the won ones.",
+        manual_parameters=[openapi.Parameter("status", openapi.IN_QUERY, type=openapi.TYPE_STRING,
+                                             enum=["active", "win"], required=False)],
         responses={status.HTTP_200_OK: PredictionHistoryRowSerializer(many=True)},
         tags=["Predict"]
     )
@@ -375,19 +466,80 @@ class PredictionsAPI(APIView):
         player = request.user
         if not player or not isinstance(player, Player):
             return Response({"error": "Authentication error."}, status=status.HTTP_401_UNAUTHORIZED)
-        predictions = player.predictions.order_by("-insert_dt")
-        serializer = PredictionHistoryRowSerializer(predictions, many=True)
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        predictions = player.predictions.only(*PredictionHistoryRowSerializer.Meta.fields)
+        status_filter = request.query_params.get("status")
+        if status_filter:
+            if status_filter not in self.status_filters:
+                return Response({"error": f"Invalid status {status_filter}."}, status=status.HTTP_400_BAD_REQUEST)
+            predictions = predictions.filter(**self.status_filters[status_filter])
+        paginator = PredictionCursorPagination()
+        page = paginator.paginate_queryset(predictions, request, view=self)
+        serializer = PredictionHistoryRowSerializer(page, many=True)
+        return paginator.get_paginated_response(serializer.data)
 
 
-class LeaderboardAPI(APIView):
+class LeaderboardAPI(AsyncAPIView):
+    bucket_pattern = re.compile(r"day:\d{4}-\d{2}-\d{2}|week:\d{4}-W\d{2}|countdown:\d+")
+
     @swagger_auto_schema(
-        operation_summary="Prediction history",
-        operation_description="Gets all predictions of a player .",
+        operation_summary="Leaderboard",
+        operation_description="Gets the top 100 players. Without window the all time points are used, window=day, "
+                              "week or countdown uses the points earned today, this week or in the active count down "
+                              "and a past window is selected like day:2025-01-21, week:2025-W04 or countdown:12.",
+        manual_parameters=[openapi.Parameter("window", openapi.IN_QUERY, type=openapi.TYPE_STRING, required=False)],
         responses={status.HTTP_200_OK: LeaderboardSerializer()},
         tags=["Leaderboard"]
     )
-    def get(self, request):
-        serializer = LeaderboardSerializer(data={})
+    async def get(self, request):
+        window = request.query_params.get("window")
+        bucket = None
+        if window == "day":
+            bucket = Leaderboard.day_bucket(timezone.localdate())
+        elif window == "week":
+            bucket = Leaderboard.week_bucket(timezone.localdate())
+        elif window == "countdown":
+            countdown = await CountDown.aget_active_countdown()
+            if countdown is None:
+                return Response({"error": "There is no active count down."}, status=status.HTTP_404_NOT_FOUND)
+            bucket = Leaderboard.countdown_bucket(countdown.id)
+        elif window is not None:
+            if not self.bucket_pattern.fullmatch(window):
+                return Response({"error": f"Invalid window {window}."}, status=status.HTTP_400_BAD_REQUEST)
+            bucket = window
+        serializer = LeaderboardSerializer(data={}, context={"bucket": bucket})
         serializer.is_valid(raise_exception=True)
+        # The players are read from the redis leaderboard, whose client is sync
+        data = await sync_to_async(lambda: serializer.data)()
+        return Response(data, status=status.HTTP_200_OK)
+
+
+class PlayerRankAPI(APIView):
+    @swagger_auto_schema(
+        operation_summary="Player rank",
+        operation_description="Gets the rank and point of the player with the count players above and below "
+                              "them on the leaderboard, count defaults to 5 and is at most 50.",
+        manual_parameters=[openapi.Parameter("count", openapi.IN_QUERY, type=openapi.TYPE_INTEGER, required=False)],
+        responses={status.HTTP_200_OK: PlayerRankSerializer()},
+        tags=["Leaderboard"]
+    )
+    def get(self, request):
+        player = request.user
+        if not player or not isinstance(player, Player):
+            return Response({"error": "Authentication error."}, status=status.HTTP_401_UNAUTHORIZED)
+        try:
+            count = int(request.query_params.get("count", 5))
+        except ValueError:
+            return Response({"error": "Invalid count."}, status=status.HTTP_400_BAD_REQUEST)
+        if not 0 <= count <= 50:
+            return Response({"error": "Count must be between 0 and 50."}, status=status.HTTP_400_BAD_REQUEST)
+        if not Leaderboard.is_built():
+            return Response({"error": "Leaderboard is being rebuilt, please try again later."},
+                            status=status.HTTP_503_SERVICE_UNAVAILABLE)
+        around = Leaderboard.around(player.telegram_id, count)
+        if around is None:
+            return Response({"error": "You are not on the leaderboard yet."}, status=status.HTTP_404_NOT_FOUND)
+        rank, point, entries = around
+        first_rank = max(rank - count, 1)
+        serializer = PlayerRankSerializer({"rank": rank, "point": point,
+                                           "players": leaderboard_players(entries, first_rank)})
         return Response(serializer.data, status=status.HTTP_200_OK)
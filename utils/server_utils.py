@@ -1,15 +1,17 @@
 import datetime
+import secrets
+import string
 
-from autoutils.script import id_generator
 from constance import config
 from django.utils import timezone
 
 
 def token_generator():
     """
-        Generate a token by configurable size
+        Generate a random token by configurable size
     """
-    return id_generator(size=config.USER_TOKEN_SIZE)
+    chars = string.ascii_letters + string.digits
+    return ''.join(secrets.choice(chars) for _ in range(config.USER_TOKEN_SIZE))
 
 
 def token_expire_dt_generator():
@@ -17,7 +19,3 @@ def token_expire_dt_generator():
         Generate expire datetime for token
     """
     return timezone.now() + datetime.timedelta(days=config.USER_TOKEN_EXPIRE_DAY)
-
-
-def calculate_player_point(wallet, win, prediction, referral_count, mini_app):
-    return 5 + 10 * mini_app + 500 * wallet + 50 * win + prediction + 5 * referral_count